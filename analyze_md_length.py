@@ -1,8 +1,22 @@
+import argparse
 import json
 from collections import Counter
 
-with open('markdown_data.json', 'r', encoding='utf-8') as f:
-    data = json.load(f)
+parser = argparse.ArgumentParser(description="Length distribution of the extracted documents")
+parser.add_argument('--extract-cache', action='store_true',
+                    help="analyze the PDF/PPTX text in the extraction cache (per page/slide) instead of markdown_data.json")
+args = parser.parse_args()
+
+if args.extract_cache:
+    from extract_cache import ExtractCache
+    # One entry per PDF page / PPTX slide, read from the cache without parsing the files again
+    data = [{'path': f"{entry['path']}#{number}", 'content': text}
+            for entry in ExtractCache().iter_entries() for number, text in entry['units']]
+    title = 'PDF page / PPTX slide length distribution:'
+else:
+    with open('markdown_data.json', 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    title = 'Markdown file length distribution:'
 
 lengths = [len(doc['content'].strip()) for doc in data]
 
@@ -20,7 +34,7 @@ for l in lengths:
             bin_counts[bin_labels[i]] += 1
             break
 
-print('Markdown file length distribution:')
+print(title)
 for label in bin_labels:
     print(f'{label:>8}: {bin_counts[label]}')
 
@@ -0,0 +1,146 @@
+"""Persistent semantic cache of LLM answers.
+
+An answer is reused when a new question's embedding is within
+ANSWER_CACHE_THRESHOLD cosine similarity of a cached question. The new
+question must also have retrieved the same passages (vector IDs) and be sent
+to the same backend/model, so a reworded question over different material
+still goes to the LLM. Entries expire after ANSWER_CACHE_TTL seconds, the
+least recently used ones are dropped above ANSWER_CACHE_MAX_ENTRIES, and the
+whole cache is emptied when the index changes (a different file manifest).
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from brain_config import ANSWER_CACHE_PATH
+
+# 问题向量的余弦相似度达到该值才视为同一问题
+ANSWER_CACHE_THRESHOLD = 0.95
+# 回答缓存有效期（秒），默认 7 天
+ANSWER_CACHE_TTL = 7 * 24 * 3600
+# 最多保留的回答条数，超出后按最近最少使用淘汰
+ANSWER_CACHE_MAX_ENTRIES = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS info (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS answers (
+    id        INTEGER PRIMARY KEY,
+    backend   TEXT NOT NULL,
+    doc_key   TEXT NOT NULL,
+    query     TEXT NOT NULL,
+    vector    BLOB NOT NULL,
+    answer    TEXT NOT NULL,
+    created   REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answers_key ON answers(backend, doc_key);
+"""
+
+
+def index_fingerprint(shards=None):
+    """Changes whenever the indexed corpus changes: hash of the shards' file manifests, else their index files' stat."""
+    from shards import searchable_shards
+    digest = hashlib.sha1()
+    for shard in searchable_shards() if shards is None else shards:
+        if os.path.exists(shard.files_path):
+            with open(shard.files_path, 'rb') as f:
+                digest.update(f.read())
+        elif os.path.exists(shard.index_path):
+            st = os.stat(shard.index_path)
+            digest.update(f"{st.st_mtime_ns}-{st.st_size}".encode('ascii'))
+    return digest.hexdigest()
+
+
+def doc_key(doc_ids):
+    """Order-insensitive key of the retrieved vector IDs."""
+    return ','.join(str(i) for i in sorted(int(i) for i in doc_ids))
+
+
+def _unit(vector):
+    v = np.asarray(vector, dtype='float32').ravel()
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+class AnswerCache:
+    def __init__(self, path=ANSWER_CACHE_PATH, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, fingerprint=None):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._check_index(index_fingerprint() if fingerprint is None else fingerprint)
+
+    def refresh_index(self):
+        """Re-check the index fingerprint after the index was updated in place."""
+        with self._lock:
+            self._check_index(index_fingerprint())
+
+    def _check_index(self, fingerprint):
+        """Drop all answers built on an older version of the index."""
+        row = self.conn.execute("SELECT value FROM info WHERE key = 'index'").fetchone()
+        if row is not None and row[0] == fingerprint:
+            return
+        if row is not None:
+            count = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if count:
+                print(f"🗑️ 索引已更新，清空{count}条回答缓存")
+        self.conn.execute("DELETE FROM answers")
+        self.conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('index', ?)", (fingerprint,))
+        self.conn.commit()
+
+    def get(self, backend, doc_ids, vector):
+        """Return (answer, similarity, cached query, age seconds) of the best match, or None."""
+        query_vec = _unit(vector)
+        now = time.time()
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, query, vector, answer, created FROM answers WHERE backend = ? AND doc_key = ? AND created >= ?",
+                (backend, doc_key(doc_ids), now - self.ttl)).fetchall()
+            best = None
+            for row_id, query, blob, answer, created in rows:
+                similarity = float(np.dot(query_vec, np.frombuffer(blob, dtype='float32')))
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (row_id, similarity, query, answer, created)
+            if best is None:
+                return None
+            self.conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, best[0]))
+            self.conn.commit()
+        return best[3], best[1], best[2], now - best[4]
+
+    def put(self, backend, doc_ids, vector, query, answer):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO answers (backend, doc_key, query, vector, answer, created, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (backend, doc_key(doc_ids), query, _unit(vector).tobytes(), answer, now, now))
+            self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now):
+        self.conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+        self.conn.execute(
+            "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY last_used DESC LIMIT ?)",
+            (self.max_entries,))
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM answers")
+            self.conn.commit()
+
+    def count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
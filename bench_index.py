@@ -0,0 +1,142 @@
+"""Benchmark FAISS index types against the exact flat baseline.
+
+Vectors are read back from the collections' md_faiss.index files (build
+them as flat, hnsw or ivf so they are exact; --collection picks some). A random sample is held out as queries
+unless --query-file gives real questions (one per line) to encode. For
+every index type the report shows build time, memory (also relative to the
+float32 flat index), recall@k against IndexFlatIP and single-query latency.
+The quantized types (fp16, sq8, binary) trade a little recall for memory.
+
+    python bench_index.py --types flat ivf hnsw ivfpq opq --k 10 --json bench_index.json
+    python bench_index.py --types flat fp16 sq8 binary --rescore-factor 20
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from index_factory import (INDEX_TYPES, make_params, build_index, reconstruct_vectors, load_params,
+                           index_memory_bytes)
+from meta_store import MetaStore
+from shards import searchable_shards
+
+
+def load_corpus_vectors(collections=None):
+    """IDs and vectors of the selected collections (default: all), read back from their indexes."""
+    shards = searchable_shards()
+    if collections:
+        shards = [s for s in shards if s.name in collections]
+    all_ids, all_vectors = [], []
+    for shard in shards:
+        index = faiss.read_index(shard.index_path)
+        params = load_params(shard.params_path) or {'kind': 'flat'}
+        if params['kind'] in ('ivfpq', 'opq', 'sq8'):
+            print(f"⚠️  Index of {shard.name} is {params['kind']}: reconstructed vectors are approximate.")
+        store = MetaStore(shard.meta_path, readonly=True)
+        ids = np.array(store.ids(), dtype='int64')
+        store.close()
+        all_ids.append(ids)
+        all_vectors.append(reconstruct_vectors(index, ids))
+    return np.concatenate(all_ids), np.concatenate(all_vectors)
+
+
+def encode_queries(path):
+    from brain_loader import load_index_model
+    with open(path, 'r', encoding='utf-8') as f:
+        queries = [line.strip() for line in f if line.strip()]
+    model = load_index_model(manifest_path=searchable_shards()[0].manifest_path)
+    return model.encode(queries, show_progress_bar=False, convert_to_numpy=True,
+                        normalize_embeddings=True).astype('float32')
+
+
+def recall_at_k(found, truth):
+    k = truth.shape[1]
+    hits = [len(set(f[f >= 0]) & set(t[t >= 0])) for f, t in zip(found, truth)]
+    return float(np.mean(hits)) / k
+
+
+def measure_latency(index, queries, k):
+    """Per-query latency in ms (one search call per query, as in the REPL)."""
+    times = []
+    for q in queries:
+        start = time.perf_counter()
+        index.search(q[None, :], k)
+        times.append((time.perf_counter() - start) * 1000)
+    return np.percentile(times, 50), np.percentile(times, 95)
+
+
+def bench(kind, db_vectors, db_ids, queries, truth, k, overrides):
+    params = make_params(kind, **overrides)
+    start = time.perf_counter()
+    index = build_index(kind, db_vectors, db_ids, params)
+    build_s = time.perf_counter() - start
+    _, found = index.search(queries, k)
+    p50, p95 = measure_latency(index, queries, k)
+    return {
+        'kind': params['kind'],  # may have fallen back to flat on tiny corpora
+        'params': params,
+        'build_s': round(build_s, 3),
+        'memory_mb': round(index_memory_bytes(index) / 2 ** 20, 2),
+        'recall_at_k': round(recall_at_k(found, truth), 4),
+        'latency_p50_ms': round(float(p50), 3),
+        'latency_p95_ms': round(float(p95), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FAISS index types: recall@k, latency, memory.")
+    parser.add_argument('--types', nargs='+', choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200, help="held-out corpus vectors used as queries")
+    parser.add_argument('--query-file', help="text file with one question per line (encoded with bge-large-zh)")
+    parser.add_argument('--nlist', type=int)
+    parser.add_argument('--nprobe', type=int)
+    parser.add_argument('--hnsw-m', type=int)
+    parser.add_argument('--ef-search', type=int)
+    parser.add_argument('--pq-m', type=int)
+    parser.add_argument('--rescore-factor', type=int)
+    parser.add_argument('--collection', action='append', dest='collections', metavar='NAME',
+                        help="benchmark only this collection's vectors (repeatable; default: all)")
+    parser.add_argument('--json', help="write results to this JSON file")
+    args = parser.parse_args()
+    overrides = dict(nlist=args.nlist, nprobe=args.nprobe, hnsw_m=args.hnsw_m,
+                     ef_search=args.ef_search, pq_m=args.pq_m, rescore_factor=args.rescore_factor)
+
+    ids, vectors = load_corpus_vectors(args.collections)
+    if args.query_file:
+        queries = encode_queries(args.query_file)
+        db_ids, db_vectors = ids, vectors
+    else:
+        rng = np.random.default_rng(0)
+        held_out = rng.choice(len(ids), min(args.queries, len(ids) // 10 or 1), replace=False)
+        mask = np.ones(len(ids), dtype=bool)
+        mask[held_out] = False
+        queries = np.ascontiguousarray(vectors[held_out])
+        db_ids, db_vectors = ids[mask], vectors[mask]
+    print(f"Benchmarking {len(db_ids)} vectors (dim {vectors.shape[1]}) with {len(queries)} queries, k={args.k}")
+
+    baseline = build_index('flat', db_vectors, db_ids, make_params('flat'))
+    _, truth = baseline.search(queries, args.k)
+    baseline_mb = index_memory_bytes(baseline) / 2 ** 20
+
+    results = []
+    print(f"\n{'type':<8}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'memory MB':>12}{'vs flat':>9}{'build s':>10}")
+    for kind in args.types:
+        r = bench(kind, db_vectors, db_ids, queries, truth, args.k, overrides)
+        r['memory_vs_flat'] = round(r['memory_mb'] / baseline_mb, 3) if baseline_mb else None
+        results.append(r)
+        ratio = f"{r['memory_vs_flat']:.0%}" if r['memory_vs_flat'] is not None else '-'
+        print(f"{kind:<8}{r['recall_at_k']:>10.3f}{r['latency_p50_ms']:>10.2f}{r['latency_p95_ms']:>10.2f}"
+              f"{r['memory_mb']:>12.1f}{ratio:>9}{r['build_s']:>10.2f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'vectors': len(db_ids), 'queries': len(queries), 'k': args.k, 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
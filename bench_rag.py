@@ -0,0 +1,301 @@
+"""End-to-end retrieval benchmark over a labelled query set.
+
+Runs each query through the same code path as rag_brain_optimized.py
+(encode, hybrid search, metadata lookup, optional rerank, prompt build and
+optionally the LLM call) and reports:
+  - retrieval quality over files: recall@k, MRR and nDCG@k,
+  - p50/p95/p99 latency per stage: encode, search (FAISS + BM25),
+    metadata, rerank, prompt and llm.
+Results go to a JSON file; --baseline compares against an earlier one, so
+runs can be compared across commits, index types and models.
+
+The query set is JSONL, one labelled query per line; expected files are
+matched by file name or by the end of their path:
+
+    {"query": "任老师怎么看读书？", "expected": ["读书方法.md", "books/阅读课.pdf"]}
+
+    python bench_rag.py --queries bench_queries.jsonl --json bench_rag.json
+    python bench_rag.py --queries bench_queries.jsonl --index-dir shards_hnsw --baseline bench_rag.json
+    python bench_rag.py --queries bench_queries.jsonl --llm mock    # deterministic, offline LLM stage
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import subprocess
+import time
+
+import numpy as np
+
+import rag_brain_optimized as brain
+from brain_config import BASE_DIR
+from brain_loader import LazyResource, load_index_model, load_model
+from index_manifest import load_index_manifest, check_dimension, describe, model_fingerprint
+from llm_backends import AsyncClients
+from relevance import load_relevance
+from shards import ShardSet, shards_in
+
+STAGES = ('encode', 'search', 'metadata', 'rerank', 'prompt', 'llm')
+PERCENTILES = (50, 95, 99)
+DEFAULT_KS = (1, 3, 5, 10)
+
+
+class TimedShards:
+    """ShardSet proxy that adds the time spent in its calls to the current query's stages."""
+
+    STAGE_OF = {'search': 'search', 'lexical_search': 'search', 'has_lexical': 'search', 'score_ids': 'search',
+                'get_many': 'metadata'}
+
+    def __init__(self, shards):
+        self._shards = shards
+        self.times = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self._shards, name)
+        stage = self.STAGE_OF.get(name)
+        if stage is None:
+            return attr
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self.times[stage] = self.times.get(stage, 0.0) + time.perf_counter() - start
+        return timed
+
+
+def load_labelled_queries(path):
+    queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not record.get('query') or not record.get('expected'):
+                raise ValueError(f"{path}:{n}: every line needs 'query' and 'expected'")
+            expected = record['expected']
+            queries.append({'query': record['query'], 'expected': [expected] if isinstance(expected, str) else expected})
+    return queries
+
+
+def _normalized(path):
+    return path.replace('\\', '/').lower()
+
+
+def matches(path, expected):
+    """True if a retrieved path is the expected file (given by name or a trailing part of its path)."""
+    path, expected = _normalized(path), _normalized(expected)
+    return path == expected or path.endswith('/' + expected.lstrip('/'))
+
+
+def ranked_files(docs):
+    """Distinct file paths in order of their best passage."""
+    files = []
+    for d in docs:
+        if d['path'] not in files:
+            files.append(d['path'])
+    return files
+
+
+def score_ranking(files, expected, ks):
+    """recall@k, nDCG@k and reciprocal rank of one query's file ranking."""
+    found = {}  # expected file -> first rank it was retrieved at
+    for rank, path in enumerate(files, 1):
+        for e in expected:
+            if e not in found and matches(path, e):
+                found[e] = rank
+                break
+    first = min(found.values()) if found else None
+    scores = {'rr': 1.0 / first if first else 0.0, 'first_relevant_rank': first}
+    for k in ks:
+        ranks = [r for r in found.values() if r <= k]
+        dcg = sum(1 / math.log2(r + 1) for r in ranks)
+        ideal = sum(1 / math.log2(r + 1) for r in range(1, min(len(expected), k) + 1))
+        scores[f'recall@{k}'] = len(ranks) / len(expected)
+        scores[f'ndcg@{k}'] = dcg / ideal if ideal else 0.0
+    return scores
+
+
+def start_mock_llm(delay):
+    """Serve the canned mock_llm_server answer on a free port and point the Ollama backend at it."""
+    import threading
+    from mock_llm_server import serve
+    server = serve(port=0, delay=delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    brain.OLLAMA_URL = f"http://127.0.0.1:{server.server_port}/api/generate"
+    return server
+
+
+async def run_query(clients, item, top_k, rerank, llm, timed):
+    """One query through the pipeline; returns (docs, {stage: seconds})."""
+    query = item['query']
+    timed.times = {}
+    times = {}
+    start = time.perf_counter()
+    vector = brain.encode_queries([query])
+    times['encode'] = time.perf_counter() - start
+
+    candidates = brain.candidate_count(top_k) if rerank else top_k
+    docs = brain.search_vectors(vector, candidates, [query], item.get('collections'))[0]
+    times.update(timed.times)
+    if rerank:
+        start = time.perf_counter()
+        docs = brain.select_passages(query, docs, top_k, wait=True, verbose=False)
+        times['rerank'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # the REPL's relevance notes are not part of the report
+        prompt = brain.build_prompt(query, docs, 'zhipu' if llm == 'zhipu' else 'ollama')
+    times['prompt'] = time.perf_counter() - start
+    if llm != 'none':
+        start = time.perf_counter()
+        answer, _, _ = await brain.ask_llm_async(clients, prompt, docs, llm == 'zhipu')
+        times['llm'] = time.perf_counter() - start
+        if brain.is_llm_error(answer):
+            print(f"⚠️  {answer}")
+    times['total'] = sum(times.values())
+    return docs, times
+
+
+async def run_benchmark(queries, top_k, ks, repeat, rerank, llm, timed):
+    per_query = []
+    samples = {stage: [] for stage in STAGES + ('total',)}
+    async with AsyncClients() as clients:
+        # Warm-up: loads model, indexes, stores (and the reranker) outside the measurements
+        await run_query(clients, queries[0], top_k, rerank, 'none', timed)
+        for n, item in enumerate(queries, 1):
+            for _ in range(repeat):
+                docs, times = await run_query(clients, item, top_k, rerank, llm, timed)
+                for stage, seconds in times.items():
+                    samples[stage].append(seconds * 1000)
+            files = ranked_files(docs)
+            record = {'query': item['query'], 'expected': item['expected'], 'retrieved': files[:max(ks)]}
+            record.update(score_ranking(files, item['expected'], ks))
+            per_query.append(record)
+            print(f"  [{n}/{len(queries)}] rr={record['rr']:.2f} {item['query'][:30]}", end='\r')
+    print()
+    return per_query, samples
+
+
+def summarize(per_query, samples, ks):
+    quality = {'mrr': float(np.mean([r['rr'] for r in per_query]))}
+    for k in ks:
+        quality[f'recall@{k}'] = float(np.mean([r[f'recall@{k}'] for r in per_query]))
+        quality[f'ndcg@{k}'] = float(np.mean([r[f'ndcg@{k}'] for r in per_query]))
+    latency = {}
+    for stage, values in samples.items():
+        if values:
+            latency[stage] = {f'p{p}': round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+            latency[stage]['mean'] = round(float(np.mean(values)), 3)
+    return {k: round(v, 4) for k, v in quality.items()}, latency
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def print_report(quality, latency, baseline=None):
+    old_quality = (baseline or {}).get('quality', {})
+    old_latency = (baseline or {}).get('latency_ms', {})
+    print(f"\n{'metric':<12}{'value':>10}" + (f"{'baseline':>10}{'delta':>10}" if baseline else ''))
+    for name, value in quality.items():
+        line = f"{name:<12}{value:>10.4f}"
+        if name in old_quality:
+            line += f"{old_quality[name]:>10.4f}{value - old_quality[name]:>+10.4f}"
+        print(line)
+    print(f"\n{'latency ms':<12}" + ''.join(f"{'p' + str(p):>10}" for p in PERCENTILES)
+          + (f"{'base p50':>10}" if baseline else ''))
+    for stage, values in latency.items():
+        line = f"{stage:<12}" + ''.join(f"{values['p' + str(p)]:>10.2f}" for p in PERCENTILES)
+        if stage in old_latency:
+            line += f"{old_latency[stage]['p50']:>10.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality (recall@k, MRR, nDCG) and per-stage latency.")
+    parser.add_argument('--queries', required=True, help="labelled queries, JSONL with 'query' and 'expected' files")
+    parser.add_argument('--index-dir', help="benchmark the index(es) in this folder (default: the current shards/)")
+    parser.add_argument('--model', help="embedding model folder (default: the model recorded in the index manifest)")
+    parser.add_argument('--collections', help="only search these collections, comma-separated")
+    parser.add_argument('--top-k', type=int, default=10, help="passages retrieved per query, as in the REPL")
+    parser.add_argument('--k', type=int, nargs='+', default=list(DEFAULT_KS), help="cut-offs for recall/nDCG")
+    parser.add_argument('--repeat', type=int, default=1, help="runs per query for the latency percentiles")
+    parser.add_argument('--no-hybrid', action='store_true', help="vector search only (no BM25 fusion)")
+    parser.add_argument('--no-rerank', action='store_true', help="skip the cross-encoder even if it is installed")
+    parser.add_argument('--llm', choices=('none', 'mock', 'ollama', 'zhipu'), default='none',
+                        help="also time the LLM call; 'mock' uses mock_llm_server.py (offline, deterministic)")
+    parser.add_argument('--mock-delay', type=float, default=0.0, help="seconds between mock LLM tokens")
+    parser.add_argument('--json', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="earlier --json output to compare against")
+    args = parser.parse_args()
+
+    shards = ShardSet(shards_in(args.index_dir)) if args.index_dir else ShardSet()
+    manifest = load_index_manifest(shards.manifest_paths[0])
+    if args.model:
+        def load():
+            model = load_model(args.model)
+            check_dimension(manifest, model.get_sentence_embedding_dimension(), f"Embedding model {args.model}")
+            return model
+        if manifest is not None and model_fingerprint(args.model) != manifest['model']['hash']:
+            print(f"⚠️  {args.model} is not the model that built the index ({manifest['model']['name']})")
+        brain.model_res = LazyResource('embedding model', load)
+    else:
+        brain.model_res = LazyResource('embedding model', lambda: load_index_model(manifest_path=shards.manifest_paths[0]))
+    timed = TimedShards(shards)
+    brain.shards = timed
+    brain.relevance = load_relevance(shards.params_path)
+    brain.HYBRID_SEARCH = not args.no_hybrid
+    rerank = brain.USE_RERANK and not args.no_rerank
+    if args.llm == 'mock':
+        start_mock_llm(args.mock_delay)
+
+    queries = load_labelled_queries(args.queries)
+    if args.collections:
+        selection = tuple(s.name for s in shards.select([n.strip() for n in args.collections.split(',')]))
+        for item in queries:
+            item['collections'] = selection
+    ks = sorted(set(args.k))
+    print(f"Benchmarking {len(queries)} queries on {', '.join(shards.names)} ({describe(manifest)}), "
+          f"top_k={args.top_k}, hybrid={brain.HYBRID_SEARCH}, rerank={rerank}, llm={args.llm}")
+    per_query, samples = asyncio.run(run_benchmark(queries, args.top_k, ks, args.repeat, rerank, args.llm, timed))
+    quality, latency = summarize(per_query, samples, ks)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(quality, latency, baseline)
+
+    if args.json:
+        result = {
+            'commit': git_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'config': {
+                'index_dir': os.path.abspath(args.index_dir) if args.index_dir else None,
+                'index': describe(manifest),
+                'model': args.model or (manifest['model']['name'] if manifest else None),
+                'collections': shards.names if not args.collections else args.collections.split(','),
+                'top_k': args.top_k, 'ks': ks, 'repeat': args.repeat,
+                'hybrid': brain.HYBRID_SEARCH, 'rerank': rerank, 'llm': args.llm,
+            },
+            'queries': len(queries),
+            'quality': quality,
+            'latency_ms': latency,
+            'per_query': per_query,
+        }
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
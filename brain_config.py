@@ -0,0 +1,55 @@
+import os
+
+# === 配置区 ===
+# 指定要扫描的多个根目录（直接在此处硬编码路径，按需修改）
+SCAN_ROOTS = [
+    r"F:/My Books/Working/My Own Writings Managed by Obsidian",  # 主目录
+    r"F:/My Books/Working/_各读书会",  # 示例：添加更多目录
+    # r"D:/Some/Other/Path"        # 示例：再加一个目录
+]
+# 扫描时跳过的路径（glob，匹配名称或相对扫描根目录的路径；以 / 结尾表示文件夹，不再进入），见 scanner.py
+SCAN_EXCLUDE = ['.obsidian/', '.trash/', '.git/']
+# 只收录匹配这些 glob 的文件；None = 全部 .md/.pdf/.pptx
+SCAN_INCLUDE = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 集合（分片）：名称 -> 根目录（或根目录列表）。每个集合在 SHARDS_DIR/<名称>/ 下有独立的索引、
+# 元数据和清单，可单独重建（embed_and_index.py --collection 名称），查询时也可只查部分集合。
+# None = 每个扫描根目录一个集合，以目录名命名。例如：
+# COLLECTIONS = {'writings': SCAN_ROOTS[0], 'reading-groups': [SCAN_ROOTS[1]]}
+COLLECTIONS = None
+SHARDS_DIR = os.path.join(BASE_DIR, 'shards')
+
+# Embedding model used to build the index
+EMBED_MODEL_DIR = os.path.join(BASE_DIR, 'models', 'bge-large-zh')
+
+# Index artifacts written by embed_and_index.py (file names per shard; these paths are the
+# single index built before collections existed, see shards.py)
+INDEX_PATH = os.path.join(BASE_DIR, 'md_faiss.index')
+# Index type and its build/search parameters, see index_factory.py
+INDEX_PARAMS_PATH = os.path.join(BASE_DIR, 'md_faiss_params.json')
+# Chunk metadata (path/page/offset/text per vector ID), see meta_store.py
+META_PATH = os.path.join(BASE_DIR, 'md_faiss_meta.sqlite')
+# BM25 keyword index over the chunk texts (SQLite FTS5), see lexical_index.py
+LEXICAL_PATH = os.path.join(BASE_DIR, 'md_lexical.sqlite')
+# Model, dimension, metric and chunker settings the index was built with, see index_manifest.py
+INDEX_MANIFEST_PATH = os.path.join(BASE_DIR, 'md_faiss_manifest.json')
+# path -> mtime/size/sha1/vector ids, used for incremental re-indexing
+FILES_MANIFEST_PATH = os.path.join(BASE_DIR, 'md_faiss_files.json')
+
+# Embedding cache (content hash -> vector per model), see embed_cache.py
+EMBED_CACHE_DIR = os.path.join(BASE_DIR, 'embed_cache')
+
+# Text extracted from PDF/PPTX files per content hash, see extract_cache.py
+EXTRACT_CACHE_DIR = os.path.join(BASE_DIR, 'extract_cache')
+
+# Semantic cache of LLM answers, see answer_cache.py
+ANSWER_CACHE_PATH = os.path.join(BASE_DIR, 'answer_cache.sqlite')
+
+# Optional cross-encoder for reranking retrieved passages, see reranker.py
+# (e.g. BAAI/bge-reranker-base; reranking is skipped when the folder does not exist)
+RERANK_MODEL_DIR = os.path.join(BASE_DIR, 'models', 'bge-reranker-base')
+
+# JSONL trace of pipeline spans (encode, search, LLM, ...), see tracing.py; None = off (or pass --trace FILE)
+TRACE_PATH = None
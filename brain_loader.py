@@ -0,0 +1,157 @@
+"""Lazy, background loading of the search resources for fast REPL startup.
+
+Heavy imports (torch / sentence-transformers, faiss) happen inside the
+loader functions, the FAISS index is memory-mapped where the index type
+supports it, and the embedding model loads and warms up in a background
+thread while the prompt already accepts input. The model is the one recorded
+in the index manifest, and both are checked against it as they load.
+"""
+import threading
+import time
+
+from brain_config import INDEX_PATH, INDEX_PARAMS_PATH, INDEX_MANIFEST_PATH
+from index_manifest import (IndexMismatchError, load_index_manifest, resolve_model_dir, check_model_files,
+                            check_dimension, describe)
+from tracing import record
+
+# Taken when the first script imports this module, i.e. right after interpreter start
+PROCESS_START = time.time()
+
+
+def load_model(model_dir, warmup=True):
+    """Load a SentenceTransformer and run one tiny encode so the first real query is not slow."""
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_dir)
+    if warmup:
+        model.encode(["预热 warmup"], show_progress_bar=False)
+    return model
+
+
+def load_index_model(warmup=True, manifest_path=INDEX_MANIFEST_PATH):
+    """Load the embedding model that built the index and check that it still produces the index's vectors."""
+    manifest = load_index_manifest(manifest_path)
+    model_dir = resolve_model_dir(manifest)
+    check_model_files(manifest, model_dir)
+    model = load_model(model_dir, warmup)
+    check_dimension(manifest, model.get_sentence_embedding_dimension(), f"Embedding model {model_dir}")
+    return model
+
+
+def check_index_compatibility(manifest_paths=(INDEX_MANIFEST_PATH,)):
+    """Startup check before the REPL / server starts loading: exit with a message when model and index differ.
+
+    With several shards (see shards.py) they must also share one model, since
+    a query is encoded once for all of them.
+    """
+    try:
+        manifests = [load_index_manifest(path) for path in manifest_paths]
+        manifest = manifests[0] if manifests else None
+        for other in manifests[1:]:
+            if other is not None and manifest is not None and (
+                    (other['model']['hash'], other['dimension']) != (manifest['model']['hash'], manifest['dimension'])):
+                raise IndexMismatchError(f"Collections were built with different embedding models "
+                                         f"({manifest['model']['name']}, {other['model']['name']}); "
+                                         f"rebuild them with embed_and_index.py --full.")
+        check_model_files(manifest, resolve_model_dir(manifest))
+    except IndexMismatchError as e:
+        print(f"❌ 索引与嵌入模型不匹配: {e}")
+        raise SystemExit(1)
+    print(f"🧩 索引: {describe(manifest)}" + (f"（{len(manifests)}个集合）" if len(manifests) > 1 else ""))
+    return manifest
+
+
+def load_index(path=INDEX_PATH, mmap=True, params_path=INDEX_PARAMS_PATH, manifest_path=INDEX_MANIFEST_PATH):
+    """Read a FAISS index, memory-mapped (IO_FLAG_MMAP) when possible, with its saved search parameters."""
+    import faiss
+    from index_factory import load_params, apply_search_params
+    index = None
+    if mmap:
+        try:
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass  # this index type cannot be mmapped; fall back to a normal read
+    if index is None:
+        index = faiss.read_index(path)
+    check_dimension(load_index_manifest(manifest_path), index.d, f"FAISS index {path}")
+    params = load_params(params_path)
+    if params:
+        apply_search_params(index, params)  # nprobe / efSearch
+    return index
+
+
+class LazyResource:
+    """A value produced by `loader` in a background thread; get() blocks until it is ready."""
+
+    def __init__(self, name, loader):
+        self.name = name
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._thread = None
+        self._value = None
+        self._error = None
+        self.load_seconds = None
+        self.wait_seconds = 0.0  # how long callers blocked in get()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name=f"load-{self.name}", daemon=True)
+                self._thread.start()
+        return self
+
+    def _load(self):
+        start = time.time()
+        try:
+            self._value = self._loader()
+        except Exception as e:
+            self._error = e
+        self.load_seconds = time.time() - start
+        record(f"load {self.name}", self.load_seconds, start)
+
+    def reload(self):
+        """Load a fresh value in the calling thread and swap it in; get() returns the old one until then."""
+        start = time.time()
+        value = self._loader()
+        self._value, self._error = value, None
+        self.load_seconds = time.time() - start
+        record(f"load {self.name}", self.load_seconds, start, reload=True)
+
+    @property
+    def ready(self):
+        return self._thread is not None and not self._thread.is_alive()
+
+    def get(self):
+        self.start()
+        if not self.ready:
+            start = time.time()
+            self._thread.join()
+            self.wait_seconds += time.time() - start
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class StartupTimer:
+    """Prints time-to-first-prompt and, once, a time-to-first-answer breakdown."""
+
+    def __init__(self, *resources):
+        self.resources = resources
+        self.prompt_at = None
+        self.first_answer_at = None
+
+    def prompt_ready(self):
+        if self.prompt_at is not None:
+            return
+        self.prompt_at = time.time()
+        loading = [r.name for r in self.resources if not r.ready]
+        suffix = f"（后台加载中: {', '.join(loading)}）" if loading else ""
+        print(f"⏱️ 启动到可输入: {self.prompt_at - PROCESS_START:.2f}s{suffix}")
+
+    def answered(self):
+        if self.first_answer_at is not None:
+            return
+        self.first_answer_at = time.time()
+        print(f"⏱️ 启动到首个回答: {self.first_answer_at - PROCESS_START:.2f}s")
+        for r in self.resources:
+            load = f"{r.load_seconds:.2f}s" if r.load_seconds is not None else "未加载"
+            print(f"   - {r.name}: 加载 {load}，查询等待 {r.wait_seconds:.2f}s")
@@ -0,0 +1,382 @@
+"""Long-running local query server for the digital brain.
+
+Keeps the embedding model, FAISS index, metadata store and answer cache
+resident and answers HTTP/JSON requests on an asyncio event loop:
+
+  GET  /health                       index, resource status and batching counters
+  GET  /stats                        per-stage latency histogram (see tracing.py)
+  GET  /search?q=...&top_k=5         retrieval only
+  POST /search  {"query", "top_k", "rerank", "collections"}
+  POST /ask     {"query", "top_k", "backend": "ollama"|"zhipu", "use_cache", "collections"}
+
+"collections" (a list, or comma-separated in the query string) restricts the
+search to some of the index shards; by default all of them are searched.
+
+Concurrent /search and /ask requests are micro-batched: queries arriving
+within BATCH_WINDOW_MS (or while the previous batch is still running) are
+encoded in one model call and searched with one index.search. /ask (and
+/search with "rerank": true) reranks the candidates with the optional
+cross-encoder within its time budget. LLM calls
+share keep-alive connection pools, with up to LLM_CONCURRENCY in flight.
+
+Every INDEX_RELOAD_SECONDS the server checks whether an index file was
+rewritten (watch_index.py, embed_and_index.py) and swaps the new index in
+without a restart.
+
+    python brain_server.py --port 8600
+    curl "http://127.0.0.1:8600/search?q=读书会&top_k=3"
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import rag_brain_optimized as brain
+from brain_loader import check_index_compatibility
+from index_manifest import describe, load_index_manifest
+from llm_backends import AsyncClients, LLM_CONCURRENCY
+from tracing import trace, stats, enable as enable_trace
+
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8600
+# 微批处理：等待同批查询的时间窗口（毫秒）与单批最大查询数
+BATCH_WINDOW_MS = 5
+MAX_BATCH = 64
+MAX_TOP_K = 100
+MAX_BODY_BYTES = 1 << 20
+# 检查索引文件是否被更新（watch_index.py / embed_and_index.py）的间隔（秒）
+INDEX_RELOAD_SECONDS = 2.0
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def flag(args, name, default):
+    """Boolean request argument: JSON true/false, or 1/0, true/false, yes/no, on/off from a query string."""
+    value = args.get(name, default)
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ('1', 'true', 'yes', 'on'):
+        return True
+    if text in ('0', 'false', 'no', 'off', ''):
+        return False
+    raise HttpError(400, f"'{name}' must be true or false")
+
+
+class MicroBatcher:
+    """Collects concurrent queries and runs them as one encode + one FAISS search."""
+
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue = None
+        # Single worker: batches run one after another while new queries queue up behind them
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search')
+        self.batches = 0
+        self.queries = 0
+        self._task = None
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def search(self, query, top_k, collections=None):
+        """Return (query vector, results, batch size) for one query."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((query, top_k, collections, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    @staticmethod
+    def _search_batch(queries, top_k, collections):
+        """One encode for the whole batch; one search per distinct collection selection in it."""
+        vectors = brain.encode_queries(queries)
+        results = [None] * len(queries)
+        groups = {}
+        for i, selection in enumerate(collections):
+            groups.setdefault(selection, []).append(i)
+        for selection, rows in groups.items():
+            found = brain.search_vectors(vectors[rows], top_k, [queries[i] for i in rows], selection)
+            for i, docs in zip(rows, found):
+                results[i] = docs
+        return vectors, results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            queries = [q for q, _, _, _ in batch]
+            try:
+                vectors, results = await loop.run_in_executor(
+                    self.executor, self._search_batch, queries, max(k for _, k, _, _ in batch),
+                    [c for _, _, c, _ in batch])
+            except Exception as e:
+                for _, _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.queries += len(batch)
+            for i, (_, top_k, _, future) in enumerate(batch):
+                if not future.done():  # the client may have disconnected
+                    future.set_result((vectors[i], results[i][:top_k], len(batch)))
+
+
+class BrainServer:
+    def __init__(self, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH, concurrency=LLM_CONCURRENCY):
+        self.batcher = MicroBatcher(window_ms, max_batch)
+        self.concurrency = concurrency
+        self.llm_slots = None
+        self.clients = None
+        self.started = time.time()
+        self.index_info = None
+        self.reloads = 0
+
+    def resources(self):
+        """Resources of the loaded shards (they change when refresh_index swaps in a new generation)."""
+        resources = (brain.model_res, *brain.shards.index_resources(), *brain.shards.meta_resources(),
+                     *brain.shards.lexical_resources(), brain.answer_cache_res)
+        if brain.USE_RERANK:
+            resources += (brain.reranker_res,)
+        return resources
+
+    async def serve(self, host=SERVER_HOST, port=SERVER_PORT):
+        self.index_info = check_index_compatibility(brain.shards.manifest_paths)  # exits before loading on a mismatch
+        for res in self.resources():
+            res.start()  # load in the background; requests wait for what they need
+        self.batcher.start()
+        asyncio.ensure_future(self.reload_index())
+        self.llm_slots = asyncio.Semaphore(self.concurrency)
+        async with AsyncClients() as clients:
+            self.clients = clients
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            print(f"🧠 数字大脑服务已启动: http://{host}:{port}（/search, /ask, /health）")
+            async with server:
+                await server.serve_forever()
+
+    async def reload_index(self):
+        """Swap in index shards that were rewritten while the server runs."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(INDEX_RELOAD_SECONDS)
+            try:
+                reloaded = await loop.run_in_executor(None, brain.refresh_index)
+            except Exception as e:
+                print(f"⚠️  索引检查失败: {type(e).__name__}: {e}")
+                continue
+            if reloaded:
+                self.reloads += 1
+                self.index_info = load_index_manifest(brain.shards.manifest_paths[0])
+                print(f"🔄 索引已重新加载: {', '.join(reloaded)}")
+
+    # --- HTTP ---
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                headers = {'connection': 'close'}  # until the request has been parsed
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    method, path, args, headers = request
+                    status, payload = 200, await self.dispatch(method, path, args)
+                except HttpError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except Exception as e:
+                    status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await write_json(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, method, path, args):
+        if path == '/health' and method == 'GET':
+            return self.health()
+        if path == '/stats' and method == 'GET':
+            return {'spans': stats()}
+        if path == '/search' and method in ('GET', 'POST'):
+            return await self.search(args)
+        if path == '/ask' and method == 'POST':
+            return await self.ask(args)
+        raise HttpError(404, f"Unknown endpoint: {method} {path}")
+
+    # --- endpoints ---
+
+    def health(self):
+        return {
+            'uptime': round(time.time() - self.started, 1),
+            'index': describe(self.index_info),
+            'collections': brain.shards.names,
+            'index_reloads': self.reloads,
+            'resources': {r.name: ('ready' if r.ready else 'loading') for r in self.resources()},
+            'batches': self.batcher.batches,
+            'queries': self.batcher.queries,
+        }
+
+    async def _retrieve(self, args, default_top_k, rerank=False):
+        query = str(args.get('query') or args.get('q') or '').strip()
+        if not query:
+            raise HttpError(400, "Missing 'query'")
+        try:
+            top_k = int(args.get('top_k', default_top_k))
+        except (TypeError, ValueError):
+            raise HttpError(400, "'top_k' must be an integer")
+        top_k = max(1, min(top_k, MAX_TOP_K))
+        collections = args.get('collections') or None
+        if isinstance(collections, str):
+            collections = [c.strip() for c in collections.split(',') if c.strip()]
+        if collections is not None:
+            try:
+                collections = tuple(s.name for s in brain.shards.select([str(c) for c in collections]))
+            except (ValueError, TypeError) as e:
+                raise HttpError(400, str(e))
+        start = time.time()
+        candidates = brain.candidate_count(top_k) if rerank else top_k
+        vector, docs, batch_size = await self.batcher.search(query, candidates, collections)
+        timing = {'search': round(time.time() - start, 4), 'batch_size': batch_size}
+        if rerank:
+            start = time.time()
+            docs = await asyncio.get_running_loop().run_in_executor(  # in the request's trace
+                None, contextvars.copy_context().run, brain.select_passages, query, docs, top_k, False, False)
+            timing['rerank'] = round(time.time() - start, 4)
+        return query, vector, docs, timing
+
+    async def search(self, args):
+        with trace('search'):
+            query, _, docs, timing = await self._retrieve(args, 5, rerank=flag(args, 'rerank', False))
+        return {'query': query, 'results': docs, 'timing': timing}
+
+    async def ask(self, args):
+        with trace('ask', backend=args.get('backend', 'ollama')):
+            return await self._ask(args)
+
+    async def _ask(self, args):
+        # Reject bad arguments before paying for embedding, search and rerank
+        backend = args.get('backend', 'ollama')
+        if backend not in ('ollama', 'zhipu'):
+            raise HttpError(400, "'backend' must be 'ollama' or 'zhipu'")
+        use_zhipu = backend == 'zhipu'
+        use_cache = flag(args, 'use_cache', True)
+        query, vector, docs, timing = await self._retrieve(args, 10, rerank=True)
+        use_cache = use_cache and bool(docs)
+        response = {'query': query, 'backend': brain.backend_name(use_zhipu), 'results': docs, 'cached': False}
+        loop = asyncio.get_running_loop()
+
+        # The answer cache does SQLite and numpy work and may wait for its loader thread: keep it off the loop
+        if use_cache:
+            hit = await loop.run_in_executor(
+                None, contextvars.copy_context().run, brain.cached_answer, vector, docs, use_zhipu)
+            if hit is not None:
+                response.update(answer=hit[0], cached=True, similarity=round(hit[1], 4), timing=timing)
+                return response
+
+        prompt = brain.build_prompt(query, docs, backend)
+        async with self.llm_slots:
+            answer, ttft, total = await brain.ask_llm_async(self.clients, prompt, docs, use_zhipu)
+        if use_cache:
+            await loop.run_in_executor(
+                None, contextvars.copy_context().run, brain.store_answer, vector, docs, use_zhipu, query, answer)
+        timing.update(llm=round(total, 4), ttft=round(ttft, 4) if ttft is not None else None)
+        response.update(answer=answer, error=brain.is_llm_error(answer), timing=timing)
+        return response
+
+
+async def read_request(reader):
+    """Parse one HTTP/1.1 request; returns (method, path, args, headers) or None at EOF."""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+    headers = {}
+    while True:
+        header = await reader.readline()
+        if header in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = header.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length")
+    if length < 0:
+        raise HttpError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b''
+
+    url = urlsplit(target)
+    args = {k: v[-1] for k, v in parse_qs(url.query).items()}
+    if body:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise HttpError(400, "Body must be JSON")
+        if not isinstance(data, dict):
+            raise HttpError(400, "Body must be a JSON object")
+        args.update(data)
+    return method.upper(), url.path, args, headers
+
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+async def write_json(writer, status, payload, keep_alive=True):
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = (
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="数字大脑本地查询服务（HTTP/JSON）")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--batch-window-ms', type=float, default=BATCH_WINDOW_MS, help="微批处理等待窗口（毫秒）")
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help="单批最多合并的查询数")
+    parser.add_argument('--concurrency', type=int, default=LLM_CONCURRENCY, help="同时进行的大模型请求数")
+    parser.add_argument('--trace', metavar='FILE', help="把各阶段耗时（span）追加写入 JSONL 文件")
+    args = parser.parse_args()
+    if args.trace:
+        enable_trace(args.trace)
+    server = BrainServer(args.batch_window_ms, args.max_batch, args.concurrency)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("👋 服务已停止")
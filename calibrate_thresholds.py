@@ -0,0 +1,142 @@
+"""Derive relevance thresholds from the score distributions of the current index.
+
+For a sample of queries (a question file, or short snippets cut from random
+chunks when none is given) this collects:
+  - the best match score (excluding the chunk a snippet was cut from),
+  - the k-th match score,
+  - scores against random chunks, i.e. the similarity of unrelated text.
+Thresholds are then placed between these distributions: 'fair' just above
+the noise of unrelated text, 'excellent' at the upper quartile of best
+matches and 'good' halfway between. With --write they are stored in
+md_faiss_params.json of every collection, where relevance.py picks them up.
+
+    python calibrate_thresholds.py --queries questions.txt --write
+"""
+import argparse
+import time
+
+import numpy as np
+
+from brain_loader import load_index_model
+from index_factory import load_params, save_params
+from relevance import Relevance
+from shards import ShardSet
+
+PERCENTILES = (5, 25, 50, 75, 95)
+# Length of the query snippets cut from sampled chunks
+SNIPPET_CHARS = 40
+
+
+def sample_snippets(shards, n, rng):
+    """(query text, source vector id) pairs cut from random chunks."""
+    ids = shards.ids()
+    chosen = rng.choice(ids, size=min(n, len(ids)), replace=False)
+    rows = shards.get_many(chosen)
+    samples = []
+    for vec_id, entry in rows.items():
+        text = entry['content'].strip()
+        if len(text) < SNIPPET_CHARS:
+            continue
+        start = int(rng.integers(0, len(text) - SNIPPET_CHARS + 1))
+        samples.append((text[start:start + SNIPPET_CHARS], vec_id))
+    return samples
+
+
+def load_queries(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [(line.strip(), None) for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+def collect_scores(shards, model, samples, k, random_per_query, rng):
+    queries = [q for q, _ in samples]
+    vectors = model.encode(queries, batch_size=64, show_progress_bar=False, convert_to_numpy=True,
+                           normalize_embeddings=True).astype('float32')
+    D, I = shards.search(vectors, k + 1)
+    all_ids = np.array(shards.ids(), dtype='int64')
+    best, kth, noise = [], [], []
+    for q, (_, source_id) in enumerate(samples):
+        # A snippet trivially matches the chunk it was cut from, so that hit does not count
+        hits = [(i, d) for i, d in zip(I[q], D[q]) if i >= 0 and i != source_id][:k]
+        if not hits:
+            continue
+        best.append(hits[0][1])
+        kth.append(hits[-1][1])
+        unrelated = rng.choice(all_ids, size=min(random_per_query, len(all_ids)), replace=False)
+        noise.extend(shards.score_ids(vectors[q], unrelated).values())
+    return np.array(best), np.array(kth), np.array(noise)
+
+
+def derive_thresholds(relevance, best, noise):
+    """Place fair/good/excellent between the noise floor and the best-match distribution."""
+    sign = 1 if relevance.higher_is_better else -1  # work in "higher is better" space
+    fair = sign * np.percentile(sign * noise, 95)
+    excellent = sign * np.percentile(sign * best, 75)
+    median_best = sign * np.percentile(sign * best, 50)
+    if sign * median_best <= sign * fair:
+        print("⚠️  Best matches are not clearly above unrelated text; thresholds may not separate them well.")
+    good = (fair + median_best) / 2
+    # Keep the levels ordered even for odd distributions
+    good = sign * max(sign * good, sign * fair)
+    excellent = sign * max(sign * excellent, sign * good)
+    return {'excellent': round(float(excellent), 4), 'good': round(float(good), 4), 'fair': round(float(fair), 4)}
+
+
+def print_distribution(name, values):
+    cells = '  '.join(f"p{p}={np.percentile(values, p):.3f}" for p in PERCENTILES)
+    print(f"  {name:<14} n={len(values):<5} {cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate relevance thresholds from score distributions.")
+    parser.add_argument('--queries', help="question file, one per line (default: snippets from random chunks)")
+    parser.add_argument('--samples', type=int, default=200, help="number of chunk snippets when no --queries")
+    parser.add_argument('--k', type=int, default=10, help="depth of the k-th score distribution")
+    parser.add_argument('--random', type=int, default=20, help="random chunks scored per query for the noise floor")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--write', action='store_true', help="store the thresholds in every collection's params file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    shards = ShardSet()
+    params = load_params(shards.params_path) or {}
+    relevance = Relevance(params.get('metric', 'cosine'), params.get('thresholds'))
+    model = load_index_model(warmup=False, manifest_path=shards.manifest_paths[0])
+
+    samples = load_queries(args.queries) if args.queries else sample_snippets(shards, args.samples, rng)
+    print(f"Scoring {len(samples)} queries over {', '.join(shards.names)} ({relevance.describe()})...")
+    start = time.time()
+    best, kth, noise = collect_scores(shards, model, samples, args.k, args.random, rng)
+    if not len(best) or not len(noise):
+        print("Not enough data to calibrate.")
+        return
+    print(f"Done in {time.time() - start:.1f}s. Score distributions:")
+    print_distribution("best match", best)
+    print_distribution(f"match #{args.k}", kth)
+    print_distribution("unrelated", noise)
+
+    thresholds = derive_thresholds(relevance, best, noise)
+    print(f"Current:  {relevance.thresholds}")
+    print(f"Proposed: {thresholds}")
+    calibrated = Relevance(relevance.metric, thresholds)
+    levels = [calibrated.level(s) for s in best]
+    print("Best matches per level: " + ', '.join(f"{name} {levels.count(name)}"
+                                               for name in ('excellent', 'good', 'fair', 'poor')))
+    if args.write and not params:
+        print(f"{shards.params_path} not found (index built by an older version); re-run embed_and_index.py first.")
+    elif args.write:
+        # Collections share the model and metric, so one set of thresholds applies to all of them
+        for shard in shards.shards:
+            shard_params = load_params(shard.params_path)
+            if shard_params is None:
+                print(f"{shard.params_path} not found; skipped.")
+                continue
+            shard_params['metric'] = relevance.metric
+            shard_params['thresholds'] = thresholds
+            save_params(shard_params, shard.params_path)
+            print(f"Thresholds saved to {shard.params_path}")
+    else:
+        print("Run with --write to save them.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Split extracted documents into overlapping passages for chunk-level indexing.
+
+Sizes are in characters: for bge-large-zh one Chinese character is roughly
+one token, so the default 500-char chunk stays under the 512-token limit.
+Markdown is split along headings first; PDF pages and PPTX slides are
+chunked independently so a passage never spans two pages/slides.
+"""
+import re
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 80
+# Passages shorter than this (after stripping) are noise, e.g. a bare slide title
+MIN_CHUNK_CHARS = 20
+
+HEADING_RE = re.compile(r'#{1,6}\s')
+# Preferred cut points, strongest first
+_BREAKS = ('\n\n', '\n', '。', '！', '？', '；', '. ', '! ', '? ', '; ')
+
+
+def _best_break(text, lo, hi):
+    """Return a cut position in (lo, hi] just after the strongest natural boundary, or hi."""
+    for sep in _BREAKS:
+        pos = text.rfind(sep, lo, hi)
+        if pos != -1:
+            return pos + len(sep)
+    return hi
+
+
+def _overlap_start(text, lo, hi):
+    """Start the next window at the first boundary inside the overlap region, so it begins cleanly."""
+    best = None
+    for sep in _BREAKS:
+        pos = text.find(sep, lo, hi)
+        if pos != -1 and pos + len(sep) < hi and (best is None or pos + len(sep) < best):
+            best = pos + len(sep)
+    return lo if best is None else best
+
+
+def split_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Yield (offset, piece) windows of at most chunk_size chars with the given overlap."""
+    n = len(text)
+    start = 0
+    while start < n:
+        end = min(start + chunk_size, n)
+        if end < n:
+            end = _best_break(text, start + chunk_size // 2, end)
+        yield start, text[start:end]
+        if end >= n:
+            break
+        start = max(_overlap_start(text, end - overlap, end), start + 1)
+
+
+def markdown_sections(text):
+    """Return (start, end) spans of a Markdown text, split before every heading outside code fences."""
+    starts = [0]
+    pos = 0
+    in_fence = False
+    for line in text.splitlines(keepends=True):
+        if line.lstrip().startswith('```'):
+            in_fence = not in_fence
+        elif not in_fence and pos > 0 and HEADING_RE.match(line):
+            starts.append(pos)
+        pos += len(line)
+    return list(zip(starts, starts[1:] + [len(text)]))
+
+
+def _make_chunk(text, start, end, page, min_chars):
+    piece = text[start:end]
+    stripped = piece.lstrip()
+    offset = start + len(piece) - len(stripped)
+    stripped = stripped.rstrip()
+    if len(stripped) < min_chars:
+        return None
+    return {'page': page, 'offset': offset, 'content': stripped}
+
+
+def chunk_markdown(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, min_chars=MIN_CHUNK_CHARS):
+    """Chunk Markdown: small neighbouring sections are packed together, long ones are windowed."""
+    spans = []
+    buf_start = buf_end = None
+    for start, end in markdown_sections(text):
+        if end - start > chunk_size:
+            if buf_start is not None:
+                spans.append((buf_start, buf_end))
+                buf_start = None
+            spans.extend((start + off, start + off + len(piece))
+                         for off, piece in split_text(text[start:end], chunk_size, overlap))
+        elif buf_start is not None and end - buf_start <= chunk_size:
+            buf_end = end
+        else:
+            if buf_start is not None:
+                spans.append((buf_start, buf_end))
+            buf_start, buf_end = start, end
+    if buf_start is not None:
+        spans.append((buf_start, buf_end))
+
+    chunks = (_make_chunk(text, start, end, None, min_chars) for start, end in spans)
+    return [c for c in chunks if c is not None]
+
+
+def chunk_pages(pages, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, min_chars=MIN_CHUNK_CHARS):
+    """Chunk a list of (page_or_slide_number, text) units without crossing unit boundaries."""
+    chunks = []
+    for page, text in pages:
+        for off, piece in split_text(text, chunk_size, overlap):
+            chunk = _make_chunk(text, off, off + len(piece), page, min_chars)
+            if chunk is not None:
+                chunks.append(chunk)
+    return chunks
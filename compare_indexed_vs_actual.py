@@ -1,31 +1,42 @@
-import json
 import os
 
-# Load indexed file paths from metadata
-with open('md_faiss_meta.json', 'r', encoding='utf-8') as f:
-    indexed = set(entry['path'] for entry in json.load(f))
-
-# Scan all files as in verify_indexed_files.py
-SCAN_ROOTS = [
-    r"F:/My Books/Working/My Own Writings Managed by Obsidian",
-    r"F:/My Books/Working/_各读书会",
-    # r"D:/Some/Other/Path"
-]
+from file_manifest import load_manifest, diff_manifest
+from meta_store import MetaStore
+from scanner import scan_paths
+from shards import configured_shards
 
+# Scan all files as embed_and_index.py does, collection by collection (see COLLECTIONS in brain_config.py)
 all_files = set()
-for scan_root in SCAN_ROOTS:
-    for root, dirs, files in os.walk(scan_root):
-        for file in files:
-            ext = os.path.splitext(file)[1].lower()
-            if ext in ['.md', '.pdf', '.pptx']:
-                all_files.add(os.path.join(root, file))
+indexed = set()
+not_indexed, changed, indexed_but_missing = set(), [], set()
+for shard in configured_shards():
+    # Read-only check: no scan snapshot is read or written (it would create shards/<name>/)
+    shard_files = set(scan_paths(shard.roots, snapshot_path=None))
+    all_files |= shard_files
 
-not_indexed = all_files - indexed
-indexed_but_missing = indexed - all_files
+    # Prefer the file manifest written by embed_and_index.py: the same diff drives incremental updates
+    manifest = load_manifest(shard.files_path)
+    if manifest is not None:
+        new, shard_changed, unchanged, missing = diff_manifest(manifest, sorted(shard_files))
+        shard_indexed = set(manifest['files'])
+    elif os.path.exists(shard.meta_path):
+        # Load indexed file paths from metadata
+        store = MetaStore(shard.meta_path, readonly=True)
+        shard_indexed = store.paths()
+        store.close()
+        new, shard_changed, missing = shard_files - shard_indexed, [], shard_indexed - shard_files
+    else:
+        print(f"Collection {shard.name} has not been indexed yet.")
+        new, shard_changed, missing, shard_indexed = shard_files, [], set(), set()
+    indexed |= shard_indexed
+    not_indexed.update(new)
+    changed.extend(shard_changed)
+    indexed_but_missing.update(missing)
 
 print(f"Total scanned: {len(all_files)}")
 print(f"Total indexed: {len(indexed)}")
 print(f"Not indexed: {len(not_indexed)}")
+print(f"Changed since indexing: {len(changed)}")
 print(f"Indexed but missing: {len(indexed_but_missing)}")
 
 if not_indexed:
@@ -34,9 +45,17 @@ if not_indexed:
         print(f)
     if len(not_indexed) > 20:
         print(f"...and {len(not_indexed)-20} more.")
+if changed:
+    print("\nChanged since indexing:")
+    for f in changed[:20]:
+        print(f)
+    if len(changed) > 20:
+        print(f"...and {len(changed)-20} more.")
 if indexed_but_missing:
     print("\nIndexed but missing from disk:")
     for f in list(indexed_but_missing)[:20]:
         print(f)
     if len(indexed_but_missing) > 20:
         print(f"...and {len(indexed_but_missing)-20} more.")
+if not_indexed or changed or indexed_but_missing:
+    print("\nRun `python embed_and_index.py` to apply these changes incrementally.")
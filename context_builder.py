@@ -0,0 +1,166 @@
+"""Token-budgeted prompt context: deduplicated passages, best first.
+
+The retrieved passages (already ordered by relevance) are packed into the
+prompt until the token budget of the target backend is used up:
+  1. near-duplicates are dropped, e.g. the same essay exported to both .md
+     and .pdf: passages are compared by character shingles through MinHash
+     signatures, and a passage mostly contained in a better-ranked one
+     (DEDUP_THRESHOLD) is skipped,
+  2. passages are added in rank order while they fit CONTEXT_TOKEN_BUDGET;
+     the first one that does not fit is cut to the remaining budget (if at
+     least MIN_PASSAGE_TOKENS are left) and packing stops.
+
+Tokens are counted with the backend's own tokenizer when TOKENIZER_DIRS
+points at a local copy of it (loaded with transformers), otherwise
+estimated from per-backend characters-per-token ratios, rounded up.
+"""
+import math
+import os
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+# 每个后端的上下文（资料片段部分）token 预算，不含提示词模板和问题
+CONTEXT_TOKEN_BUDGET = {'ollama': 3000, 'zhipu': 6000, 'deepseek': 6000}
+# 预算不足以放下整段时，剩余 token 至少这么多才截断放入
+MIN_PASSAGE_TOKENS = 80
+# 近似估算：每个中日韩字符约多少 token（qwen/glm/deepseek 分词器的经验值）
+TOKENS_PER_CJK = {'ollama': 0.75, 'zhipu': 0.75, 'deepseek': 0.65}
+# 英文单词、数字串和其他符号
+TOKENS_PER_WORD = 1.3
+# 可选：后端分词器的本地目录（含 tokenizer.json），用于精确计数；None = 估算
+TOKENIZER_DIRS = {'ollama': None, 'zhipu': None, 'deepseek': None}
+
+# 去重：字符 shingle 长度、MinHash 签名长度，以及被更相关片段包含的比例阈值
+SHINGLE_SIZE = 5
+MINHASH_PERMUTATIONS = 64
+DEDUP_THRESHOLD = 0.8
+
+_CJK = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+_WORD = re.compile(r'[A-Za-z]+|\d+|[^\sA-Za-z\d\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+_NOISE = re.compile(r'[\s\W_]+')
+
+# Multiply-shift hash family (random odd multipliers, arithmetic modulo 2**64), one per permutation
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(0, 1 << 63, MINHASH_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.integers(0, 1 << 63, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+@lru_cache(maxsize=None)
+def _tokenizer(backend):
+    path = TOKENIZER_DIRS.get(backend)
+    if not path or not os.path.isdir(path):
+        return None
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(path)
+
+
+def count_tokens(text, backend='ollama'):
+    """Tokens of `text` for the backend: exact with its tokenizer, else a rounded-up estimate."""
+    tokenizer = _tokenizer(backend)
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+    cjk = len(_CJK.findall(text))
+    words = len(_WORD.findall(text))
+    return math.ceil(cjk * TOKENS_PER_CJK.get(backend, 1.0) + words * TOKENS_PER_WORD)
+
+
+def truncate_to_tokens(text, max_tokens, backend='ollama'):
+    """Longest prefix of `text` that fits max_tokens."""
+    if count_tokens(text, backend) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid], backend) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Hashed character n-grams of the text without whitespace and punctuation."""
+    text = _NOISE.sub('', text.lower())
+    return {zlib.crc32(text[i:i + size].encode('utf-8')) for i in range(len(text) - size + 1)}
+
+
+def minhash(shingle_set):
+    values = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+    return ((values[:, None] * _A + _B) >> np.uint64(32)).min(axis=0)
+
+
+def containment(sig_a, size_a, sig_b, size_b):
+    """Estimated share of the smaller shingle set that also occurs in the other one."""
+    jaccard = float(np.mean(sig_a == sig_b))
+    shared = jaccard / (1 + jaccard) * (size_a + size_b)
+    return shared / min(size_a, size_b)
+
+
+def dedupe(docs, threshold=DEDUP_THRESHOLD):
+    """Docs without those mostly contained in a better-ranked one; returns (kept, dropped)."""
+    kept, dropped, signatures = [], [], []
+    for d in docs:
+        sh = shingles(d['content'])
+        if not sh:
+            kept.append(d)
+            continue
+        sig = minhash(sh)
+        if any(containment(sig, len(sh), other, n) >= threshold for other, n in signatures):
+            dropped.append(d)
+            continue
+        signatures.append((sig, len(sh)))
+        kept.append(d)
+    return kept, dropped
+
+
+def render_passage(n, label, content):
+    return f"【片段{n}】\n来源文件：{label}\n内容：{content}"
+
+
+def build_context(docs, backend='ollama', budget=None, label=None):
+    """Pack ranked docs into a context string within the token budget.
+
+    Returns (context, used docs, info); info has 'tokens', 'budget',
+    'duplicates', 'truncated' and 'over_budget' (passages left out).
+    """
+    budget = budget or CONTEXT_TOKEN_BUDGET.get(backend, min(CONTEXT_TOKEN_BUDGET.values()))
+    label = label or (lambda d: os.path.basename(d['path']))
+    candidates, duplicates = dedupe(docs)
+    parts, used = [], []
+    tokens, truncated = 0, False
+    separator = count_tokens("\n\n", backend)
+    for d in candidates:
+        n = len(used) + 1
+        part = render_passage(n, label(d), d['content'])
+        cost = count_tokens(part, backend) + (separator if parts else 0)
+        if tokens + cost > budget:
+            remaining = budget - tokens - (separator if parts else 0) - count_tokens(render_passage(n, label(d), ''), backend)
+            if remaining >= MIN_PASSAGE_TOKENS:
+                content = truncate_to_tokens(d['content'], remaining, backend)
+                part = render_passage(n, label(d), content)
+                parts.append(part)
+                used.append(dict(d, content=content))
+                tokens += count_tokens(part, backend) + (separator if len(parts) > 1 else 0)
+                truncated = True
+            break
+        parts.append(part)
+        used.append(d)
+        tokens += cost
+    info = {'tokens': tokens, 'budget': budget, 'duplicates': len(duplicates), 'truncated': truncated,
+            'over_budget': len(candidates) - len(used)}
+    return "\n\n".join(parts), used, info
+
+
+def describe(info):
+    """One-line summary for the REPL, or '' when nothing was dropped."""
+    notes = []
+    if info['duplicates']:
+        notes.append(f"去除{info['duplicates']}个重复片段")
+    if info['over_budget'] or info['truncated']:
+        notes.append(f"超出预算略去{info['over_budget']}个" + ("（截断1个）" if info['truncated'] else ""))
+    if not notes:
+        return ''
+    return f"🧹 上下文约{info['tokens']} tokens（预算{info['budget']}），" + "，".join(notes)
@@ -0,0 +1,207 @@
+"""Document extraction for the indexer: read .md/.pdf/.pptx files and chunk them.
+
+Extraction runs in a process pool so PDF/PPTX parsing uses all cores and
+overlaps with embedding in the main process; results are streamed back as
+files finish. A file that a worker has been extracting for longer than
+the per-file timeout (e.g. a corrupt PDF that hangs PyMuPDF) is skipped:
+its worker is terminated and the pool is restarted. A worker that dies
+(a crash or out of memory in a parser) also breaks the pool; it is
+restarted for the unfinished files, and a file that was being extracted
+during two such crashes is reported as failed.
+
+The pages and slides of PDF/PPTX files are cached by content hash (see
+extract_cache.py), so unchanged documents are only parsed once and a
+rebuild with new chunk settings just re-chunks the cached text.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz  # PyMuPDF
+import pptx
+from pptx import Presentation
+
+from brain_config import EXTRACT_CACHE_DIR
+from chunker import CHUNK_SIZE, CHUNK_OVERLAP, chunk_markdown, chunk_pages
+from extract_cache import ExtractCache
+from file_manifest import hash_file
+
+# Markdown 少于该字符数视为过短，不入索引
+MIN_MD_CHARS = 300
+# 提取进程数（None = CPU核数）
+EXTRACT_WORKERS = None
+# 单个文件提取超时（秒），超时的文件被跳过
+EXTRACT_TIMEOUT = 120
+# 修改 PDF/PPTX 文本提取逻辑后加一，使提取缓存失效
+EXTRACTOR_VERSION = 1
+# Cache entries are keyed by these, so a PyMuPDF / python-pptx upgrade also re-extracts
+EXTRACTORS = {
+    'pdf': f"pymupdf-{fitz.VersionBind}-v{EXTRACTOR_VERSION}",
+    'pptx': f"python-pptx-{pptx.__version__}-v{EXTRACTOR_VERSION}",
+}
+
+
+# Helper to extract text from PPTX, one entry per slide (1-based slide numbers)
+def _read_slides(pptx_path):
+    prs = Presentation(pptx_path)
+    slides = []
+    for number, slide in enumerate(prs.slides, 1):
+        texts = [shape.text for shape in slide.shapes if hasattr(shape, "text")]
+        slides.append((number, "\n".join(texts)))
+    return slides
+
+
+# Helper to extract text from PDF, one entry per page (1-based page numbers)
+def _read_pages(pdf_path):
+    with fitz.open(pdf_path) as doc:
+        return [(number, page.get_text()) for number, page in enumerate(doc, 1)]
+
+
+def extract_units(path, doc_type, cache_dir=EXTRACT_CACHE_DIR):
+    """([(page or slide number, text)], sha1) of a PDF/PPTX, from the extraction cache when possible.
+
+    cache_dir=None parses the file without the cache. A file that fails to
+    parse raises and is not cached, so the indexer retries it next run. The
+    content hash is returned so the manifest does not read the file again.
+    """
+    read = _read_pages if doc_type == 'pdf' else _read_slides
+    sha1 = hash_file(path)
+    if cache_dir is None:
+        return read(path), sha1
+    cache = ExtractCache(cache_dir)
+    units = cache.get(sha1, doc_type, EXTRACTORS[doc_type])
+    if units is None:
+        units = read(path)
+        try:
+            cache.put(sha1, doc_type, EXTRACTORS[doc_type], units, source=path)
+        except OSError as e:
+            print(f"Error caching extracted text of {path}: {e}")
+    return units, sha1
+
+
+def extract_document(path, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, min_md_chars=MIN_MD_CHARS,
+                     cache_dir=EXTRACT_CACHE_DIR):
+    """Extract and chunk one file; returns (chunk entries, sha1 of the file). No chunks if skipped.
+
+    Errors reading or parsing the file are raised, so the caller can retry it later.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.md':
+        with open(path, 'rb') as f:
+            data = f.read()
+        sha1 = hashlib.sha1(data).hexdigest()
+        content = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8').read()  # same newline handling as open()
+        content_stripped = content.strip()
+        if len(content_stripped) < min_md_chars:
+            print(f"[跳过过短md] {path} ({len(content_stripped)} chars)")
+            return [], sha1
+        doc_type = 'md'
+        chunks = chunk_markdown(content, chunk_size, overlap)
+    else:
+        doc_type = 'pdf' if ext == '.pdf' else 'pptx'
+        units, sha1 = extract_units(path, doc_type, cache_dir)
+        chunks = chunk_pages(units, chunk_size, overlap)
+    # page: PDF page / PPTX slide number (None for md); offset: char offset within that page/slide/file
+    return [{'path': path, 'type': doc_type, 'page': c['page'], 'offset': c['offset'], 'content': c['content']}
+            for c in chunks], sha1
+
+
+_started = None  # worker side: shared {path: (pid, start time)} of the files being extracted
+
+
+def _init_worker(started):
+    global _started
+    _started = started
+
+
+def _extract_in_worker(path, *args):
+    # The timeout clock starts here, when a worker actually begins the file (not when it is queued)
+    _started[path] = (os.getpid(), time.time())
+    try:
+        return extract_document(path, *args)
+    finally:
+        _started.pop(path, None)
+
+
+def _kill_workers(executor, started, paths):
+    # A hung worker cannot be cancelled, only terminated; the pool then counts as broken
+    # and shuts down its remaining workers itself
+    for path in paths:
+        pid = started.get(path, (None,))[0]
+        if pid is not None:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass  # finished in the meantime
+    executor.shutdown(wait=False)
+
+
+def iter_documents(paths, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP,
+                   workers=EXTRACT_WORKERS, timeout=EXTRACT_TIMEOUT, cache_dir=EXTRACT_CACHE_DIR):
+    """Extract paths in a process pool, yielding (path, chunks, sha1) in completion order.
+
+    Files that exceed `timeout` seconds yield no chunks and sha1 None; the
+    timeout clock starts when a worker picks the file up, not at submit.
+    Files whose extraction failed (an error, or a worker crash) yield
+    chunks None, so the caller does not record them and retries them later.
+    """
+    remaining = list(paths)
+    crashes = {}  # path -> pool crashes while it was being extracted
+    with multiprocessing.Manager() as manager:
+        started = manager.dict()
+        while remaining:
+            started.clear()
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(started,))
+            pending = {}
+            for path in remaining:
+                future = executor.submit(_extract_in_worker, path, chunk_size, overlap, MIN_MD_CHARS, cache_dir)
+                pending[future] = path
+            hung, broken = None, False
+            try:
+                while pending and hung is None and not broken:
+                    done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            chunks, sha1 = future.result()
+                        except BrokenProcessPool:
+                            broken = True  # a worker died: every unfinished future fails the same way
+                            continue
+                        except Exception as e:
+                            path = pending.pop(future)
+                            print(f"Error extracting {path}: {e}")
+                            yield path, None, None
+                            continue
+                        yield pending.pop(future), chunks, sha1
+                    now = time.time()
+                    for path, (_, start) in started.copy().items():
+                        if now - start > timeout and path in pending.values():
+                            hung = path
+                            break
+                in_flight = set(started.copy()) & set(pending.values())
+            finally:
+                if hung is None and not broken and not pending:
+                    executor.shutdown()
+                else:
+                    _kill_workers(executor, started.copy(), [hung] if hung else pending.values())
+            if hung is not None:
+                print(f"[提取超时，跳过] {hung} (>{timeout}s)")
+                yield hung, [], None
+                failed = {hung}
+            elif broken:
+                # The crashing file is among those in flight; one that was in flight twice is given up on
+                for path in in_flight or pending.values():
+                    crashes[path] = crashes.get(path, 0) + 1
+                failed = {path for path in pending.values() if crashes.get(path, 0) >= 2}
+                print(f"⚠️  提取进程异常退出，重启进程池（{len(pending)} 个文件待提取）")
+                for path in sorted(failed):
+                    print(f"Error extracting {path}: worker process crashed")
+                    yield path, None, None
+            else:
+                break
+            # Restart the pool for everything that had not finished; in-flight files are redone
+            remaining = [path for path in pending.values() if path not in failed]
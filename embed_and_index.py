@@ -1,124 +1,448 @@
-import json
+import argparse
 import os
+import sqlite3
+import time
 from tqdm import tqdm
 from sentence_transformers import SentenceTransformer
 import numpy as np
 import faiss
 
-import fitz  # PyMuPDF
-from pptx import Presentation
+from chunker import CHUNK_SIZE, CHUNK_OVERLAP, MIN_CHUNK_CHARS
+from doc_extract import iter_documents
+from meta_store import MetaStore
+from lexical_index import LexicalIndex
+from embed_cache import EmbeddingCache, content_hash, model_id_for
+from extract_cache import ExtractCache
+from index_factory import (INDEX_TYPES, METRIC, make_params, new_index, needs_training, build_index,
+                           remove_ids, reconstruct_vectors, apply_search_params, load_params, save_params, index_ids,
+                           QUERY_PARAMS, changed_build_params)
+from brain_config import SCAN_ROOTS, EMBED_MODEL_DIR, EXTRACT_CACHE_DIR
+from file_manifest import empty_manifest, load_manifest, save_manifest, diff_manifest, file_entry
+from index_manifest import build_manifest, load_index_manifest, save_index_manifest, model_fingerprint
+from scanner import scan_paths
+from shards import select_shards, legacy_shard
 
-# Helper to extract text from PPTX
-def extract_text_from_pptx(pptx_path):
+# === 配置区 ===
+# 扫描目录 SCAN_ROOTS、集合划分 COLLECTIONS 及索引文件路径见 brain_config.py / shards.py
+
+# 文件提取（进程池、超时、过短md阈值）的配置见 doc_extract.py
+# 每个片段的字符数与相邻片段重叠字符数（默认值见 chunker.py）
+EMBED_CHUNK_SIZE = CHUNK_SIZE
+EMBED_CHUNK_OVERLAP = CHUNK_OVERLAP
+# 每批送入模型的文本数；CPU上32左右较均衡，GPU可调大
+EMBED_BATCH_SIZE = 32
+# Torch intra-op threads for encoding (None = all CPU cores)
+EMBED_THREADS = None
+# 提取结果累计到这么多片段就送去编码，使提取与编码重叠进行
+EMBED_FLUSH_CHUNKS = 512
+
+
+def new_embed_stats():
+    return {'texts': 0, 'tokens': 0, 'padded_tokens': 0, 'seconds': 0.0, 'cache_hits': 0}
+
+
+def print_embed_stats(stats, batch_size=EMBED_BATCH_SIZE):
+    if stats['texts']:
+        import torch
+        elapsed = max(stats['seconds'], 1e-9)
+        waste = 1 - stats['tokens'] / stats['padded_tokens'] if stats['padded_tokens'] else 0.0
+        print(f"Embedded {stats['texts']} chunks in {elapsed:.1f}s: "
+              f"{stats['texts'] / elapsed:.1f} chunks/sec, {stats['tokens'] / elapsed:.0f} tokens/sec "
+              f"(batch={batch_size}, threads={torch.get_num_threads()}, padding waste {waste:.1%})")
+    if stats.get('cache_hits'):
+        print(f"Embedding cache: {stats['cache_hits']} chunks reused without encoding")
+
+
+def embed_texts(model, texts, batch_size=EMBED_BATCH_SIZE, num_threads=EMBED_THREADS, stats=None):
+    """Encode texts in length-sorted batches and return normalized embeddings in input order.
+
+    Texts are bucketed by token length so each batch pads to a similar length,
+    instead of running one batch-size-1 forward pass per document. Pass a
+    `stats` dict (see new_embed_stats) to accumulate throughput over several
+    calls instead of printing a report and progress bar for this call.
+    """
+    dimension = model.get_sentence_embedding_dimension()
+    if not texts:
+        return np.zeros((0, dimension), dtype='float32')
+
+    import torch
+    torch.set_num_threads(num_threads or os.cpu_count() or 1)
+
+    # Token lengths (capped at the model's max sequence length, like encode() does)
+    max_len = model.max_seq_length
+    token_ids = model.tokenizer(list(texts), add_special_tokens=True, truncation=True, max_length=max_len)['input_ids']
+    lengths = [len(ids) for ids in token_ids]
+    order = sorted(range(len(texts)), key=lambda i: lengths[i], reverse=True)
+
+    report = stats is None
+    if report:
+        stats = new_embed_stats()
+    embeddings = np.zeros((len(texts), dimension), dtype='float32')
+    start = time.time()
+    with tqdm(total=len(texts), desc='Embedding chunks', unit='chunk', disable=not report) as bar:
+        for b in range(0, len(order), batch_size):
+            batch_idx = order[b:b + batch_size]
+            batch = [texts[i] for i in batch_idx]
+            embeddings[batch_idx] = model.encode(
+                batch,
+                batch_size=len(batch),
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=True,  # normalize for cosine
+            )
+            stats['padded_tokens'] += lengths[batch_idx[0]] * len(batch_idx)
+            bar.update(len(batch_idx))
+    stats['seconds'] += time.time() - start
+    stats['texts'] += len(texts)
+    stats['tokens'] += sum(lengths)
+
+    if report:
+        print_embed_stats(stats, batch_size)
+    return embeddings
+
+
+def embed_with_cache(get_model, texts, cache, model_id, stats=None):
+    """Like embed_texts(), but vectors found in the embedding cache are not re-encoded.
+
+    `get_model` is called only when there are cache misses, so a run that is
+    all hits (renamed/moved files) never loads the model.
+    """
+    if cache is None:
+        return embed_texts(get_model(), texts, stats=stats)
+    hashes = [content_hash(t) for t in texts]
+    cached = cache.get_many(model_id, True, hashes)
+    misses = [i for i, h in enumerate(hashes) if h not in cached]
+    if misses:
+        encoded = embed_texts(get_model(), [texts[i] for i in misses], stats=stats)
+        cache.put_many(model_id, True, [hashes[i] for i in misses], encoded)
+        dimension = encoded.shape[1]
+    else:
+        dimension = len(next(iter(cached.values())))
+    embeddings = np.zeros((len(texts), dimension), dtype='float32')
+    for i, h in enumerate(hashes):
+        if h in cached:
+            embeddings[i] = cached[h]
+    if misses:
+        embeddings[misses] = encoded
+    if stats is not None:
+        stats['cache_hits'] += len(texts) - len(misses)
+    return embeddings
+
+
+def scan_files(scan_roots=SCAN_ROOTS, snapshot_path=None):
+    """Return all .md/.pdf/.pptx paths under the scan roots (see scanner.py for excludes and the snapshot)."""
+    return scan_paths(scan_roots, snapshot_path=snapshot_path)
+
+
+def chunker_settings():
+    return {'chunk_size': EMBED_CHUNK_SIZE, 'chunk_overlap': EMBED_CHUNK_OVERLAP, 'min_chunk_chars': MIN_CHUNK_CHARS}
+
+
+def load_existing_index(shard, index_type=None, fingerprint=None, chunker=None, index_params=None):
+    """Load index, file manifest, index params and index manifest for an incremental run, or None if unusable.
+
+    Vectors from another model (or chunks cut differently) cannot be mixed
+    with the existing ones, so a change of either forces a full rebuild, as
+    does a new build parameter (nlist, hnsw_m, pq_m) for the index type.
+    """
+    manifest = load_manifest(shard.files_path)
+    if manifest is None or not shard.built:
+        return None
+    index = faiss.read_index(shard.index_path)
+    params = load_params(shard.params_path)
+    if params is None:
+        if not isinstance(index, faiss.IndexIDMap):
+            print("Existing index has no ID map (built by an older version); doing a full rebuild.")
+            return None
+        params = make_params('flat')
+    if index_type and index_type != params['kind']:
+        print(f"Switching index type {params['kind']} -> {index_type}; doing a full rebuild.")
+        return None
+    changed = changed_build_params(params, index_params or {})
+    if changed:
+        print(f"Index build parameters changed ({', '.join(f'{k}: {a} -> {b}' for k, (a, b) in changed.items())}); "
+              f"doing a full rebuild.")
+        return None
+    index_info = load_index_manifest(shard.manifest_path)
+    if index_info is not None and index_info['model']['hash'] != fingerprint:
+        print(f"Index was built with a different embedding model ({index_info['model']['name']}, "
+              f"now {model_id_for(EMBED_MODEL_DIR)}); doing a full rebuild.")
+        return None
+    if index_info is not None and index_info['chunker'] != chunker:
+        print(f"Chunker settings changed ({index_info['chunker']} -> {chunker}); doing a full rebuild.")
+        return None
+    return index, manifest, params, index_info
+
+
+def unrecorded(index, manifest, store):
+    """(row IDs, vector IDs) of chunks the file manifest does not list.
+
+    Generations are published complete (see shards.py), but an index written
+    in place by an older version may hold rows and vectors of an interrupted
+    run, whose files are embedded again under new IDs.
+    """
+    recorded = {i for entry in manifest['files'].values() for i in entry['ids']}
+    orphan_rows = [i for i in store.ids() if i not in recorded]
+    orphan_vectors = [int(i) for i in index_ids(index) if int(i) not in recorded]
+    return orphan_rows, orphan_vectors
+
+
+def drop_unrecorded(index, manifest, store, lexical, params):
+    """Remove chunks and vectors the file manifest does not list; returns the index."""
+    recorded = {i for entry in manifest['files'].values() for i in entry['ids']}
+    orphan_rows, orphan_vectors = unrecorded(index, manifest, store)
+    if orphan_rows:
+        rows = store.get_many(orphan_rows)
+        lexical.delete_many(list(rows), [row['content'] for row in rows.values()])
+        store.delete_ids(orphan_rows)
+    if orphan_vectors:
+        index = remove_ids(index, orphan_vectors, sorted(recorded), params)
+    if orphan_rows or orphan_vectors:
+        print(f"Removed {len(orphan_rows)} chunks and {len(orphan_vectors)} vectors left over from an interrupted run.")
+    return index
+
+
+def stores_current(shard, index, manifest):
+    """True when the shard's metadata and BM25 index hold exactly the chunks of its manifest and index."""
+    try:
+        store = MetaStore(shard.meta_path, readonly=True)
+    except FileNotFoundError:
+        return False
     try:
-        prs = Presentation(pptx_path)
-        text = ""
-        for slide in prs.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text += shape.text + "\n"
-        return text
-    except Exception as e:
-        print(f"Error reading PPTX {pptx_path}: {e}")
-        return ""
-
-# Helper to extract text from PDF
-def extract_text_from_pdf(pdf_path):
+        lexical = LexicalIndex(shard.lexical_path, readonly=True)
+    except FileNotFoundError:
+        store.close()
+        return False
     try:
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        return text
-    except Exception as e:
-        print(f"Error reading PDF {pdf_path}: {e}")
-        return ""
+        return lexical.is_current(store.count()) and unrecorded(index, manifest, store) == ([], [])
+    finally:
+        store.close()
+        lexical.close()
 
 
-# === 配置区 ===
-# 指定要扫描的多个根目录（直接在此处硬编码路径，按需修改）
-SCAN_ROOTS = [
-    r"F:/My Books/Working/My Own Writings Managed by Obsidian",  # 主目录
-    r"F:/My Books/Working/_各读书会",  # 示例：添加更多目录
-    # r"D:/Some/Other/Path"        # 示例：再加一个目录
-]
-
-# === 扫描文件 ===
-md_files = []
-pdf_files = []
-pptx_files = []
-for scan_root in SCAN_ROOTS:
-    for root, dirs, files in os.walk(scan_root):
-        for file in files:
-            if file.endswith('.md'):
-                md_files.append(os.path.join(root, file))
-            elif file.endswith('.pdf'):
-                pdf_files.append(os.path.join(root, file))
-            elif file.endswith('.pptx'):
-                pptx_files.append(os.path.join(root, file))
-
-# Unified progress indicator for all file types
-md_data = []
-pdf_data = []
-pptx_data = []
-total_md = len(md_files)
-total_pdf = len(pdf_files)
-total_pptx = len(pptx_files)
-md_done = pdf_done = pptx_done = 0
-def print_progress():
-    print(f"processing {md_done}/{total_md} md files, {pdf_done}/{total_pdf} pdf files, {pptx_done}/{total_pptx} pptx files", end='\r')
-print_progress()
-for path in md_files:
+def copy_sqlite(path, new_path):
+    """Copy a SQLite database with the backup API (consistent even while search processes read it)."""
+    source = sqlite3.connect(path)
+    target = sqlite3.connect(new_path)
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        content_stripped = content.strip()
-        if len(content_stripped) >= 300:
-            md_data.append({'path': path, 'content': content, 'type': 'md'})
-        else:
-            print(f"[跳过过短md] {path} ({len(content_stripped)} chars)")
-    except Exception as e:
-        print(f"Error reading {path}: {e}")
-    md_done += 1
-    print_progress()
-for path in pdf_files:
-    content = extract_text_from_pdf(path)
-    if content.strip():
-        pdf_data.append({'path': path, 'content': content, 'type': 'pdf'})
-    pdf_done += 1
-    print_progress()
-for path in pptx_files:
-    content = extract_text_from_pptx(path)
-    if content.strip():
-        pptx_data.append({'path': path, 'content': content, 'type': 'pptx'})
-    pptx_done += 1
-    print_progress()
-print()  # Newline after progress
-
-# Combine all data
-all_data = md_data + pdf_data + pptx_data
-
-# --- Model selection: use local bge-large-zh model ---
-model = SentenceTransformer(os.path.join(os.path.dirname(__file__), 'models', 'bge-large-zh'))
-
-# Generate embeddings for each document (using the content field) with progress indicator
-embeddings = []
-for i, doc in enumerate(tqdm(all_data, desc='Embedding documents', unit='doc')):
-    emb = model.encode(doc['content'], show_progress_bar=True, normalize_embeddings=True)  # normalize for cosine
-    embeddings.append(emb)
-    if (i + 1) % 10 == 0 or (i + 1) == len(all_data):
-        print(f"Embedded {i + 1}/{len(all_data)} documents", end='\r')
-embeddings = np.vstack(embeddings)
-
-# --- Use FAISS IndexFlatIP for cosine similarity ---
-dimension = embeddings.shape[1]
-index = faiss.IndexFlatIP(dimension)  # Inner Product = Cosine if normalized
-index.add(embeddings)
-
-# Save FAISS index and metadata
-faiss.write_index(index, os.path.join(os.path.dirname(__file__), 'md_faiss.index'))
-with open(os.path.join(os.path.dirname(__file__), 'md_faiss_meta.json'), 'w', encoding='utf-8') as f:
-    json.dump(all_data, f, ensure_ascii=False, indent=2)
-
-print(f"Indexed {len(all_data)} documents (md + pdf + pptx) with dimension {dimension}.")
-print("FAISS index and metadata saved.")
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def model_loader(model_dir=EMBED_MODEL_DIR):
+    """get_model() that loads the embedding model on first call and keeps it for later ones."""
+    model = None
+
+    def get_model():
+        nonlocal model
+        if model is None:
+            # --- Model selection: use local bge-large-zh model ---
+            model = SentenceTransformer(model_dir)
+        return model
+
+    return get_model
+
+
+def main(full=False, index_type=None, use_cache=True, collections=None, use_extract_cache=True, **index_params):
+    """Update (or with full=True rebuild) the shard of every collection, or only of the named ones."""
+    shards = select_shards(collections)
+    get_model = model_loader()
+    fingerprint = model_fingerprint(EMBED_MODEL_DIR)
+    chunker = chunker_settings()
+    cache = EmbeddingCache() if use_cache else None  # shared: a chunk moved between collections is not re-encoded
+    extract_cache_dir = EXTRACT_CACHE_DIR if use_extract_cache else None
+    for shard in shards:
+        print(f"=== Collection {shard.name}: {', '.join(shard.roots)} ===")
+        index_shard(shard, get_model, fingerprint, chunker, cache, full, index_type, index_params, extract_cache_dir)
+    if cache is not None:
+        cache.close()
+    if extract_cache_dir is not None:
+        ExtractCache(extract_cache_dir).evict()
+    if legacy_shard().built:
+        print("Note: search now uses the per-collection indexes in shards/; the single index in the repo folder "
+              "(md_faiss.index, md_faiss_meta.sqlite, ...) is no longer read and can be deleted.")
+
+
+def index_shard(shard, get_model, fingerprint, chunker, cache, full=False, index_type=None, index_params=None,
+                extract_cache_dir=EXTRACT_CACHE_DIR):
+    """Incrementally update one collection's index, metadata, BM25 index and manifests.
+
+    Changes are written to a copy of the current generation, which is
+    published in one step at the end (see shards.py); an interrupted run
+    leaves the current generation untouched. PDF/PPTX text comes from the
+    extraction cache in extract_cache_dir (None: always parse).
+    """
+    index_params = index_params or {}
+    os.makedirs(shard.directory, exist_ok=True)
+    paths = scan_files(shard.roots, shard.scan_path)
+    existing = None if full else load_existing_index(shard, index_type, fingerprint, chunker, index_params)
+    if existing is not None and existing[3] is None:
+        # No index manifest (older version): only the dimension can tell whether the current model built it
+        dimension = get_model().get_sentence_embedding_dimension()
+        if existing[0].d != dimension:
+            print(f"Existing index has dimension {existing[0].d}, {model_id_for(EMBED_MODEL_DIR)} produces "
+                  f"{dimension}; doing a full rebuild.")
+            existing = None
+    if existing is None:
+        index, manifest, index_info = None, empty_manifest(), None
+        # A rebuild keeps the current index type unless another one is asked for
+        params = make_params(index_type or (load_params(shard.params_path) or {}).get('kind', 'flat'), **index_params)
+    else:
+        index, manifest, params, index_info = existing
+        # Query-time knobs (nprobe, ef_search, rescore_factor) may be changed without a rebuild
+        params.update({k: v for k, v in index_params.items() if v is not None and k in QUERY_PARAMS})
+        params.setdefault('metric', METRIC)  # params files written before the metric was recorded
+        apply_search_params(index, params)
+
+    new, changed, unchanged, deleted = diff_manifest(manifest, paths)
+    print(f"Scanned {len(paths)} files: {len(new)} new, {len(changed)} changed, "
+          f"{len(unchanged)} unchanged, {len(deleted)} deleted")
+    if index is not None and not (new or changed or deleted) and stores_current(shard, index, manifest):
+        # Only small JSON files change: updated in place (atomically) instead of a new generation
+        save_manifest(manifest, shard.files_path)  # may carry refreshed mtimes
+        save_params(params, shard.params_path)  # may carry new query-time knobs
+        if index_info is None:
+            save_index_manifest(build_manifest(EMBED_MODEL_DIR, index.d, True, params['metric'], chunker,
+                                               params['kind'], index.ntotal), shard.manifest_path)
+        print("Index is up to date.")
+        return
+
+    generation = shard.new_generation()
+    target = shard.at(generation)
+    # The metadata store is copied even for a rebuild: its ID high-water mark keeps new IDs unused
+    if os.path.exists(shard.meta_path):
+        copy_sqlite(shard.meta_path, target.meta_path)
+    if index is not None and os.path.exists(shard.lexical_path):
+        copy_sqlite(shard.lexical_path, target.lexical_path)
+    store = MetaStore(target.meta_path)
+    lexical = LexicalIndex(target.lexical_path)
+    if index is None:
+        store.clear()
+        lexical.clear()
+    else:
+        index = drop_unrecorded(index, manifest, store, lexical, params)
+
+    # Drop vectors and metadata rows of changed and deleted files
+    stale_ids = [i for path in changed + deleted for i in manifest['files'].pop(path)['ids']]
+    if stale_ids and index is not None:
+        keep_ids = [i for entry in manifest['files'].values() for i in entry['ids']]
+        index = remove_ids(index, stale_ids, keep_ids, params)
+        stale_rows = store.get_many(stale_ids)
+        lexical.delete_many(list(stale_rows), [row['content'] for row in stale_rows.values()])
+        store.delete_ids(stale_ids)
+
+    # The keyword index must cover exactly the stored chunks (also builds it for indexes made before it existed)
+    if not lexical.is_current(store.count()):
+        print("Rebuilding lexical (BM25) index from the metadata store...")
+        lexical.rebuild(store.iter_entries())
+
+    to_embed = new + changed
+    staged = False
+    # IDs come from the shard's own range, so they stay unique across collections
+    next_id = max(store.next_id(), shard.id_base)
+    embed_stats = new_embed_stats()
+    model_id = model_id_for(EMBED_MODEL_DIR, fingerprint)  # cache namespace: new model files get new vectors
+    ids_by_path = {}
+    sha1_by_path = {}  # content hashes computed by the extraction workers
+    buffer = []
+
+    def flush():
+        # Embed the buffered chunks and append them to the index
+        nonlocal index, next_id, staged
+        embeddings = None
+        if buffer:
+            # Generate embeddings for the chunks (using the content field): cache first, then length-sorted batches
+            embeddings = embed_with_cache(get_model, [chunk['content'] for chunk in buffer], cache, model_id, embed_stats)
+        if index is None:
+            # --- Inner Product = Cosine on normalized vectors; index type per index_factory.py ---
+            # Trainable types (IVF/PQ) are staged in a flat index and trained once all vectors are in
+            dimension = embeddings.shape[1] if embeddings is not None else get_model().get_sentence_embedding_dimension()
+            staged = needs_training(params['kind'])
+            index = new_index('flat' if staged else params['kind'], dimension, params)
+        if not buffer:
+            return
+        # Vector IDs double as the metadata store's row IDs
+        ids = np.arange(next_id, next_id + len(buffer), dtype='int64')
+        next_id += len(buffer)
+        index.add_with_ids(embeddings, ids)
+        store.add_many(ids, buffer)
+        lexical.add_many(ids, [chunk['content'] for chunk in buffer])
+        for chunk, vec_id in zip(buffer, ids):
+            ids_by_path[chunk['path']].append(int(vec_id))
+        buffer.clear()
+
+    # Extraction runs in worker processes; chunks are embedded here as files complete
+    files_done, failed = 0, 0
+    for path, chunks, sha1 in iter_documents(to_embed, EMBED_CHUNK_SIZE, EMBED_CHUNK_OVERLAP,
+                                             cache_dir=extract_cache_dir):
+        files_done += 1
+        if chunks is None:
+            failed += 1  # not recorded in the manifest, so it is extracted again next run
+            continue
+        ids_by_path[path] = []
+        sha1_by_path[path] = sha1
+        buffer.extend(chunks)
+        if len(buffer) >= EMBED_FLUSH_CHUNKS:
+            flush()
+        print(f"extracted {files_done}/{len(to_embed)} files, embedded {embed_stats['texts']} chunks "
+              f"({embed_stats['cache_hits']} from cache)", end='\r')
+    if buffer or index is None:
+        flush()
+    print()  # Newline after progress
+    if embed_stats['texts'] or embed_stats['cache_hits']:
+        print_embed_stats(embed_stats)
+    if failed:
+        print(f"⚠️  {failed} files could not be extracted; they are retried on the next run")
+
+    # One ID per chunk; skipped files (too short, timed out) are recorded with no IDs so they are not re-extracted
+    for path, path_ids in ids_by_path.items():
+        try:
+            manifest['files'][path] = file_entry(path, path_ids, sha1=sha1_by_path[path])
+        except OSError as e:
+            print(f"Error reading {path}: {e}")
+
+    if staged:
+        ids = faiss.vector_to_array(index.id_map)
+        print(f"Training {params['kind']} index on a sample of {len(ids)} vectors...")
+        index = build_index(params['kind'], reconstruct_vectors(index, ids), ids, params)
+
+    # Save FAISS index, metadata and manifests into the new generation, then publish it
+    faiss.write_index(index, target.index_path)
+    store.commit()
+    store.close()
+    lexical.close()
+    save_params(params, target.params_path)
+    # Search scripts load the model recorded here and refuse an index it did not build
+    save_index_manifest(build_manifest(EMBED_MODEL_DIR, index.d, True, params['metric'], chunker,
+                                       params['kind'], index.ntotal), target.manifest_path)
+    save_manifest(manifest, target.files_path)
+    shard.publish(generation)
+
+    print(f"Embedded {embed_stats['texts'] + embed_stats['cache_hits']} chunks from {sum(bool(i) for i in ids_by_path.values())} files (md + pdf + pptx); {params['kind']} index now holds {index.ntotal} vectors with dimension {index.d}.")
+    print("FAISS index, metadata and lexical index saved.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Embed and index the knowledge base.")
+    parser.add_argument('--collection', action='append', dest='collections', metavar='NAME',
+                        help="only update this collection (repeatable; default: all, see COLLECTIONS in brain_config.py)")
+    parser.add_argument('--full', action='store_true',
+                        help="ignore the file manifest and rebuild the index from scratch")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="encode every chunk instead of reusing vectors from the embedding cache")
+    parser.add_argument('--no-extract-cache', action='store_true',
+                        help="parse every PDF/PPTX instead of reusing text from the extraction cache")
+    parser.add_argument('--index-type', choices=INDEX_TYPES,
+                        help="FAISS index type (default: keep the existing one, else flat); changing it rebuilds")
+    parser.add_argument('--nlist', type=int, help="IVF lists (default ~4*sqrt(n))")
+    parser.add_argument('--nprobe', type=int, help="IVF lists scanned per query")
+    parser.add_argument('--hnsw-m', type=int, help="HNSW neighbours per node")
+    parser.add_argument('--ef-search', type=int, help="HNSW search depth")
+    parser.add_argument('--pq-m', type=int, help="PQ sub-quantizers (bytes per vector)")
+    parser.add_argument('--rescore-factor', type=int, help="binary: candidates rescored with float16 vectors per result")
+    args = parser.parse_args()
+    main(full=args.full, index_type=args.index_type, use_cache=not args.no_cache, collections=args.collections,
+         use_extract_cache=not args.no_extract_cache, nlist=args.nlist, nprobe=args.nprobe, hnsw_m=args.hnsw_m, ef_search=args.ef_search, pq_m=args.pq_m,
+         rescore_factor=args.rescore_factor)
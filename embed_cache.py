@@ -0,0 +1,183 @@
+"""Persistent embedding cache keyed by (model id, normalization flag, chunk content hash).
+
+The model id is the model folder's name plus its fingerprint, so new model
+files dropped into the same folder start a new namespace.
+
+Vectors are appended to one raw matrix file per (model, normalize) namespace
+(float16 by default) and located through an SQLite table, so renamed or
+moved files, full rebuilds and model A/B runs reuse earlier encodes instead
+of running the model again. When the cache grows past its size limit the
+least recently used vectors are dropped and the matrix files compacted;
+a compacted matrix gets a new file name (version), committed together with
+the new row numbers, so an interrupted compaction never misaligns them.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from brain_config import EMBED_CACHE_DIR
+
+# 缓存上限（MB），超出后按最近最少使用淘汰
+EMBED_CACHE_MAX_MB = 2048
+# Compaction shrinks the cache to this fraction of the limit, so it does not run on every write
+EVICT_TO_FRACTION = 0.8
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS namespaces (
+    ns        INTEGER PRIMARY KEY,
+    model_id  TEXT NOT NULL,
+    normalize INTEGER NOT NULL,
+    dim       INTEGER NOT NULL,
+    rows      INTEGER NOT NULL DEFAULT 0,
+    version   INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (model_id, normalize)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    ns        INTEGER NOT NULL,
+    hash      TEXT NOT NULL,
+    row       INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (ns, hash)
+);
+"""
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def model_id_for(model_dir, fingerprint=None):
+    """Name of a local model directory (its folder name, e.g. 'bge-large-zh').
+
+    With the folder's model_fingerprint this is the cache namespace name,
+    e.g. 'bge-large-zh@3f2a9c01d4e5'.
+    """
+    name = os.path.basename(os.path.normpath(model_dir))
+    return f"{name}@{fingerprint[:12]}" if fingerprint else name
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir=EMBED_CACHE_DIR, dtype='float16', max_mb=EMBED_CACHE_MAX_MB):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.dtype = np.dtype(dtype)
+        self.max_bytes = int(max_mb * 2 ** 20)
+        self.conn = sqlite3.connect(os.path.join(cache_dir, f'cache_{self.dtype.name}.sqlite'))
+        self.conn.executescript(_SCHEMA)
+        # Caches written before matrix files were versioned
+        if 'version' not in {row[1] for row in self.conn.execute("PRAGMA table_info(namespaces)")}:
+            self.conn.execute("ALTER TABLE namespaces ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def _vectors_path(self, ns, version):
+        suffix = f'v{version}' if version else ''
+        return os.path.join(self.cache_dir, f'ns{ns}{suffix}.{self.dtype.name}.bin')
+
+    def _namespace(self, model_id, normalize, dim=None):
+        """Return (ns, dim, rows, version), creating the namespace when dim is given."""
+        row = self.conn.execute(
+            "SELECT ns, dim, rows, version FROM namespaces WHERE model_id = ? AND normalize = ?",
+            (model_id, int(normalize))).fetchone()
+        if row is None and dim is not None:
+            cur = self.conn.execute("INSERT INTO namespaces (model_id, normalize, dim) VALUES (?, ?, ?)",
+                                    (model_id, int(normalize), int(dim)))
+            row = (cur.lastrowid, int(dim), 0, 0)
+        return row
+
+    def get_many(self, model_id, normalize, hashes):
+        """Return {hash: float32 vector} for the cached hashes."""
+        ns_row = self._namespace(model_id, normalize)
+        if ns_row is None or not hashes:
+            return {}
+        ns, dim, rows, version = ns_row
+        found = {}
+        unique = list(set(hashes))
+        for start in range(0, len(unique), 500):  # stay under SQLite's variable limit
+            part = unique[start:start + 500]
+            found.update(self.conn.execute(
+                f"SELECT hash, row FROM entries WHERE ns = ? AND hash IN ({','.join('?' * len(part))})",
+                [ns] + part).fetchall())
+        if not found:
+            return {}
+        matrix = np.memmap(self._vectors_path(ns, version), dtype=self.dtype, mode='r', shape=(rows, dim))
+        now = time.time()
+        self.conn.executemany("UPDATE entries SET last_used = ? WHERE ns = ? AND hash = ?",
+                              ((now, ns, h) for h in found))
+        return {h: np.asarray(matrix[r], dtype='float32') for h, r in found.items()}
+
+    def put_many(self, model_id, normalize, hashes, vectors):
+        """Append vectors for hashes not yet cached."""
+        if not len(hashes):
+            return
+        ns, dim, rows, version = self._namespace(model_id, normalize, vectors.shape[1])
+        existing = set(self.get_many(model_id, normalize, hashes))
+        new = {}
+        for h, v in zip(hashes, vectors):
+            if h not in existing and h not in new:
+                new[h] = v
+        if not new:
+            return
+        path = self._vectors_path(ns, version)
+        # Row numbers come from the file itself, so an interrupted run cannot misalign them
+        rows = os.path.getsize(path) // (dim * self.dtype.itemsize) if os.path.exists(path) else 0
+        with open(path, 'ab') as f:
+            f.write(np.asarray(list(new.values()), dtype=self.dtype).tobytes())
+        now = time.time()
+        self.conn.executemany("INSERT OR REPLACE INTO entries (ns, hash, row, last_used) VALUES (?, ?, ?, ?)",
+                              ((ns, h, rows + i, now) for i, h in enumerate(new)))
+        self.conn.execute("UPDATE namespaces SET rows = ? WHERE ns = ?", (rows + len(new), ns))
+        self.conn.commit()
+
+    def size_bytes(self):
+        total = 0
+        for dim, rows in self.conn.execute("SELECT dim, rows FROM namespaces"):
+            total += dim * rows * self.dtype.itemsize
+        return total
+
+    def evict(self):
+        """Drop least recently used vectors until the cache is below EVICT_TO_FRACTION of its limit."""
+        if self.size_bytes() <= self.max_bytes:
+            return
+        budget = self.max_bytes * EVICT_TO_FRACTION
+        namespaces = {ns: (dim, rows, version) for ns, dim, rows, version in
+                      self.conn.execute("SELECT ns, dim, rows, version FROM namespaces")}
+        keep = {ns: [] for ns in namespaces}
+        used = 0
+        for ns, h, row, last_used in self.conn.execute(
+                "SELECT ns, hash, row, last_used FROM entries ORDER BY last_used DESC"):
+            size = namespaces[ns][0] * self.dtype.itemsize
+            if used + size > budget:
+                break
+            used += size
+            keep[ns].append((h, row, last_used))
+
+        for ns, (dim, rows, version) in namespaces.items():
+            kept = sorted(keep[ns], key=lambda e: e[1])
+            path = self._vectors_path(ns, version)
+            new_path = self._vectors_path(ns, version + 1)
+            data = np.zeros((0, dim), self.dtype)
+            if rows and kept:
+                old = np.memmap(path, dtype=self.dtype, mode='r', shape=(rows, dim))
+                data = np.asarray(old[[r for _, r, _ in kept]])
+                del old
+            tmp_path = f"{new_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data.tobytes())
+            os.replace(tmp_path, new_path)
+            # The new file name and the new row numbers are committed together; until then the old ones hold
+            self.conn.execute("DELETE FROM entries WHERE ns = ?", (ns,))
+            self.conn.executemany("INSERT INTO entries (ns, hash, row, last_used) VALUES (?, ?, ?, ?)",
+                                  ((ns, h, i, last_used) for i, (h, _, last_used) in enumerate(kept)))
+            self.conn.execute("UPDATE namespaces SET rows = ?, version = ? WHERE ns = ?", (len(kept), version + 1, ns))
+            self.conn.commit()
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # never written (empty namespace) or still mapped by another process
+
+    def close(self):
+        self.conn.commit()
+        self.evict()
+        self.conn.close()
@@ -1,14 +1,12 @@
 import os
 import json
 
+from scanner import scan_paths
+
 # Set the root directory to search for markdown files
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-md_files = []
-for root, dirs, files in os.walk(ROOT_DIR):
-    for file in files:
-        if file.endswith('.md'):
-            md_files.append(os.path.join(root, file))
+md_files = scan_paths([ROOT_DIR], extensions=('.md',))
 
 # Extract text content from each markdown file
 md_data = []
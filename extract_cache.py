@@ -0,0 +1,125 @@
+"""Content-addressed cache of the text extracted from PDF and PPTX files.
+
+Parsing PDFs (PyMuPDF) and decks (python-pptx) is the slow part of every
+full rebuild, yet the files almost never change. The extracted pages and
+slides are therefore stored per (file content hash, extractor version):
+
+    extract_cache/3f/3f2a...-pdf-pymupdf-1.23.8-v1.json.gz
+    {"sha1": ..., "type": "pdf", "extractor": ..., "path": ..., "units": [[1, "page text"], ...]}
+
+Page/slide boundaries are kept, so a rebuild with new chunk settings (or
+a chunker experiment) re-chunks the cached units instead of re-parsing.
+Renamed or copied files hit the same entry; a changed extractor version
+(doc_extract.EXTRACTOR_VERSION or the library version) misses it. When the
+cache grows past its size limit the least recently used files are dropped.
+
+    python extract_cache.py            # entries and size per type
+    python extract_cache.py --evict    # shrink to the size limit now
+"""
+import argparse
+import gzip
+import json
+import os
+
+from brain_config import EXTRACT_CACHE_DIR
+
+# 缓存上限（MB，压缩后），超出后按最近使用时间淘汰
+EXTRACT_CACHE_MAX_MB = 1024
+# Eviction shrinks the cache to this fraction of the limit, so it does not run on every write
+EVICT_TO_FRACTION = 0.8
+
+
+class ExtractCache:
+    """Extracted [(page or slide number, text)] per file hash; safe to share between processes."""
+
+    def __init__(self, cache_dir=EXTRACT_CACHE_DIR, max_mb=EXTRACT_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 2 ** 20)
+
+    def _path(self, sha1, doc_type, extractor):
+        return os.path.join(self.cache_dir, sha1[:2], f"{sha1}-{doc_type}-{extractor}.json.gz")
+
+    def get(self, sha1, doc_type, extractor):
+        """Cached units, or None on a miss (or an unreadable entry)."""
+        path = self._path(sha1, doc_type, extractor)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)  # mtime doubles as "last used" for eviction
+        except (OSError, ValueError):
+            return None
+        return [(number, text) for number, text in entry['units']]
+
+    def put(self, sha1, doc_type, extractor, units, source=None):
+        path = self._path(sha1, doc_type, extractor)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {'sha1': sha1, 'type': doc_type, 'extractor': extractor, 'path': source,
+                 'units': [list(u) for u in units]}
+        # Worker processes may write the same entry concurrently: unique tmp name + atomic rename
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _files(self):
+        """(path, size, mtime) of every cache entry."""
+        if not os.path.isdir(self.cache_dir):
+            return []
+        files = []
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for e in os.scandir(sub.path):
+                if e.name.endswith('.json.gz'):
+                    st = e.stat()
+                    files.append((e.path, st.st_size, st.st_mtime))
+        return files
+
+    def size_bytes(self):
+        return sum(size for _, size, _ in self._files())
+
+    def iter_entries(self):
+        """Every cached document as {'sha1', 'type', 'extractor', 'path', 'units'}, e.g. for length analysis."""
+        for path, _, _ in sorted(self._files()):
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    yield json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error reading {path}: {e}")
+
+    def evict(self):
+        """Drop least recently used entries until the cache is below EVICT_TO_FRACTION of its limit."""
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return 0
+        budget = self.max_bytes * EVICT_TO_FRACTION
+        removed = 0
+        for path, size, _ in sorted(files, key=lambda f: f[2]):
+            if total <= budget:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="PDF/PPTX 文本提取缓存统计")
+    parser.add_argument('--evict', action='store_true', help="drop least recently used entries above the size limit")
+    args = parser.parse_args()
+    cache = ExtractCache()
+    if args.evict:
+        print(f"🧹 淘汰了 {cache.evict()} 个缓存条目")
+    per_type = {}
+    for path, size, _ in cache._files():
+        doc_type = os.path.basename(path).split('-')[1]
+        count, total = per_type.get(doc_type, (0, 0))
+        per_type[doc_type] = (count + 1, total + size)
+    if not per_type:
+        print(f"提取缓存为空: {cache.cache_dir}")
+    for doc_type, (count, total) in sorted(per_type.items()):
+        print(f"{doc_type:>5}: {count} 个文件, {total / 2 ** 20:.1f} MB")
@@ -1,14 +1,12 @@
 import os
 
+from scanner import scan_paths
+
 # Set the root directory to search for markdown files
 ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 print(ROOT_DIR)
 
-md_files = []
-for root, dirs, files in os.walk(ROOT_DIR):
-    for file in files:
-        if file.endswith('.md'):
-            md_files.append(os.path.join(root, file))
+md_files = scan_paths([ROOT_DIR], extensions=('.md',))
 
 print(f"Found {len(md_files)} markdown files.")
 for f in md_files:
@@ -0,0 +1,88 @@
+"""Persistent file manifest for incremental re-indexing.
+
+Maps every scanned file to its mtime, size, content hash and the FAISS
+vector IDs it produced, so a re-run only touches files that changed.
+"""
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 1
+
+
+def empty_manifest():
+    return {'version': MANIFEST_VERSION, 'files': {}}
+
+
+def load_manifest(path):
+    """Load the manifest, or return None if it does not exist / is unreadable."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading manifest {path}: {e}")
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(manifest, path):
+    """Write the manifest atomically (tmp file + rename)."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def hash_file(path, block_size=1 << 20):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_entry(path, ids, sha1=None):
+    st = os.stat(path)
+    return {
+        'mtime': st.st_mtime,
+        'size': st.st_size,
+        'sha1': sha1 or hash_file(path),
+        'ids': list(ids),
+    }
+
+
+def diff_manifest(manifest, paths):
+    """Compare scanned paths against the manifest.
+
+    Returns (new, changed, unchanged, deleted) path lists. A file whose
+    mtime/size changed but whose content hash did not is counted as
+    unchanged and its stat fields are refreshed in place.
+    """
+    files = manifest['files']
+    new, changed, unchanged = [], [], []
+    seen = set()
+    for path in paths:
+        seen.add(path)
+        entry = files.get(path)
+        if entry is None:
+            new.append(path)
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue  # vanished between scan and diff; handled as deleted next run
+        if st.st_mtime == entry['mtime'] and st.st_size == entry['size']:
+            unchanged.append(path)
+            continue
+        sha1 = hash_file(path)
+        if sha1 == entry['sha1']:
+            entry['mtime'], entry['size'] = st.st_mtime, st.st_size
+            unchanged.append(path)
+        else:
+            changed.append(path)
+    deleted = [path for path in files if path not in seen]
+    return new, changed, unchanged, deleted
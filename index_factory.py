@@ -0,0 +1,277 @@
+"""Selectable FAISS index types for the knowledge-base index.
+
+  flat   exact inner-product scan (IndexFlatIP), the baseline
+  ivf    IVF-Flat: k-means coarse quantizer, scans `nprobe` of `nlist` lists
+  hnsw   HNSW graph over full vectors
+  ivfpq  IVF with product-quantized codes (`pq_m` bytes per vector)
+  opq    OPQ rotation + IVF-PQ
+  fp16   exact scan over float16 vectors (half the memory of flat)
+  sq8    exact scan over int8 scalar-quantized vectors (IndexScalarQuantizer, a quarter)
+  binary sign-bit codes scanned by Hamming distance; the best `rescore_factor * k`
+         candidates are rescored against float16 vectors (IndexLSH + IndexRefine)
+
+All indexes use inner product (= cosine on normalized vectors) and keep the
+metadata-store IDs. The chosen type, its build/search parameters and the
+score metric are saved to INDEX_PARAMS_PATH next to md_faiss.index and
+re-applied at load.
+"""
+import json
+import math
+import os
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ('flat', 'ivf', 'hnsw', 'ivfpq', 'opq', 'fp16', 'sq8', 'binary')
+IVF_TYPES = ('ivf', 'ivfpq', 'opq')
+
+DEFAULT_PARAMS = {
+    'nlist': None,          # None = derived from corpus size at training time
+    'nprobe': 16,
+    'hnsw_m': 32,
+    'ef_construction': 200,
+    'ef_search': 64,
+    'pq_m': 64,             # sub-quantizers; must divide the dimension (1024 / 64 = 16 dims each)
+    'pq_nbits': 8,
+    'rescore_factor': 10,   # binary: Hamming candidates rescored per result
+}
+
+# Only these may change without a rebuild; the others are fixed when the index is built
+QUERY_PARAMS = ('nprobe', 'ef_search', 'rescore_factor')
+# Build parameters that shape each kind of index
+BUILD_PARAMS = {'ivf': ('nlist',), 'ivfpq': ('nlist', 'pq_m'), 'opq': ('nlist', 'pq_m'), 'hnsw': ('hnsw_m',)}
+
+# Vectors sampled for k-means / PQ training
+TRAIN_SAMPLE = 65536
+# faiss wants ~39 training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def needs_training(kind):
+    """Kinds built from all vectors at once: k-means / PQ codebooks, int8 ranges (binary is staged like them)."""
+    return kind in IVF_TYPES or kind in ('sq8', 'binary')
+
+
+def default_nlist(n):
+    """~4*sqrt(n) lists, but never more than the training set can support."""
+    nlist = int(4 * math.sqrt(max(n, 1)))
+    return max(1, min(nlist, n // MIN_POINTS_PER_CENTROID))
+
+
+def factory_string(kind, params):
+    if kind == 'flat':
+        return "IDMap2,Flat"
+    if kind == 'hnsw':
+        return f"IDMap2,HNSW{params['hnsw_m']},Flat"
+    if kind == 'ivf':
+        return f"IVF{params['nlist']},Flat"
+    if kind == 'ivfpq':
+        return f"IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_nbits']}"
+    if kind == 'opq':
+        return f"OPQ{params['pq_m']},IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_nbits']}"
+    if kind == 'fp16':
+        return "IDMap2,SQfp16"
+    if kind == 'sq8':
+        return "IDMap2,SQ8"
+    raise ValueError(f"Unknown index type {kind!r}; choose from {', '.join(INDEX_TYPES)}")
+
+
+# Score metric of every index built here: inner product of normalized vectors (see relevance.py)
+METRIC = 'cosine'
+
+
+def changed_build_params(params, overrides):
+    """{name: (built, requested)} for the build parameters of params['kind'] that overrides change."""
+    return {k: (params.get(k), overrides[k]) for k in BUILD_PARAMS.get(params['kind'], ())
+            if overrides.get(k) is not None and overrides[k] != params.get(k)}
+
+
+def make_params(kind, **overrides):
+    params = dict(DEFAULT_PARAMS, **{k: v for k, v in overrides.items() if v is not None})
+    params['kind'] = kind
+    params['metric'] = METRIC
+    return params
+
+
+def new_index(kind, dimension, params):
+    """Create an empty index of the given kind (trainable kinds still need train())."""
+    if kind == 'binary':
+        index = _binary_index(dimension)
+        apply_search_params(index, dict(params, kind=kind))
+        return index
+    index = faiss.index_factory(dimension, factory_string(kind, params), faiss.METRIC_INNER_PRODUCT)
+    if kind == 'hnsw':
+        faiss.downcast_index(faiss.downcast_index(index).index).hnsw.efConstruction = params['ef_construction']
+    apply_search_params(index, dict(params, kind=kind))
+    return index
+
+
+def _binary_index(dimension):
+    """Sign-bit codes (one bit per dimension) with a float16 copy for rescoring, behind an ID map.
+
+    index_factory only builds LSH for the L2 metric. IndexLSH always ranks by
+    Hamming distance, so it is relabelled as inner product to sit under an
+    IndexRefine that returns the float16 inner products.
+    """
+    codes = faiss.IndexLSH(dimension, dimension, False, False)
+    codes.metric_type = faiss.METRIC_INNER_PRODUCT
+    vectors = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    refine = faiss.IndexRefine(codes, vectors)
+    refine.own_fields = True
+    codes.this.disown()
+    vectors.this.disown()
+    index = faiss.IndexIDMap2(refine)
+    index.own_fields = True
+    refine.this.disown()
+    return index
+
+
+def _refine_index(index):
+    """The IndexRefine inside an ID map, or None."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    return inner if isinstance(inner, faiss.IndexRefine) else None
+
+
+def apply_search_params(index, params):
+    """Set query-time knobs (nprobe / efSearch / rescore factor) through wrappers like IDMap and OPQ."""
+    ps = faiss.ParameterSpace()
+    if params.get('kind') in IVF_TYPES:
+        ps.set_index_parameter(index, 'nprobe', params['nprobe'])
+    elif params.get('kind') == 'hnsw':
+        ps.set_index_parameter(index, 'efSearch', params['ef_search'])
+    elif params.get('kind') == 'binary':
+        _refine_index(index).k_factor = params.get('rescore_factor', DEFAULT_PARAMS['rescore_factor'])
+
+
+def build_index(kind, vectors, ids, params, sample=TRAIN_SAMPLE, seed=0):
+    """Build a filled index from (vectors, ids); trainable kinds are trained on a random sample.
+
+    Falls back to 'flat' when there are too few vectors to train. `params`
+    is updated in place with the effective kind and nlist.
+    """
+    n, dimension = vectors.shape
+    if needs_training(kind):
+        min_points = 1  # int8 value ranges can be taken from any number of vectors
+        if kind in IVF_TYPES:
+            if params.get('nlist') is None:
+                params['nlist'] = default_nlist(n)
+            min_points = params['nlist'] * MIN_POINTS_PER_CENTROID
+        if kind in ('ivfpq', 'opq'):
+            min_points = max(min_points, 2 ** params['pq_nbits'] * MIN_POINTS_PER_CENTROID // 4)
+        if n < min_points:
+            print(f"Only {n} vectors, too few to train {kind} (need ~{min_points}); using flat index.")
+            kind = 'flat'
+    params['kind'] = kind
+
+    index = new_index(kind, dimension, params)
+    if needs_training(kind):
+        rng = np.random.default_rng(seed)
+        train = vectors if n <= sample else vectors[rng.choice(n, sample, replace=False)]
+        index.train(np.ascontiguousarray(train, dtype='float32'))
+    if n:
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype='float32'), np.asarray(ids, dtype='int64'))
+    return index
+
+
+def reconstruct_vectors(index, ids):
+    """Vectors stored for `ids` (exact for flat/hnsw/ivf, float16-rounded for fp16/binary,
+    approximate for int8 and PQ codes)."""
+    ids = np.asarray(ids, dtype='int64')
+    if len(ids) == 0:
+        return np.zeros((0, index.d), dtype='float32')
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index.reconstruct_batch(ids)
+
+
+def index_ids(index):
+    """All vector IDs stored in the index."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.vector_to_array(index.id_map).astype('int64')
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return np.arange(index.ntotal, dtype='int64')
+    invlists = ivf.invlists
+    parts = []
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            ptr = invlists.get_ids(list_no)
+            parts.append(faiss.rev_swig_ptr(ptr, size).copy())
+            invlists.release_ids(list_no, ptr)
+    return np.concatenate(parts).astype('int64') if parts else np.zeros(0, dtype='int64')
+
+
+def score_ids(index, query, ids):
+    """Exact scores of one query vector against specific stored vectors: {id: score}.
+
+    Used to give lexical-only hits a dense score. IVF indexes scan all lists
+    for this, restricted to `ids` by an ID selector; IDs the index type
+    cannot score are left out.
+    """
+    ids = np.asarray(ids, dtype='int64')
+    if len(ids) == 0:
+        return {}
+    if _refine_index(index) is not None:
+        # IndexRefine ignores ID selectors behind an ID map; score the stored float16 vectors directly
+        try:
+            vectors = index.reconstruct_batch(ids)
+        except RuntimeError:
+            # An ID not in the index fails the whole batch; reconstruct one by one and leave out the unknown
+            found = []
+            for i in ids:
+                try:
+                    found.append((i, index.reconstruct(int(i))))
+                except RuntimeError:
+                    continue
+            if not found:
+                return {}
+            ids = np.array([i for i, _ in found], dtype='int64')
+            vectors = np.stack([v for _, v in found])
+        return {int(i): float(s) for i, s in zip(ids, vectors @ np.asarray(query, dtype='float32').ravel())}
+    selector = faiss.IDSelectorBatch(ids)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nlist)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    try:
+        D, I = index.search(np.ascontiguousarray(query, dtype='float32').reshape(1, -1), len(ids), params=params)
+    except RuntimeError:
+        return {}
+    return {int(i): float(d) for i, d in zip(I[0], D[0]) if i >= 0}
+
+
+def remove_ids(index, stale_ids, keep_ids, params):
+    """Remove vectors from the index; returns the (possibly rebuilt) index.
+
+    HNSW graphs cannot delete nodes, so for those the remaining vectors are
+    reconstructed and the index is rebuilt without the stale IDs.
+    """
+    try:
+        index.remove_ids(np.asarray(stale_ids, dtype='int64'))
+        return index
+    except RuntimeError:
+        print(f"{params.get('kind')} index does not support removal; rebuilding from {len(keep_ids)} stored vectors.")
+        vectors = reconstruct_vectors(index, keep_ids)
+        return build_index(params['kind'], vectors, keep_ids, params)
+
+
+def load_params(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_params(params, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(params, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def index_memory_bytes(index):
+    """Serialized size of the index, a close proxy for its resident memory."""
+    return int(faiss.serialize_index(index).nbytes)
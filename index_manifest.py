@@ -0,0 +1,132 @@
+"""Index/model compatibility manifest, written next to md_faiss.index.
+
+Records which embedding model built the index (local path, a fingerprint of
+its files, output dimension), whether the vectors were normalized, the score
+metric, the chunker settings and the build time. Search entry points load
+the model named here instead of a hard-coded one and refuse to run when the
+model, its dimension or the index no longer match, so an index is never
+queried with vectors from a different embedding space.
+"""
+import hashlib
+import json
+import os
+import time
+
+from brain_config import BASE_DIR, EMBED_MODEL_DIR, INDEX_MANIFEST_PATH
+
+MANIFEST_VERSION = 1
+# Query vectors are always L2-normalized (see encode calls in the search scripts)
+QUERY_NORMALIZE = True
+# Model files up to this size are hashed by content; larger ones (weights) by name and size only
+FINGERPRINT_CONTENT_BYTES = 1 << 20
+
+
+class IndexMismatchError(RuntimeError):
+    """The index cannot be queried with the available embedding model."""
+
+
+def model_fingerprint(model_dir):
+    """sha1 over a model folder: configs and tokenizer files by content, weight files by size."""
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(model_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(root, name)
+            size = os.path.getsize(path)
+            digest.update(os.path.relpath(path, model_dir).replace('\\', '/').encode('utf-8'))
+            digest.update(str(size).encode('ascii'))
+            if size <= FINGERPRINT_CONTENT_BYTES:
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _portable_path(model_dir):
+    """Model path relative to the repo when it lives inside it, so the index can move with the repo."""
+    path = os.path.abspath(model_dir)
+    try:
+        rel = os.path.relpath(path, BASE_DIR)
+    except ValueError:  # another drive on Windows
+        return path
+    return path if rel.startswith('..') else rel.replace('\\', '/')
+
+
+def build_manifest(model_dir, dimension, normalize, metric, chunker, index_kind, vectors):
+    return {
+        'version': MANIFEST_VERSION,
+        'model': {
+            'path': _portable_path(model_dir),
+            'name': os.path.basename(os.path.normpath(model_dir)),
+            'hash': model_fingerprint(model_dir),
+        },
+        'dimension': int(dimension),
+        'normalize': bool(normalize),
+        'metric': metric,
+        'chunker': chunker,
+        'index_kind': index_kind,
+        'vectors': int(vectors),
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def load_index_manifest(path=INDEX_MANIFEST_PATH):
+    """The manifest dict, or None for indexes built before it was written."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_index_manifest(manifest, path=INDEX_MANIFEST_PATH):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def resolve_model_dir(manifest):
+    """Local folder of the model that built the index (EMBED_MODEL_DIR when there is no manifest)."""
+    if manifest is None:
+        return EMBED_MODEL_DIR
+    path = manifest['model']['path']
+    candidates = [path if os.path.isabs(path) else os.path.join(BASE_DIR, path),
+                  os.path.join(BASE_DIR, 'models', manifest['model']['name'])]
+    for candidate in candidates:
+        if os.path.isdir(candidate):
+            return candidate
+    raise IndexMismatchError(
+        f"The index was built with embedding model '{manifest['model']['name']}' ({path}), "
+        f"which is not available locally. Restore the model or rebuild with embed_and_index.py --full.")
+
+
+def check_model_files(manifest, model_dir):
+    """Fail fast when the model folder differs from the one that built the index."""
+    if manifest is None:
+        return
+    if manifest.get('normalize') != QUERY_NORMALIZE:
+        raise IndexMismatchError("The index holds unnormalized vectors but queries are normalized; "
+                                 "rebuild with embed_and_index.py --full.")
+    if model_fingerprint(model_dir) != manifest['model']['hash']:
+        raise IndexMismatchError(
+            f"Embedding model files in {model_dir} differ from the model that built the index "
+            f"({manifest['model']['name']}, built {manifest['built_at']}); rebuild with embed_and_index.py --full.")
+
+
+def check_dimension(manifest, dimension, what):
+    """Compare the dimension of the model or index (`what`) with the manifest."""
+    if manifest is not None and int(dimension) != manifest['dimension']:
+        raise IndexMismatchError(
+            f"{what} has dimension {dimension}, but the index was built with {manifest['model']['name']} "
+            f"({manifest['dimension']}-dim); rebuild with embed_and_index.py --full.")
+
+
+def describe(manifest):
+    if manifest is None:
+        return "no index manifest (index built by an older version)"
+    return (f"{manifest['model']['name']}, {manifest['dimension']}-dim, {manifest['metric']}, "
+            f"{manifest['index_kind']}, {manifest['vectors']} vectors, built {manifest['built_at']}")
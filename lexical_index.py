@@ -0,0 +1,153 @@
+"""BM25 keyword index over the chunk texts, fused with the FAISS results.
+
+Dense retrieval misses exact terms such as book titles, names or English
+jargon inside Chinese notes. Chunks are therefore also indexed lexically:
+CJK runs become overlapping character bigrams, Latin words and numbers are
+kept whole (lowercased). The tokens go into a contentless SQLite FTS5 table
+keyed by vector ID, so only the compressed postings are stored and not a
+second copy of the text. Queries are ranked with FTS5's built-in bm25().
+
+rrf_fuse() merges the dense and lexical rankings by reciprocal-rank fusion.
+"""
+import os
+import re
+import sqlite3
+import threading
+
+# Bump when tokenize() changes; embed_and_index.py then rebuilds the lexical index
+TOKENIZER_VERSION = 1
+# Reciprocal-rank fusion constant: score = sum(1 / (RRF_K + rank))
+RRF_K = 60
+# At most this many distinct query tokens go into one MATCH expression
+MAX_QUERY_TOKENS = 64
+
+_CJK = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+TOKEN_RE = re.compile(f'[{_CJK}]+|[0-9A-Za-z\u00c0-\u024f]+')
+CJK_RE = re.compile(f'[{_CJK}]')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS info (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunk_terms USING fts5(tokens, content='');
+"""
+
+
+def tokenize(text):
+    """Character bigrams for CJK runs (single characters stay as they are), lowercase words otherwise."""
+    tokens = []
+    for match in TOKEN_RE.finditer(text):
+        run = match.group()
+        if CJK_RE.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def match_expression(query):
+    """FTS5 query matching any of the query's tokens; None when it has no searchable tokens."""
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TOKENS]
+    if not terms:
+        return None
+    # A lone CJK character only occurs inside bigrams, so match it as a prefix
+    return ' OR '.join(f'"{t}"*' if len(t) == 1 and CJK_RE.match(t) else f'"{t}"' for t in terms)
+
+
+def rrf_fuse(rankings, k=RRF_K):
+    """Merge ranked ID lists; returns [(id, fused score)] best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, vec_id in enumerate(ranking, 1):
+            scores[vec_id] = scores.get(vec_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+class LexicalIndex:
+    """BM25 index keyed by vector ID. Writes are batched until commit()."""
+
+    def __init__(self, path, readonly=False):
+        if readonly:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Lexical index not found: {path} (run embed_and_index.py first)")
+            uri = 'file:' + os.path.abspath(path).replace('\\', '/') + '?mode=ro'
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def _info(self, key):
+        row = self.conn.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_info(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def is_current(self, expected_count):
+        """True when built with this tokenizer and holding `expected_count` chunks."""
+        with self._lock:
+            return (self._info('tokenizer') == str(TOKENIZER_VERSION)
+                    and self._info('count') == str(expected_count))
+
+    def count(self):
+        with self._lock:
+            return int(self._info('count') or 0)
+
+    def add_many(self, ids, texts):
+        ids = [int(i) for i in ids]
+        with self._lock:
+            self.conn.executemany("INSERT INTO chunk_terms (rowid, tokens) VALUES (?, ?)",
+                                  ((i, ' '.join(tokenize(t))) for i, t in zip(ids, texts)))
+            self._set_info('count', int(self._info('count') or 0) + len(ids))
+
+    def delete_many(self, ids, texts):
+        """Remove chunks; a contentless table needs the original text to find their postings."""
+        ids = [int(i) for i in ids]
+        with self._lock:
+            self.conn.executemany("INSERT INTO chunk_terms (chunk_terms, rowid, tokens) VALUES ('delete', ?, ?)",
+                                  ((i, ' '.join(tokenize(t))) for i, t in zip(ids, texts)))
+            self._set_info('count', max(0, int(self._info('count') or 0) - len(ids)))
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("INSERT INTO chunk_terms (chunk_terms) VALUES ('delete-all')")
+            self._set_info('count', 0)
+            self._set_info('tokenizer', TOKENIZER_VERSION)
+
+    def rebuild(self, entries):
+        """Re-index from (id, entry) pairs, e.g. MetaStore.iter_entries()."""
+        self.clear()
+        batch_ids, batch_texts = [], []
+        for vec_id, entry in entries:
+            batch_ids.append(vec_id)
+            batch_texts.append(entry['content'])
+            if len(batch_ids) >= 1000:
+                self.add_many(batch_ids, batch_texts)
+                batch_ids, batch_texts = [], []
+        self.add_many(batch_ids, batch_texts)
+
+    def search(self, query, k=20):
+        """Return [(id, bm25 score)] best first (higher is better)."""
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT rowid, bm25(chunk_terms) FROM chunk_terms WHERE chunk_terms MATCH ? "
+                "ORDER BY bm25(chunk_terms) LIMIT ?", (expression, int(k))).fetchall()
+        # FTS5 reports BM25 negated so that smaller sorts first
+        return [(vec_id, -score) for vec_id, score in rows]
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
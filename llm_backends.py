@@ -0,0 +1,320 @@
+"""Streaming calls to the LLM backends used by the rag_brain*.py scripts.
+
+Ollama streams NDJSON (one JSON object per line with a "response" piece);
+Zhipu and DeepSeek use the OpenAI-style SSE stream ("data: {...}" lines with
+choices[0].delta.content, ending in "data: [DONE]"). Tokens are printed as
+they arrive and <think>...</think> blocks are dropped on the fly.
+
+Requests go through pooled httpx clients (one keep-alive pool per backend
+host), so only the first question pays the TCP/TLS handshake. Connection
+errors, 429 and 5xx responses are retried with backoff as long as no token
+has been received yet. Batch callers use AsyncClients to keep several
+requests in flight at once.
+"""
+import asyncio
+import atexit
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+# 连接/读取超时（秒）；读取超时是两次数据之间的最长等待，而不是整个回答的时长
+LLM_CONNECT_TIMEOUT = 10
+LLM_READ_TIMEOUT = 120
+# 失败重试次数与退避（0.5s, 1s, 2s, ...）
+LLM_RETRIES = 2
+LLM_BACKOFF = 0.5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# 每个后端的连接池大小，以及批量模式同时进行的请求数
+LLM_MAX_CONNECTIONS = 8
+LLM_CONCURRENCY = 4
+
+ANSWER_HEADER = "\n📝 【任老师的回答】\n"
+
+
+def _partial_suffix(text, tag):
+    """Length of the longest suffix of text that is a proper prefix of tag."""
+    for n in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:n]):
+            return n
+    return 0
+
+
+class ThinkFilter:
+    """Removes <think>...</think> blocks from a token stream, even when a tag is split across chunks."""
+
+    OPEN = '<think>'
+    CLOSE = '</think>'
+
+    def __init__(self):
+        self.inside = False
+        self.pending = ''
+
+    def feed(self, text):
+        buf = self.pending + text
+        self.pending = ''
+        out = []
+        while buf:
+            tag = self.CLOSE if self.inside else self.OPEN
+            pos = buf.find(tag)
+            if pos != -1:
+                if not self.inside:
+                    out.append(buf[:pos])
+                buf = buf[pos + len(tag):]
+                self.inside = not self.inside
+                continue
+            # Hold back a possible partial tag until the next chunk decides it
+            keep = _partial_suffix(buf, tag)
+            if not self.inside:
+                out.append(buf[:len(buf) - keep])
+            self.pending = buf[len(buf) - keep:]
+            break
+        return ''.join(out)
+
+    def flush(self):
+        rest = '' if self.inside else self.pending
+        self.pending = ''
+        return rest
+
+
+def _timeout(read_timeout=None):
+    return httpx.Timeout(read_timeout or LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+def _limits():
+    return httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+
+
+def _origin(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(url):
+    """Shared keep-alive client for the backend serving `url` (one pool per host)."""
+    origin = _origin(url)
+    with _clients_lock:
+        client = _clients.get(origin)
+        if client is None:
+            client = _clients[origin] = httpx.Client(timeout=_timeout(), limits=_limits())
+        return client
+
+
+@atexit.register
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+class AsyncClients:
+    """Per-host AsyncClient pools for one event loop: `async with AsyncClients() as clients: ...`."""
+
+    def __init__(self):
+        self._clients = {}
+
+    def get(self, url):
+        origin = _origin(url)
+        if origin not in self._clients:
+            self._clients[origin] = httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+        return self._clients[origin]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+
+class _RetryableStatus(Exception):
+    pass
+
+
+def _retry_delay(attempt):
+    return LLM_BACKOFF * 2 ** attempt
+
+
+def _post_lines(url, payload, headers=None, timeout=None):
+    """POST and yield response lines; retried until the first line arrives."""
+    client = get_client(url)
+    for attempt in range(LLM_RETRIES + 1):
+        started = False
+        try:
+            with client.stream('POST', url, json=payload, headers=headers, timeout=_timeout(timeout)) as resp:
+                if resp.status_code in RETRY_STATUS and attempt < LLM_RETRIES:
+                    raise _RetryableStatus(f"HTTP {resp.status_code}")
+                resp.raise_for_status()
+                for line in resp.iter_lines():
+                    started = True
+                    yield line
+            return
+        except (httpx.TransportError, _RetryableStatus) as e:
+            if started or attempt >= LLM_RETRIES:
+                raise
+            print(f"⚠️  请求失败（{e or type(e).__name__}），{_retry_delay(attempt):.1f}s 后重试...")
+        time.sleep(_retry_delay(attempt))
+
+
+async def _apost_lines(client, url, payload, headers=None):
+    """Async counterpart of _post_lines on an AsyncClient."""
+    for attempt in range(LLM_RETRIES + 1):
+        started = False
+        try:
+            async with client.stream('POST', url, json=payload, headers=headers) as resp:
+                if resp.status_code in RETRY_STATUS and attempt < LLM_RETRIES:
+                    raise _RetryableStatus(f"HTTP {resp.status_code}")
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    started = True
+                    yield line
+            return
+        except (httpx.TransportError, _RetryableStatus):
+            if started or attempt >= LLM_RETRIES:
+                raise
+        await asyncio.sleep(_retry_delay(attempt))
+
+
+def _ollama_payload(model, prompt):
+    return {"model": model, "prompt": prompt, "stream": True}
+
+
+def _ollama_piece(line):
+    """Response text of one NDJSON line; None at the end of the stream."""
+    data = json.loads(line)
+    if data.get('error'):
+        raise RuntimeError(data['error'])
+    if data.get('done'):
+        return None
+    return data.get('response', '')
+
+
+def _chat_request(api_key, model, messages, temperature):
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}"
+    }
+    data = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "stream": True
+    }
+    return headers, data
+
+
+def _sse_piece(line):
+    """Content of one SSE line ('' for keep-alives and comments); None at [DONE]."""
+    if not line.startswith('data:'):
+        return ''
+    chunk = line[len('data:'):].strip()
+    if chunk == '[DONE]':
+        return None
+    choices = json.loads(chunk).get('choices') or [{}]
+    return choices[0].get('delta', {}).get('content') or ''
+
+
+def stream_ollama(url, model, prompt, timeout=None):
+    """Yield response pieces from Ollama's /api/generate NDJSON stream."""
+    for line in _post_lines(url, _ollama_payload(model, prompt), timeout=timeout):
+        if not line:
+            continue
+        piece = _ollama_piece(line)
+        if piece is None:
+            break
+        if piece:
+            yield piece
+
+
+def stream_chat(url, api_key, model, messages, temperature=0.6, timeout=None):
+    """Yield content pieces from an OpenAI-compatible chat/completions SSE stream (Zhipu, DeepSeek)."""
+    headers, data = _chat_request(api_key, model, messages, temperature)
+    for line in _post_lines(url, data, headers=headers, timeout=timeout):
+        piece = _sse_piece(line)
+        if piece is None:
+            break
+        if piece:
+            yield piece
+
+
+async def astream_ollama(client, url, model, prompt):
+    async for line in _apost_lines(client, url, _ollama_payload(model, prompt)):
+        if not line:
+            continue
+        piece = _ollama_piece(line)
+        if piece is None:
+            break
+        if piece:
+            yield piece
+
+
+async def astream_chat(client, url, api_key, model, messages, temperature=0.6):
+    headers, data = _chat_request(api_key, model, messages, temperature)
+    async for line in _apost_lines(client, url, data, headers=headers):
+        piece = _sse_piece(line)
+        if piece is None:
+            break
+        if piece:
+            yield piece
+
+
+async def acollect(pieces, start=None):
+    """Gather an async token stream without printing; returns (text, ttft, total) like print_stream."""
+    start = start or time.time()
+    think = ThinkFilter()
+    parts = []
+    ttft = None
+    async for piece in pieces:
+        visible = think.feed(piece)
+        if visible and ttft is None and visible.strip():
+            ttft = time.time() - start
+        parts.append(visible)
+    parts.append(think.flush())
+    return ''.join(parts).strip(), ttft, time.time() - start
+
+
+def print_stream(pieces, start=None):
+    """Print visible tokens as they arrive.
+
+    Returns (text, ttft, total): the visible answer, seconds until the first
+    visible token (None if nothing was shown) and total seconds.
+    """
+    start = start or time.time()
+    think = ThinkFilter()
+    parts = []
+    ttft = None
+
+    def emit(visible):
+        nonlocal ttft
+        if ttft is None:
+            visible = visible.lstrip()  # text after a </think> block starts with blank lines
+            if not visible:
+                return
+            ttft = time.time() - start
+            print(ANSWER_HEADER, end='', flush=True)
+        print(visible, end='', flush=True)
+        parts.append(visible)
+
+    for piece in pieces:
+        visible = think.feed(piece)
+        if visible:
+            emit(visible)
+    rest = think.flush()
+    if rest:
+        emit(rest)
+    if ttft is not None:
+        print()
+    return ''.join(parts), ttft, time.time() - start
+
+
+def format_timing(ttft, total):
+    first = f"{ttft:.2f}s" if ttft is not None else "无输出"
+    return f"{total:.2f}s（首字: {first}）"
@@ -0,0 +1,128 @@
+"""SQLite-backed chunk metadata store (replaces md_faiss_meta.json).
+
+One row per FAISS vector ID holding path, type, page/slide, char offset and
+the chunk text. Search processes open it read-only and fetch only the rows
+of the top-k hits, so startup cost and memory no longer grow with corpus size.
+"""
+import os
+import sqlite3
+import threading
+
+COLUMNS = ('path', 'type', 'page', 'offset', 'content')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id      INTEGER PRIMARY KEY,
+    path    TEXT NOT NULL,
+    type    TEXT NOT NULL,
+    page    INTEGER,
+    offset  INTEGER NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_path ON chunks(path);
+CREATE TABLE IF NOT EXISTS info (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class MetaStore:
+    """Chunk metadata keyed by vector ID. Writes are batched until commit()."""
+
+    def __init__(self, path, readonly=False):
+        self.path = path
+        self.readonly = readonly
+        if readonly:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Metadata store not found: {path} (run embed_and_index.py first)")
+            uri = 'file:' + os.path.abspath(path).replace('\\', '/') + '?mode=ro'
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.executescript(_SCHEMA)
+        # One connection shared by the REPL, background threads and the query server
+        self._lock = threading.Lock()
+
+    def get_many(self, ids):
+        """Return {id: entry} for the given vector IDs; unknown IDs are omitted."""
+        ids = [int(i) for i in ids if i >= 0]
+        rows = []
+        with self._lock:
+            for start in range(0, len(ids), 500):  # stay under SQLite's variable limit
+                part = ids[start:start + 500]
+                rows += self.conn.execute(
+                    f"SELECT id, path, type, page, offset, content FROM chunks WHERE id IN ({','.join('?' * len(part))})",
+                    part).fetchall()
+        return {row[0]: dict(zip(COLUMNS, row[1:])) for row in rows}
+
+    def get(self, vec_id):
+        return self.get_many([vec_id]).get(int(vec_id))
+
+    def add_many(self, ids, entries):
+        ids = [int(i) for i in ids]
+        with self._lock:
+            if ids:
+                self._raise_high_water(max(ids) + 1)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, path, type, page, offset, content) VALUES (?, ?, ?, ?, ?, ?)",
+                ((i, e['path'], e['type'], e.get('page'), e.get('offset', 0), e['content'])
+                 for i, e in zip(ids, entries)),
+            )
+
+    def delete_ids(self, ids):
+        with self._lock:
+            self.conn.executemany("DELETE FROM chunks WHERE id = ?", ((int(i),) for i in ids))
+
+    def clear(self):
+        """Delete all chunks; the ID high-water mark is kept, so IDs are never handed out twice."""
+        with self._lock:
+            self.conn.execute("DELETE FROM chunks")
+
+    def _high_water(self):
+        row = self.conn.execute("SELECT value FROM info WHERE key = 'next_id'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _raise_high_water(self, next_id):
+        if next_id > self._high_water():
+            self.conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('next_id', ?)", (str(next_id),))
+
+    def next_id(self):
+        """First never used vector ID, also across clear() and deletes.
+
+        A reader still holding an older index then finds no row for its stale
+        IDs instead of an unrelated chunk that reused them.
+        """
+        with self._lock:
+            (max_id,) = self.conn.execute("SELECT MAX(id) FROM chunks").fetchone()
+            high_water = self._high_water()
+        return max(0 if max_id is None else max_id + 1, high_water)
+
+    def count(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def ids(self):
+        """All vector IDs in the store, ascending."""
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT id FROM chunks ORDER BY id")]
+
+    def paths(self):
+        """Distinct file paths that have at least one chunk."""
+        with self._lock:
+            return {row[0] for row in self.conn.execute("SELECT DISTINCT path FROM chunks")}
+
+    def iter_entries(self):
+        """Yield (id, entry) for all chunks in ID order (used by analysis and benchmark tools)."""
+        with self._lock:
+            rows = self.conn.execute("SELECT id, path, type, page, offset, content FROM chunks ORDER BY id").fetchall()
+        for row in rows:
+            yield row[0], dict(zip(COLUMNS, row[1:]))
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
@@ -0,0 +1,106 @@
+"""Local stand-in for the Ollama and OpenAI-style (Zhipu/DeepSeek) streaming APIs.
+
+Serves /api/generate (NDJSON) and any */chat/completions path (SSE) with a
+canned answer, emitted token by token with a configurable delay. It can
+fail the first N requests to exercise the client retries. Point the
+scripts at it through the environment, e.g.:
+
+    python mock_llm_server.py --port 8765
+    OLLAMA_URL=http://127.0.0.1:8765/api/generate python rag_brain_optimized.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "<think>先整理一下资料。</think>任老师认为，读书要先读懂作者的问题。[来源：mock.md]"
+
+
+class MockState:
+    def __init__(self, delay, fail_first):
+        self.delay = delay
+        self.fail_first = fail_first
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            return self.requests <= self.fail_first
+
+
+def tokens(text, size=4):
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real APIs
+    state = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (ConnectionResetError, BrokenPipeError):
+            pass  # client closed a keep-alive connection
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        json.loads(body or b'{}')
+        if self.state.should_fail():
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.endswith('/api/generate'):
+            self._stream('application/x-ndjson', self._ndjson())
+        elif self.path.endswith('/chat/completions'):
+            self._stream('text/event-stream', self._sse())
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def _ndjson(self):
+        for piece in tokens(ANSWER):
+            yield json.dumps({"response": piece, "done": False}, ensure_ascii=False) + "\n"
+        yield json.dumps({"response": "", "done": True}) + "\n"
+
+    def _sse(self):
+        for piece in tokens(ANSWER):
+            chunk = {"choices": [{"delta": {"content": piece}}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    def _stream(self, content_type, lines):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for line in lines:
+            data = line.encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(self.state.delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def serve(host='127.0.0.1', port=8765, delay=0.02, fail_first=0):
+    Handler.state = MockState(delay, fail_first)
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"🧪 Mock LLM server on http://{host}:{server.server_port}")
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="本地模拟 LLM 流式接口（测试用）")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.02, help="每个 token 之间的延迟（秒）")
+    parser.add_argument('--fail-first', type=int, default=0, help="前 N 个请求返回 503，用于测试重试")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.delay, args.fail_first).serve_forever()
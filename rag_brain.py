@@ -1,44 +1,47 @@
 import os
 from dotenv import load_dotenv
-import json
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import requests
+
+from brain_loader import LazyResource, StartupTimer, load_index_model, check_index_compatibility
+from shards import ShardSet
+from relevance import load_relevance
+from context_builder import build_context, describe as describe_context
+from llm_backends import stream_ollama, stream_chat, print_stream, format_timing
 
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
 # 配置 Ollama
-OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/generate")
 OLLAMA_MODEL = "qwen3:1.7b"
 
 # 配置 Zhipu
 ZHIPU_API_KEY = os.environ.get("ZHIPU_API_KEY")
-ZHIPU_URL = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
+ZHIPU_URL = os.environ.get("ZHIPU_URL", "https://open.bigmodel.cn/api/paas/v4/chat/completions")
 ZHIPU_MODEL = "glm-4-air"
 
-# Load the local paraphrase-multilingual-MiniLM-L12-v2 model for better Chinese support
-model = SentenceTransformer(os.path.join(os.path.dirname(__file__), 'models', 'paraphrase-multilingual-MiniLM-L12-v2'))
-
-# Load FAISS index and metadata
-index = faiss.read_index(os.path.join(os.path.dirname(__file__), 'md_faiss.index'))
-with open(os.path.join(os.path.dirname(__file__), 'md_faiss_meta.json'), 'r', encoding='utf-8') as f:
-    meta = json.load(f)
+# Model, FAISS indexes and metadata load lazily (in background threads once the REPL starts)
+# One index shard per collection, searched in parallel (see shards.py)
+shards = ShardSet()
+# The embedding model is the one recorded in md_faiss_manifest.json, i.e. the one that built the index
+model_res = LazyResource('embedding model', lambda: load_index_model(manifest_path=shards.manifest_paths[0]))
+# Score metric and relevance thresholds of the index (md_faiss_params.json)
+relevance = load_relevance(shards.params_path)
 
 def search(query, top_k=5):
-    query_vec = model.encode([query])
-    D, I = index.search(np.array(query_vec).astype('float32'), top_k)
+    query_vec = model_res.get().encode([query], normalize_embeddings=True)  # cosine, like the index
+    D, I = shards.search(np.array(query_vec).astype('float32'), top_k)
+    rows = shards.get_many(I[0])
     results = []
     for idx, score in zip(I[0], D[0]):
+        if int(idx) not in rows:
+            continue
         results.append({
             'score': float(score),
-            'path': meta[idx]['path'],
-            'content': meta[idx]['content'][:800]  # 增加到800字符获得更多上下文
+            'path': rows[int(idx)]['path'],
+            'content': rows[int(idx)]['content'][:800]  # 增加到800字符获得更多上下文
         })
     
-    # FAISS已经按L2距离排序（从小到大），距离越小越相似
-    # 可选：添加相似度阈值过滤
-    # results = [r for r in results if r['score'] < 20.0]  # 过滤掉相似度太低的
+    # FAISS已按相关度排序（余弦相似度从大到小），阈值见 relevance.py
     
     return results
 
@@ -52,17 +55,19 @@ def rag_ask(query, top_k=10, use_zhipu=False):
     print(f"[2/3] 📄 已检索到{len(docs)}个片段，正在组织提示词...")
     
     # 相似度分析和过滤
-    best_score = docs[0]['score'] if docs else float('inf')
-    worst_score = docs[-1]['score'] if docs else float('inf')
+    best_score = relevance.best([d['score'] for d in docs])
+    worst_score = relevance.worst([d['score'] for d in docs])
     
-    # 相似度质量评估 (L2距离：数值越小越相似)
-    if best_score > 12:
-        print(f"⚠️  相似度警告：最佳匹配度为 {best_score:.3f}，相关性较低")
-    elif best_score < 5:
-        print(f"✅ 高质量匹配：最佳相似度 {best_score:.3f}")
+    # 相似度质量评估（分数含义与阈值由索引的度量决定，见 relevance.py）
+    if best_score is not None:
+        if relevance.level(best_score) == 'poor':
+            print(f"⚠️  相似度警告：最佳匹配度为 {best_score:.3f}，相关性较低")
+        elif relevance.level(best_score) == 'excellent':
+            print(f"✅ 高质量匹配：最佳相似度 {best_score:.3f}")
     
     # 显示检索到的相关文档（完整列表，已按相关度排序）
-    print(f"\n📚 检索到的相关文档（共{len(docs)}个，按相关度排序，相似度范围: {best_score:.3f} - {worst_score:.3f}）:")
+    score_range = f"{best_score:.3f} - {worst_score:.3f}" if best_score is not None else "无"
+    print(f"\n📚 检索到的相关文档（共{len(docs)}个，按相关度排序，{relevance.describe()}，范围: {score_range}）:")
     for i, d in enumerate(docs, 1):
         file_name = os.path.basename(d['path'])
         file_ext = os.path.splitext(file_name)[1].upper()
@@ -76,13 +81,8 @@ def rag_ask(query, top_k=10, use_zhipu=False):
         else:
             icon = "📁"
         
-        # 相似度颜色标识 (L2距离：越小越相似)
-        if d['score'] < 8:
-            score_indicator = "🟢"  # 高相关 (距离小)
-        elif d['score'] < 12:
-            score_indicator = "🟡"  # 中等相关
-        else:
-            score_indicator = "🔴"  # 低相关 (距离大)
+        # 相似度颜色标识：🟢 高相关，🟡 中等相关，🔴 低相关
+        score_indicator = relevance.indicator(d['score'])
         
         # 添加排名指示
         rank_indicator = f"#{i}" if i <= 3 else f"#{i}"
@@ -90,20 +90,16 @@ def rag_ask(query, top_k=10, use_zhipu=False):
     print("")  # 空行分隔
     
     # 构建上下文，明确标注每个片段的来源
-    # 智能过滤：如果最佳匹配度太高(距离大=不相似)，减少使用的文档数量
-    if best_score > 15:
-        filtered_docs = docs[:3]  # 相关性很低，只使用前3个
+    # 智能过滤：最佳匹配只是中等相关时用前6个，相关性很低时只用前3个
+    filtered_docs = docs[:relevance.context_limit(best_score, len(docs))]
+    if best_score is not None and relevance.level(best_score) == 'poor':
         print(f"🔍 由于相关性较低，只使用前{len(filtered_docs)}个最相关文档")
-    elif best_score > 10:
-        filtered_docs = docs[:6]  # 相关性中等，使用前6个
-    else:
-        filtered_docs = docs  # 相关性高，使用全部
     
-    context_parts = []
-    for i, d in enumerate(filtered_docs, 1):
-        file_name = os.path.basename(d['path'])
-        context_parts.append(f"【片段{i}】\n来源文件：{file_name}\n内容：{d['content']}")
-    context = "\n\n".join(context_parts)
+    # 去除近似重复的片段，按相关度依次放入直到用完目标后端的 token 预算（见 context_builder.py）
+    context, _, info = build_context(filtered_docs, 'zhipu' if use_zhipu else 'ollama')
+    note = describe_context(info)
+    if note:
+        print(note)
     
     # 强化版提示词，重点强调引用要求和文件类型
     prompt = (
@@ -128,64 +124,58 @@ def rag_ask(query, top_k=10, use_zhipu=False):
 
 
 def _call_zhipu(prompt):
-    """调用智谱AI"""
+    """调用智谱AI - 流式输出"""
     if not ZHIPU_API_KEY:
-        return "[Zhipu API Key 未设置，请设置环境变量 ZHIPU_API_KEY]"
+        msg = "[Zhipu API Key 未设置，请设置环境变量 ZHIPU_API_KEY]"
+        print(msg)
+        return msg
     
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {ZHIPU_API_KEY}"
-    }
-    data = {
-        "model": ZHIPU_MODEL,
-        "messages": [
-            {"role": "system", "content": "你是一个有用的AI助手。"},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.6,
-        "stream": False
-    }
+    messages = [
+        {"role": "system", "content": "你是一个有用的AI助手。"},
+        {"role": "user", "content": prompt}
+    ]
     try:
         print("[3/3] 🤖 正在等待智谱AI生成回答...")
-        resp = requests.post(ZHIPU_URL, headers=headers, json=data, timeout=120)
-        resp.raise_for_status()
-        result = resp.json()
-        content = result.get("choices", [{}])[0].get("message", {}).get("content", "[智谱未返回内容]")
-        return content.strip()
+        content, ttft, ai_time = print_stream(stream_chat(ZHIPU_URL, ZHIPU_API_KEY, ZHIPU_MODEL, messages))
+        print(f"🤖 AI回答生成耗时: {format_timing(ttft, ai_time)}")
+        return content.strip() or "[智谱未返回内容]"
     except Exception as e:
-        return f"[智谱调用失败: {e}]"
+        msg = f"[智谱调用失败: {e}]"
+        print(msg)
+        return msg
 
 
 def _call_ollama(prompt, docs):
-    """调用Ollama本地模型"""
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False
-    }
+    """调用Ollama本地模型 - 流式输出"""
     try:
         print("[3/3] 🤖 正在等待Ollama生成回答...")
-        resp = requests.post(OLLAMA_URL, json=payload, timeout=120)
-        resp.raise_for_status()
-        result = resp.json()
-        
-        response = result.get("response", "[Ollama未返回内容]")
+        response, ttft, ai_time = print_stream(stream_ollama(OLLAMA_URL, OLLAMA_MODEL, prompt))
+        print(f"🤖 AI回答生成耗时: {format_timing(ttft, ai_time)}")
         
-        # 清理响应
-        import re
-        response = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL)
+        if not response.strip():
+            response = "[Ollama未返回内容]"
+            print(response)
         
         # 检查是否包含来源标注，如果没有则自动添加
+        import re
         if not re.search(r'\[来源：.*?\]', response) and not re.search(r'\(.*\.md\)', response):
             print("⚠️  检测到回答缺少来源标注，自动添加...")
             source_list = [os.path.basename(d['path']) for d in docs[:3]]
-            response += f"\n\n**参考来源:** {', '.join(source_list)}"
+            sources = f"\n\n**参考来源:** {', '.join(source_list)}"
+            print(sources.lstrip())
+            response += sources
         
         return response.strip()
     except Exception as e:
-        return f"[Ollama调用失败: {e}]"
+        msg = f"[Ollama调用失败: {e}]"
+        print(msg)
+        return msg
 
 if __name__ == '__main__':
+    check_index_compatibility(shards.manifest_paths)
+    startup = StartupTimer(model_res, *shards.index_resources(), *shards.meta_resources())
+    for res in (*shards.index_resources(), *shards.meta_resources(), model_res):
+        res.start()
     use_zhipu = False
     print("\n🧠 数字大脑 - 改进版RAG问答系统")
     print("✨ 新功能：自动显示文档来源，强化引用要求")
@@ -195,6 +185,7 @@ if __name__ == '__main__':
     print("  exit   - 退出程序")
     
     while True:
+        startup.prompt_ready()
         query = input('\n💭 请输入你的问题: ')
         if query.lower() == 'exit':
             print("👋 再见！")
@@ -210,6 +201,7 @@ if __name__ == '__main__':
             
         if query.strip():
             print('\n🚀 开始处理...')
-            answer = rag_ask(query, use_zhipu=use_zhipu)
-            print(f'\n📝 【任老师的回答】\n{answer}\n')
+            rag_ask(query, use_zhipu=use_zhipu)  # 回答在生成过程中逐字输出
+            print()
+            startup.answered()
             print("-" * 50)
@@ -1,52 +1,49 @@
 import os
 from dotenv import load_dotenv
-import json
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import requests
 import time
 
+from brain_loader import LazyResource, StartupTimer, load_index_model, check_index_compatibility
+from shards import ShardSet
+from relevance import load_relevance
+from context_builder import build_context, describe as describe_context
+from llm_backends import stream_ollama, stream_chat, print_stream, format_timing
+
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
 # 配置 Ollama
-OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/generate")
 OLLAMA_MODEL = "qwen3:1.7b"
 
 # 配置 DeepSeek
 DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY")
-DEEPSEEK_URL = "https://api.deepseek.com/chat/completions"
+DEEPSEEK_URL = os.environ.get("DEEPSEEK_URL", "https://api.deepseek.com/chat/completions")
 DEEPSEEK_MODEL = "deepseek-chat"
 
-# ⚡ Performance optimization: Load model and index only once
-print("⚡ 快速启动优化版 - 加载模型中...")
-start_time = time.time()
-
-# Load the local BAAI/bge-large-zh model for better Chinese support (1024-dim)
-model = SentenceTransformer(os.path.join(os.path.dirname(__file__), 'models', 'bge-large-zh'))
-
-# Load FAISS index and metadata
-index = faiss.read_index(os.path.join(os.path.dirname(__file__), 'md_faiss.index'))
-with open(os.path.join(os.path.dirname(__file__), 'md_faiss_meta.json'), 'r', encoding='utf-8') as f:
-    meta = json.load(f)
-
-load_time = time.time() - start_time
-print(f"✅ 模型加载完成，耗时: {load_time:.2f}s")
+# ⚡ 快速启动：模型、索引、元数据在首次使用时加载（REPL启动后在后台线程预加载）
+# 每个集合一个索引分片（尽可能使用内存映射），检索时并行查询各分片（见 shards.py）
+shards = ShardSet()
+# 嵌入模型取自 md_faiss_manifest.json（即构建索引所用的模型，如 bge-large-zh）
+model_res = LazyResource('embedding model', lambda: load_index_model(manifest_path=shards.manifest_paths[0]))
+# Score metric and relevance thresholds of the index (md_faiss_params.json)
+relevance = load_relevance(shards.params_path)
 
 def search(query, top_k=15):
     """优化的搜索函数"""
     # ⚡ 直接编码，关闭进度条以提升速度
-    query_vec = model.encode([query], show_progress_bar=True)
-    D, I = index.search(np.array(query_vec).astype('float32'), top_k)
+    query_vec = model_res.get().encode([query], show_progress_bar=False, normalize_embeddings=True)
+    D, I = shards.search(np.array(query_vec).astype('float32'), top_k)
     
-    # ⚡ 使用列表推导式优化性能
+    # ⚡ 只读取top-k对应的元数据行
+    rows = shards.get_many(I[0])
     results = [
         {
             'score': float(score),
-            'path': meta[idx]['path'],
-            'content': meta[idx]['content'][:800]
+            'path': rows[int(idx)]['path'],
+            'content': rows[int(idx)]['content'][:800]
         }
         for idx, score in zip(I[0], D[0])
+        if int(idx) in rows
     ]
     
     return results
@@ -64,17 +61,19 @@ def rag_ask(query, top_k=15, use_deepseek=False):
     print(f"[2/3] 📄 已检索到{len(docs)}个片段，正在组织提示词... (检索耗时: {search_time:.2f}s)")
     
     # 相似度分析和过滤
-    best_score = docs[0]['score'] if docs else float('inf')
-    worst_score = docs[-1]['score'] if docs else float('inf')
+    best_score = relevance.best([d['score'] for d in docs])
+    worst_score = relevance.worst([d['score'] for d in docs])
     
-    # 相似度质量评估 (L2距离：数值越小越相似)
-    if best_score > 12:
-        print(f"⚠️  相似度警告：最佳匹配度为 {best_score:.3f}，相关性较低")
-    elif best_score < 5:
-        print(f"✅ 高质量匹配：最佳相似度 {best_score:.3f}")
+    # 相似度质量评估（分数含义与阈值由索引的度量决定，见 relevance.py）
+    if best_score is not None:
+        if relevance.level(best_score) == 'poor':
+            print(f"⚠️  相似度警告：最佳匹配度为 {best_score:.3f}，相关性较低")
+        elif relevance.level(best_score) == 'excellent':
+            print(f"✅ 高质量匹配：最佳相似度 {best_score:.3f}")
     
     # 显示检索到的相关文档（完整列表，已按相关度排序）
-    print(f"\n📚 检索到的相关文档（共{len(docs)}个，按相关度排序，相似度范围: {best_score:.3f} - {worst_score:.3f}）:")
+    score_range = f"{best_score:.3f} - {worst_score:.3f}" if best_score is not None else "无"
+    print(f"\n📚 检索到的相关文档（共{len(docs)}个，按相关度排序，{relevance.describe()}，范围: {score_range}）:")
     for i, d in enumerate(docs, 1):
         file_name = os.path.basename(d['path'])
         file_ext = os.path.splitext(file_name)[1].upper()
@@ -82,32 +81,22 @@ def rag_ask(query, top_k=15, use_deepseek=False):
         # 文件类型图标
         icon = {"MD": "📄", "PPTX": "🎯", "PDF": "📋"}.get(file_ext, "📁")
         
-        # 相似度颜色标识
-        if d['score'] < 8:
-            score_indicator = "🟢"  # 高相关
-        elif d['score'] < 12:
-            score_indicator = "🟡"  # 中等相关
-        else:
-            score_indicator = "🔴"  # 低相关
+        # 相似度颜色标识：🟢 高相关，🟡 中等相关，🔴 低相关
+        score_indicator = relevance.indicator(d['score'])
         
         print(f"  #{i} {icon} {file_name} {score_indicator} (相似度: {d['score']:.3f})")
     print("")
     
-    # 智能过滤文档
-    if best_score > 15:
-        filtered_docs = docs[:3]
+    # 智能过滤文档（阈值随索引度量，见 relevance.py）
+    filtered_docs = docs[:relevance.context_limit(best_score, len(docs))]
+    if best_score is not None and relevance.level(best_score) == 'poor':
         print(f"🔍 由于相关性较低，只使用前{len(filtered_docs)}个最相关文档")
-    elif best_score > 10:
-        filtered_docs = docs[:6]
-    else:
-        filtered_docs = docs
     
-    # ⚡ 优化：使用列表推导式构建上下文
-    context_parts = [
-        f"【片段{i}】\n来源文件：{os.path.basename(d['path'])}\n内容：{d['content']}"
-        for i, d in enumerate(filtered_docs, 1)
-    ]
-    context = "\n\n".join(context_parts)
+    # 去除近似重复的片段，按相关度依次放入直到用完目标后端的 token 预算（见 context_builder.py）
+    context, _, info = build_context(filtered_docs, 'deepseek' if use_deepseek else 'ollama')
+    note = describe_context(info)
+    if note:
+        print(note)
     
     # 强化提示词
     prompt = (
@@ -132,72 +121,59 @@ def rag_ask(query, top_k=15, use_deepseek=False):
 
 
 def _call_deepseek(prompt):
-    """调用DeepSeek AI"""
+    """调用DeepSeek AI - 流式输出"""
     if not DEEPSEEK_API_KEY:
-        return "[DeepSeek API Key 未设置，请设置环境变量 DEEPSEEK_API_KEY]"
+        msg = "[DeepSeek API Key 未设置，请设置环境变量 DEEPSEEK_API_KEY]"
+        print(msg)
+        return msg
     
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-    }
-    data = {
-        "model": DEEPSEEK_MODEL,
-        "messages": [
-            {"role": "system", "content": "你是一个有用的AI助手。"},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.6,
-        "stream": False
-    }
+    messages = [
+        {"role": "system", "content": "你是一个有用的AI助手。"},
+        {"role": "user", "content": prompt}
+    ]
     try:
-        ai_start = time.time()
         print("[3/3] 🤖 正在等待DeepSeek AI生成回答...")
-        resp = requests.post(DEEPSEEK_URL, headers=headers, json=data, timeout=120)
-        resp.raise_for_status()
-        result = resp.json()
-        ai_time = time.time() - ai_start
-        print(f"⚡ AI回答生成耗时: {ai_time:.2f}s")
-        
-        content = result.get("choices", [{}])[0].get("message", {}).get("content", "[DeepSeek未返回内容]")
-        return content.strip()
+        content, ttft, ai_time = print_stream(stream_chat(DEEPSEEK_URL, DEEPSEEK_API_KEY, DEEPSEEK_MODEL, messages))
+        print(f"⚡ AI回答生成耗时: {format_timing(ttft, ai_time)}")
+        return content.strip() or "[DeepSeek未返回内容]"
     except Exception as e:
-        return f"[DeepSeek调用失败: {e}]"
+        msg = f"[DeepSeek调用失败: {e}]"
+        print(msg)
+        return msg
 
 
 def _call_ollama(prompt, docs):
-    """调用Ollama本地模型"""
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False
-    }
+    """调用Ollama本地模型 - 流式输出"""
     try:
-        ai_start = time.time()
         print("[3/3] 🤖 正在等待Ollama生成回答...")
-        resp = requests.post(OLLAMA_URL, json=payload, timeout=120)
-        resp.raise_for_status()
-        result = resp.json()
-        ai_time = time.time() - ai_start
-        print(f"⚡ AI回答生成耗时: {ai_time:.2f}s")
+        response, ttft, ai_time = print_stream(stream_ollama(OLLAMA_URL, OLLAMA_MODEL, prompt))
+        print(f"⚡ AI回答生成耗时: {format_timing(ttft, ai_time)}")
         
-        response = result.get("response", "[Ollama未返回内容]")
-        
-        # 清理响应
-        import re
-        response = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL)
+        if not response.strip():
+            response = "[Ollama未返回内容]"
+            print(response)
         
         # 检查来源标注
+        import re
         if not re.search(r'\[来源：.*?\]', response) and not re.search(r'\(.*\.md\)', response):
             print("⚠️  检测到回答缺少来源标注，自动添加...")
             source_list = [os.path.basename(d['path']) for d in docs[:3]]
-            response += f"\n\n**参考来源:** {', '.join(source_list)}"
+            sources = f"\n\n**参考来源:** {', '.join(source_list)}"
+            print(sources.lstrip())
+            response += sources
         
         return response.strip()
     except Exception as e:
-        return f"[Ollama调用失败: {e}]"
+        msg = f"[Ollama调用失败: {e}]"
+        print(msg)
+        return msg
 
 
 if __name__ == '__main__':
+    check_index_compatibility(shards.manifest_paths)
+    startup = StartupTimer(model_res, *shards.index_resources(), *shards.meta_resources())
+    for res in (*shards.index_resources(), *shards.meta_resources(), model_res):
+        res.start()
     use_deepseek = False
     print("\n🧠 数字大脑 - 性能优化版 ⚡")
     print("✨ 优化：快速启动、性能监控、智能过滤")
@@ -207,6 +183,7 @@ if __name__ == '__main__':
     print("  exit     - 退出程序")
     
     while True:
+        startup.prompt_ready()
         query = input('\n💭 请输入你的问题: ')
         if query.lower() == 'exit':
             print("👋 再见！")
@@ -223,8 +200,8 @@ if __name__ == '__main__':
         if query.strip():
             total_start = time.time()
             print('\n🚀 开始处理...')
-            answer = rag_ask(query, use_deepseek=use_deepseek)
+            rag_ask(query, use_deepseek=use_deepseek)  # 回答在生成过程中逐字输出
             total_time = time.time() - total_start
-            print(f'\n📝 【任老师的回答】\n{answer}\n')
-            print(f"⚡ 总耗时: {total_time:.2f}s")
+            print(f"\n⚡ 总耗时: {total_time:.2f}s")
+            startup.answered()
             print("-" * 50)
\ No newline at end of file
@@ -1,92 +1,248 @@
 import os
-from dotenv import load_dotenv
+import argparse
+import asyncio
 import json
-import faiss
+import re
+from dotenv import load_dotenv
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import requests
 from functools import lru_cache
 import time
 
+from answer_cache import AnswerCache
+from brain_config import RERANK_MODEL_DIR
+from brain_loader import LazyResource, StartupTimer, load_index_model, check_index_compatibility
+from shards import ShardSet
+from relevance import load_relevance
+from lexical_index import rrf_fuse
+from context_builder import build_context, describe as describe_context
+from reranker import load_reranker, rerank, RERANK_CANDIDATES, RERANK_TOP_N
+from tracing import span, trace, traced, record, format_stats, profiled, enable as enable_trace
+from llm_backends import (ANSWER_HEADER, stream_ollama, stream_chat, print_stream, format_timing,
+                          AsyncClients, astream_ollama, astream_chat, acollect, LLM_CONCURRENCY)
+
 load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 
 # 配置 Ollama
-OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/generate")
 OLLAMA_MODEL = "qwen3:latest"
 
 # 配置 Zhipu
 ZHIPU_API_KEY = os.environ.get("ZHIPU_API_KEY")
-ZHIPU_URL = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
+ZHIPU_URL = os.environ.get("ZHIPU_URL", "https://open.bigmodel.cn/api/paas/v4/chat/completions")
 ZHIPU_MODEL = "glm-4-air"
 
-# ⚡ Performance optimization: Load model and index only once
-print("🔧 Loading models and indexes...")
-start_time = time.time()
+# ⚡ Fast startup: model, index and metadata load lazily on first use
+# (the REPL starts them in background threads so the prompt appears immediately)
+# 📚 One index shard per collection (see shards.py); searches fan out over them in parallel
+shards = ShardSet()
+# The embedding model is the one recorded in md_faiss_manifest.json, i.e. the one that built the index
+model_res = LazyResource('embedding model', lambda: load_index_model(manifest_path=shards.manifest_paths[0]))
+# Score metric and relevance thresholds of the index (md_faiss_params.json)
+relevance = load_relevance(shards.params_path)
+# 💾 Persistent semantic cache of LLM answers (see answer_cache.py)
+answer_cache_res = LazyResource('answer cache', AnswerCache)
 
-# Load the local paraphrase-multilingual-MiniLM-L12-v2 model for better Chinese support
-model = SentenceTransformer(os.path.join(os.path.dirname(__file__), 'models', 'paraphrase-multilingual-MiniLM-L12-v2'))
+# 🔤 Hybrid retrieval: BM25 keyword hits are fused with the vector hits (see lexical_index.py)
+HYBRID_SEARCH = True
+# 向量与关键词两路各取 top_k * HYBRID_DEPTH 个候选，按倒数排名融合后取 top_k
+HYBRID_DEPTH = 2
 
-# Load FAISS index and metadata
-index = faiss.read_index(os.path.join(os.path.dirname(__file__), 'md_faiss.index'))
-with open(os.path.join(os.path.dirname(__file__), 'md_faiss_meta.json'), 'r', encoding='utf-8') as f:
-    meta = json.load(f)
 
-print(f"✅ Models loaded in {time.time() - start_time:.2f}s")
+# 🎯 Optional cross-encoder rerank (see reranker.py), enabled when the reranker model folder exists
+USE_RERANK = os.path.isdir(RERANK_MODEL_DIR)
+reranker_res = LazyResource('reranker', load_reranker)
 
 # ⚡ Performance optimization: Cache search results for repeated queries
 @lru_cache(maxsize=100)
-def search_cached(query, top_k=5):
+def search_cached(query, top_k=5, collections=None):
     """Cached version of search for better performance"""
-    return search_impl(query, top_k)
+    return search_impl(query, top_k, collections)
 
-def search_impl(query, top_k=5):
+def refresh_index():
+    """Swap in shards rewritten by embed_and_index.py / watch_index.py; cached results of the old ones are dropped."""
+    reloaded = shards.refresh()
+    if reloaded:
+        search_cached.cache_clear()
+        if answer_cache_res.ready:
+            answer_cache_res.get().refresh_index()
+    return reloaded
+
+def search_impl(query, top_k=5, collections=None):
     """Optimized search implementation"""
-    # ⚡ Use batch encoding for potential future multi-query optimization
-    query_vec = model.encode([query], show_progress_bar=False, convert_to_numpy=True)
-    
-    # ⚡ Direct numpy array without extra conversion
-    D, I = index.search(query_vec.astype('float32'), top_k)
+    return search_vectors(encode_cached(query)[None, :], top_k, [query], collections)[0]
+
+
+@lru_cache(maxsize=100)
+def encode_cached(query):
+    """Query vector, shared by search and the answer cache lookup"""
+    return encode_queries([query])[0]
+
+
+@traced('encode')
+def encode_queries(queries):
+    # ⚡ All queries go through the model in a single batched forward pass
+    # Normalized like the indexed vectors, so inner-product scores are cosine similarities
+    return model_res.get().encode(list(queries), batch_size=min(len(queries), 256), show_progress_bar=False,
+                                  convert_to_numpy=True, normalize_embeddings=True).astype('float32')
+
+
+def search_many(queries, top_k=5, collections=None):
+    """Batch search: one encode pass and one index.search for all queries, results per query"""
+    queries = list(queries)
+    if not queries:
+        return []
+    return search_vectors(encode_queries(queries), top_k, queries, collections)
+
+
+def search_vectors(query_vecs, top_k=5, queries=None, collections=None):
+    """Search with already encoded query vectors (one row per query).
+    With the query texts, vector and BM25 keyword hits are fused by reciprocal rank.
+    collections: names of the collections to search (None = all)."""
+    hybrid = HYBRID_SEARCH and queries is not None and shards.has_lexical(collections)
+    depth = top_k * HYBRID_DEPTH if hybrid else top_k
+    # ⚡ One FAISS search over the stacked query matrix per shard, shards in parallel
+    D, I = shards.search(query_vecs, depth, collections)
     
-    # ⚡ Pre-allocate results list for better memory performance
-    results = []
+    if not hybrid:
+        # ⚡ Only the top-k rows are read from the metadata store, in one lookup for all queries
+        rows = shards.get_many(np.unique(I))
+        return [_build_results(I[q], D[q], rows) for q in range(len(I))]
     
-    for idx, score in zip(I[0], D[0]):
-        results.append({
-            'score': float(score),
-            'path': meta[idx]['path'],
-            'content': meta[idx]['content'][:800]  # 增加到800字符获得更多上下文
-        })
+    ranked = []
+    for q, query in enumerate(queries):
+        dense = {int(i): float(d) for i, d in zip(I[q], D[q]) if i >= 0}
+        keyword = dict(shards.lexical_search(query, depth, collections))
+        fused = rrf_fuse([list(dense), list(keyword)])[:top_k]
+        # Keyword-only hits get their exact vector score, so thresholds see one scale
+        missing = [i for i, _ in fused if i not in dense]
+        if missing:
+            dense.update(shards.score_ids(query_vecs[q], missing))
+        ranked.append((fused, dense, keyword))
     
+    rows = shards.get_many({i for fused, _, _ in ranked for i, _ in fused})
+    return [
+        _build_results([i for i, _ in fused], [dense.get(i) for i, _ in fused], rows,
+                       [{'bm25': keyword.get(i), 'rrf': rrf} for i, rrf in fused])
+        for fused, dense, keyword in ranked
+    ]
+
+
+def _build_results(ids, scores, rows, extras=None):
+    results = []
+    for n, (idx, score) in enumerate(zip(ids, scores)):
+        entry = rows.get(int(idx))
+        if entry is None:
+            continue  # -1 padding (fewer than top_k vectors) or a row removed by re-indexing
+        # 每个向量对应一个片段：返回命中的段落及其位置（页码/幻灯片号、字符偏移）
+        result = {
+            'id': int(idx),
+            'collection': shards.collection_of(idx),
+            'score': None if score is None else float(score),  # None: keyword hit the index could not score
+            'path': entry['path'],
+            'page': entry['page'],
+            'offset': entry['offset'],
+            'content': entry['content'][:800]
+        }
+        if extras:
+            result.update(extras[n])
+        results.append(result)
     return results
 
-def search(query, top_k=5):
+
+def candidate_count(top_k):
+    """检索候选数：启用重排时先多取一些候选"""
+    return max(top_k, RERANK_CANDIDATES) if USE_RERANK else top_k
+
+
+def select_passages(query, docs, top_k, wait=False, verbose=True):
+    """重排候选片段并保留最好的 RERANK_TOP_N 个；重排不可用、模型未就绪（wait=False）或超时则按检索顺序取前 top_k 个"""
+    if not USE_RERANK or not docs:
+        return docs[:top_k]
+    if not reranker_res.ready and not wait:
+        reranker_res.start()
+        if verbose:
+            print("⏳ 重排模型加载中，本次使用检索原顺序")
+        return docs[:top_k]
+    try:
+        with span('rerank', candidates=len(docs)):
+            ranked, info = rerank(reranker_res.get(), query, docs, min(RERANK_TOP_N, top_k))
+    except Exception as e:
+        if verbose:
+            print(f"⚠️  重排失败（{e}），使用检索原顺序")
+        return docs[:top_k]
+    if info['status'] == 'timeout':
+        if verbose:
+            print(f"⏱️ 重排超出时间预算（{info['ms']:.0f}ms，已评分{info['scored']}/{len(docs)}），使用检索原顺序")
+        return docs[:top_k]
+    if verbose:
+        print(f"🎯 重排完成：{len(docs)}个候选 → {len(ranked)}个片段（{info['ms']:.0f}ms）")
+    return ranked
+
+
+def source_label(d):
+    """文件名加页码/幻灯片号，例如 'book.pdf 第12页'"""
+    file_name = os.path.basename(d['path'])
+    page = d.get('page')
+    if page is None:
+        return file_name
+    if file_name.lower().endswith('.pptx'):
+        return f"{file_name} 第{page}张幻灯片"
+    return f"{file_name} 第{page}页"
+
+def search(query, top_k=5, collections=None):
     """Public search interface with caching"""
     # Use the query string directly for caching
-    return search_cached(query, top_k)
+    return search_cached(query, top_k, tuple(collections) if collections else None)
+
+def backend_name(use_zhipu):
+    """回答缓存按后端和模型区分"""
+    return f"zhipu:{ZHIPU_MODEL}" if use_zhipu else f"ollama:{OLLAMA_MODEL}"
+
+
+def is_llm_error(answer):
+    """调用失败/未配置时返回的占位文本，不写入回答缓存"""
+    return bool(re.match(r'^\[[^\]\n]*(失败|未设置|未返回)[^\]\n]*\]$', answer))
 
-def rag_ask(query, top_k=10, use_zhipu=False):
+
+def cached_answer(query_vec, docs, use_zhipu):
+    """回答缓存查询，未命中返回 None"""
+    return answer_cache_res.get().get(backend_name(use_zhipu), [d['id'] for d in docs], query_vec)
+
+
+def store_answer(query_vec, docs, use_zhipu, query, answer):
+    if answer and not is_llm_error(answer):
+        answer_cache_res.get().put(backend_name(use_zhipu), [d['id'] for d in docs], query_vec, query, answer)
+
+
+def rag_ask(query, top_k=10, use_zhipu=False, docs=None, use_cache=True, collections=None):
     """
     RAG问答函数，带有改进的源引用功能和性能优化
+    docs: 已检索好的片段（批量模式由 search_many 一次检索），为 None 时在此检索
+    use_cache: 相似问题且检索到相同片段时直接返回缓存的回答
+    collections: 只检索这些集合（None 为全部）
     """
     start_time = time.time()
     print("[1/3] 🔍 正在检索相关片段...")
     
-    docs = search(query, top_k)
+    if docs is None:
+        docs = select_passages(query, search(query, candidate_count(top_k), collections), top_k)
     search_time = time.time() - start_time
     print(f"[2/3] 📄 已检索到{len(docs)}个片段，正在组织提示词... (检索耗时: {search_time:.2f}s)")
     
-    # 相似度分析和过滤
-    best_score = docs[0]['score'] if docs else float('inf')
-    worst_score = docs[-1]['score'] if docs else float('inf')
+    # 相似度分析和过滤（仅关键词命中且无法计算向量分数的片段不参与）
+    best_score = relevance.best([d['score'] for d in docs])
+    worst_score = relevance.worst([d['score'] for d in docs])
     
-    # 相似度质量评估 (L2距离：数值越小越相似)
-    if best_score > 12:
-        print(f"⚠️  相似度警告：最佳匹配度为 {best_score:.3f}，相关性较低")
-    elif best_score < 5:
-        print(f"✅ 高质量匹配：最佳相似度 {best_score:.3f}")
+    # 相似度质量评估（分数含义与阈值由索引的度量决定，见 relevance.py）
+    if best_score is not None:
+        if relevance.level(best_score) == 'poor':
+            print(f"⚠️  相似度警告：最佳匹配度为 {best_score:.3f}，相关性较低")
+        elif relevance.level(best_score) == 'excellent':
+            print(f"✅ 高质量匹配：最佳相似度 {best_score:.3f}")
     
     # 显示检索到的相关文档（完整列表，已按相关度排序）
-    print(f"\n📚 检索到的相关文档（共{len(docs)}个，按相关度排序，相似度范围: {best_score:.3f} - {worst_score:.3f}）:")
+    score_range = f"{best_score:.3f} - {worst_score:.3f}" if best_score is not None else "无"
+    print(f"\n📚 检索到的相关文档（共{len(docs)}个，按相关度排序，{relevance.describe()}，范围: {score_range}）:")
     for i, d in enumerate(docs, 1):
         file_name = os.path.basename(d['path'])
         file_ext = os.path.splitext(file_name)[1].upper()
@@ -100,35 +256,52 @@ def rag_ask(query, top_k=10, use_zhipu=False):
         else:
             icon = "📁"
         
-        # 相似度颜色标识 (L2距离：越小越相似)
-        if d['score'] < 8:
-            score_indicator = "🟢"  # 高相关 (距离小)
-        elif d['score'] < 12:
-            score_indicator = "🟡"  # 中等相关
-        else:
-            score_indicator = "🔴"  # 低相关 (距离大)
+        # 相似度颜色标识：🟢 高相关，🟡 中等相关，🔴 低相关
+        if d['score'] is None:
+            print(f"  #{i} {icon} {source_label(d)} 🔤 (关键词匹配)")
+            continue
+        score_indicator = relevance.indicator(d['score'])
         
         # 添加排名指示
         rank_indicator = f"#{i}" if i <= 3 else f"#{i}"
-        print(f"  {rank_indicator} {icon} {file_name} {score_indicator} (相似度: {d['score']:.3f})")
+        print(f"  {rank_indicator} {icon} {source_label(d)} {score_indicator} (相似度: {d['score']:.3f})")
     print("")  # 空行分隔
     
+    if use_cache and docs:
+        query_vec = encode_cached(query)
+        hit = cached_answer(query_vec, docs, use_zhipu)
+        if hit is not None:
+            answer, similarity, cached_query, age = hit
+            print(f"[3/3] 💾 命中回答缓存（相似度 {similarity:.3f}，{age / 60:.0f}分钟前的问题：{cached_query[:30]}）")
+            print(ANSWER_HEADER + answer)
+            return answer
+    
+    prompt = build_prompt(query, docs, 'zhipu' if use_zhipu else 'ollama')
+    if use_zhipu:
+        answer = _call_zhipu(prompt)
+    else:
+        answer = _call_ollama(prompt, docs)
+    if use_cache and docs:
+        store_answer(query_vec, docs, use_zhipu, query, answer)
+    return answer
+
+
+@traced('context_build')
+def build_prompt(query, docs, backend='ollama'):
+    """按相关度筛选片段，去重后在目标后端的 token 预算内组装提示词（见 context_builder.py）"""
+    best_score = relevance.best([d['score'] for d in docs])
+    
     # 构建上下文，明确标注每个片段的来源
-    # 智能过滤：如果最佳匹配度太高(距离大=不相似)，减少使用的文档数量
-    if best_score > 15:
-        filtered_docs = docs[:3]  # 相关性很低，只使用前3个
+    # 智能过滤：最佳匹配只是中等相关时用前6个，相关性很低时只用前3个
+    filtered_docs = docs[:relevance.context_limit(best_score, len(docs))]
+    if best_score is not None and relevance.level(best_score) == 'poor':
         print(f"🔍 由于相关性较低，只使用前{len(filtered_docs)}个最相关文档")
-    elif best_score > 10:
-        filtered_docs = docs[:6]  # 相关性中等，使用前6个
-    else:
-        filtered_docs = docs  # 相关性高，使用全部
     
-    # ⚡ Performance optimization: Use list comprehension instead of loop
-    context_parts = [
-        f"【片段{i}】\n来源文件：{os.path.basename(d['path'])}\n内容：{d['content']}"
-        for i, d in enumerate(filtered_docs, 1)
-    ]
-    context = "\n\n".join(context_parts)
+    # 近似重复的片段（如同一文章的 .md 和 .pdf）只保留一份，按相关度依次放入直到用完 token 预算
+    context, _, info = build_context(filtered_docs, backend, label=source_label)
+    note = describe_context(info)
+    if note:
+        print(note)
     
     # 强化版提示词，重点强调引用要求和文件类型
     prompt = (
@@ -145,90 +318,190 @@ def rag_ask(query, top_k=10, use_zhipu=False):
         f"问题：{query}\n\n"
         "请按要求回答，每个观点都要标注来源，特别注意引用PPT和PDF文件内容："
     )
-    
-    if use_zhipu:
-        return _call_zhipu(prompt)
-    else:
-        return _call_ollama(prompt, docs)
+    return prompt
+
+
+def _chat_messages(prompt):
+    return [
+        {"role": "system", "content": "你是一个有用的AI助手。"},
+        {"role": "user", "content": prompt}
+    ]
+
+
+@traced('postprocess')
+def _with_sources(response, docs):
+    """回答缺少来源标注时补上前3个片段的文件名，返回 (回答, 是否补充)"""
+    if re.search(r'\[来源：.*?\]', response) or re.search(r'\(.*\.md\)', response):
+        return response, False
+    source_list = [os.path.basename(d['path']) for d in docs[:3]]
+    return response + f"\n\n**参考来源:** {', '.join(source_list)}", True
 
 
 def _call_zhipu(prompt):
-    """调用智谱AI - 优化版"""
+    """调用智谱AI - 流式输出"""
     if not ZHIPU_API_KEY:
-        return "[Zhipu API Key 未设置，请设置环境变量 ZHIPU_API_KEY]"
+        msg = "[Zhipu API Key 未设置，请设置环境变量 ZHIPU_API_KEY]"
+        print(msg)
+        return msg
     
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {ZHIPU_API_KEY}"
-    }
-    data = {
-        "model": ZHIPU_MODEL,
-        "messages": [
-            {"role": "system", "content": "你是一个有用的AI助手。"},
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0.6,
-        "stream": False
-    }
     try:
-        ai_start = time.time()
         print("[3/3] 🤖 正在等待智谱AI生成回答...")
-        resp = requests.post(ZHIPU_URL, headers=headers, json=data, timeout=120)
-        resp.raise_for_status()
-        result = resp.json()
-        ai_time = time.time() - ai_start
-        print(f"🤖 AI回答生成耗时: {ai_time:.2f}s")
-        
-        content = result.get("choices", [{}])[0].get("message", {}).get("content", "[智谱未返回内容]")
-        return content.strip()
+        llm_start = time.time()
+        with span('llm', backend='zhipu'):
+            content, ttft, ai_time = print_stream(stream_chat(ZHIPU_URL, ZHIPU_API_KEY, ZHIPU_MODEL, _chat_messages(prompt)))
+        if ttft is not None:
+            record('ttft', ttft, llm_start, backend='zhipu')
+        print(f"🤖 AI回答生成耗时: {format_timing(ttft, ai_time)}")
+        return content.strip() or "[智谱未返回内容]"
     except Exception as e:
-        return f"[智谱调用失败: {e}]"
+        msg = f"[智谱调用失败: {e}]"
+        print(msg)
+        return msg
 
 
 def _call_ollama(prompt, docs):
-    """调用Ollama本地模型 - 优化版"""
-    payload = {
-        "model": OLLAMA_MODEL,
-        "prompt": prompt,
-        "stream": False
-    }
+    """调用Ollama本地模型 - 流式输出，<think>块在输出过程中过滤"""
     try:
-        ai_start = time.time()
         print("[3/3] 🤖 正在等待Ollama生成回答...")
-        resp = requests.post(OLLAMA_URL, json=payload, timeout=120)
-        resp.raise_for_status()
-        result = resp.json()
-        ai_time = time.time() - ai_start
-        print(f"🤖 AI回答生成耗时: {ai_time:.2f}s")
+        llm_start = time.time()
+        with span('llm', backend='ollama'):
+            response, ttft, ai_time = print_stream(stream_ollama(OLLAMA_URL, OLLAMA_MODEL, prompt))
+        if ttft is not None:
+            record('ttft', ttft, llm_start, backend='ollama')
+        print(f"🤖 AI回答生成耗时: {format_timing(ttft, ai_time)}")
         
-        response = result.get("response", "[Ollama未返回内容]")
-        
-        # 清理响应
-        import re
-        response = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL)
+        if not response.strip():
+            response = "[Ollama未返回内容]"
+            print(response)
         
         # 检查是否包含来源标注，如果没有则自动添加
-        if not re.search(r'\[来源：.*?\]', response) and not re.search(r'\(.*\.md\)', response):
+        response, added = _with_sources(response, docs)
+        if added:
             print("⚠️  检测到回答缺少来源标注，自动添加...")
-            source_list = [os.path.basename(d['path']) for d in docs[:3]]
-            response += f"\n\n**参考来源:** {', '.join(source_list)}"
+            print(response[response.rindex('**参考来源:**'):])
         
         return response.strip()
     except Exception as e:
-        return f"[Ollama调用失败: {e}]"
+        msg = f"[Ollama调用失败: {e}]"
+        print(msg)
+        return msg
 
 
-if __name__ == '__main__':
-    use_zhipu = False
+async def ask_llm_async(clients, prompt, docs, use_zhipu):
+    """批量模式的单次调用（不逐字打印），返回 (回答, 首字耗时, 总耗时)"""
+    if use_zhipu:
+        if not ZHIPU_API_KEY:
+            return "[Zhipu API Key 未设置，请设置环境变量 ZHIPU_API_KEY]", None, 0.0
+        pieces = astream_chat(clients.get(ZHIPU_URL), ZHIPU_URL, ZHIPU_API_KEY, ZHIPU_MODEL, _chat_messages(prompt))
+        backend = "智谱"
+    else:
+        pieces = astream_ollama(clients.get(OLLAMA_URL), OLLAMA_URL, OLLAMA_MODEL, prompt)
+        backend = "Ollama"
+    llm_start = time.time()
+    try:
+        with span('llm', backend='zhipu' if use_zhipu else 'ollama'):
+            text, ttft, total = await acollect(pieces)
+    except Exception as e:
+        return f"[{backend}调用失败: {e}]", None, 0.0
+    if ttft is not None:
+        record('ttft', ttft, llm_start, backend='zhipu' if use_zhipu else 'ollama')
+    if not text:
+        return f"[{backend}未返回内容]", ttft, total
+    if not use_zhipu:
+        text = _with_sources(text, docs)[0]
+    return text, ttft, total
+
+
+async def answer_many(questions, prompts, all_docs, use_zhipu=False, concurrency=LLM_CONCURRENCY):
+    """并发生成多个回答（最多 concurrency 个请求同时进行，共用连接池），按输入顺序返回"""
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+
+    async def one(question, prompt, docs):
+        nonlocal done
+        async with semaphore:
+            answer, ttft, total = await ask_llm_async(clients, prompt, docs, use_zhipu)
+        done += 1
+        print(f"  ✅ [{done}/{len(questions)}] {question[:30]} ({format_timing(ttft, total)})")
+        return answer
+
+    async with AsyncClients() as clients:
+        return await asyncio.gather(*(one(q, p, d) for q, p, d in zip(questions, prompts, all_docs)))
+
+
+def load_questions(path):
+    """问题列表文件：每行一个问题，忽略空行和 # 开头的注释行"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+
+def run_batch(questions_path, out_path, top_k=10, answer=False, use_zhipu=False, concurrency=LLM_CONCURRENCY,
+              use_cache=True, collections=None):
+    """批量模式：一次检索全部问题，结果（可选含AI回答，并发生成）逐行写入 JSONL"""
+    questions = load_questions(questions_path)
+    print(f"📋 共{len(questions)}个问题，批量检索中...")
+    start = time.time()
+    query_vecs = encode_queries(questions) if questions else np.zeros((0, 0), dtype='float32')
+    all_docs = search_vectors(query_vecs, candidate_count(top_k), questions, collections) if questions else []
+    if USE_RERANK and questions:
+        rerank_start = time.time()
+        all_docs = [select_passages(q, docs, top_k, wait=True, verbose=False) for q, docs in zip(questions, all_docs)]
+        print(f"🎯 重排完成，耗时: {time.time() - rerank_start:.2f}s")
+    search_time = time.time() - start
+    print(f"✅ 批量检索完成，耗时: {search_time:.2f}s（平均每题 {search_time / max(len(questions), 1) * 1000:.0f}ms）")
+    
+    answers = None
+    if answer:
+        print(f"🤖 正在生成回答（并发 {concurrency}）...")
+        llm_start = time.time()
+        answers = [None] * len(questions)
+        if use_cache:
+            for i, (vec, docs) in enumerate(zip(query_vecs, all_docs)):
+                hit = cached_answer(vec, docs, use_zhipu) if docs else None
+                if hit is not None:
+                    answers[i] = hit[0]
+            hits = sum(a is not None for a in answers)
+            if hits:
+                print(f"💾 {hits}个问题命中回答缓存")
+        todo = [i for i, a in enumerate(answers) if a is None]
+        prompts = [build_prompt(questions[i], all_docs[i], 'zhipu' if use_zhipu else 'ollama') for i in todo]
+        generated = asyncio.run(answer_many([questions[i] for i in todo], prompts, [all_docs[i] for i in todo],
+                                            use_zhipu, concurrency))
+        for i, text in zip(todo, generated):
+            answers[i] = text
+            if use_cache and all_docs[i]:
+                store_answer(query_vecs[i], all_docs[i], use_zhipu, questions[i], text)
+        print(f"✅ 回答生成完成，耗时: {time.time() - llm_start:.2f}s")
+    
+    with open(out_path, 'w', encoding='utf-8') as f:
+        for i, (question, docs) in enumerate(zip(questions, all_docs)):
+            record = {'query': question, 'results': docs}
+            if answers is not None:
+                record['answer'] = answers[i]
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"📝 结果已写入 {out_path}，总耗时: {time.time() - start:.2f}s")
+
+
+def repl(use_zhipu=False, use_cache=True, collections=None):
+    """交互式问答循环"""
+    startup = StartupTimer(model_res, *shards.index_resources(), *shards.meta_resources())
+    for res in (*shards.index_resources(), *shards.meta_resources(), *shards.lexical_resources(),
+                answer_cache_res, model_res):
+        res.start()
+    if USE_RERANK:
+        reranker_res.start()
     print("\n🧠 数字大脑 - 高性能RAG问答系统 ⚡")
     print("✨ 新功能：性能优化、缓存、时间监控")
     print("\n命令说明:")
     print("  zhipu  - 切换到智谱AI")
     print("  ollama - 切换到Ollama本地模型")
-    print("  clear  - 清空搜索缓存")
+    print("  clear  - 清空搜索缓存和回答缓存")
+    print("  stats  - 显示各阶段耗时统计（p50/p95/p99）")
+    print(f"  /use 集合1,集合2 / /use all - 只检索指定集合（可选: {', '.join(shards.names)}）")
     print("  exit   - 退出程序")
     
     while True:
+        startup.prompt_ready()
         query = input('\n💭 请输入你的问题: ')
         if query.lower() == 'exit':
             print("👋 再见！")
@@ -243,14 +516,65 @@ if __name__ == '__main__':
             continue
         if query.lower() == 'clear':
             search_cached.cache_clear()
-            print("🗑️ 搜索缓存已清空")
+            encode_cached.cache_clear()
+            answer_cache_res.get().clear()
+            print("🗑️ 搜索缓存和回答缓存已清空")
+            continue
+        if query.lower() == 'stats':
+            print(format_stats())
+            continue
+        # Slash prefix, so questions starting with "use ..." still go to the model
+        if query.lower().startswith('/use ') or query.lower() == '/use':
+            names = [n.strip() for n in query[5:].split(',') if n.strip()]
+            try:
+                collections = None if names == ['all'] else [s.name for s in shards.select(names)]
+            except ValueError as e:
+                print(f"⚠️  {e}")
+                continue
+            print(f"✅ 检索范围: {', '.join(collections) if collections else '全部集合'}")
             continue
             
         if query.strip():
+            reloaded = refresh_index()
+            if reloaded:
+                print(f"🔄 索引已更新: {', '.join(reloaded)}")
             total_start = time.time()
             print('\n🚀 开始处理...')
-            answer = rag_ask(query, use_zhipu=use_zhipu)
+            with trace('ask', backend=backend_name(use_zhipu)):
+                rag_ask(query, use_zhipu=use_zhipu, use_cache=use_cache, collections=collections)  # 回答在生成过程中逐字输出
             total_time = time.time() - total_start
-            print(f'\n📝 【任老师的回答】\n{answer}\n')
-            print(f"⚡ 总耗时: {total_time:.2f}s")
-            print("-" * 50)
\ No newline at end of file
+            print(f"\n⚡ 总耗时: {total_time:.2f}s")
+            startup.answered()
+            print("-" * 50)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="数字大脑 RAG 问答（默认交互模式）")
+    parser.add_argument('--batch', metavar='QUESTIONS', help="批量模式：问题列表文件，每行一个问题")
+    parser.add_argument('--out', default='answers.jsonl', help="批量模式输出的 JSONL 文件")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--answer', action='store_true', help="批量模式下同时调用大模型生成回答")
+    parser.add_argument('--zhipu', action='store_true', help="使用智谱AI（默认 Ollama）")
+    parser.add_argument('--concurrency', type=int, default=LLM_CONCURRENCY, help="批量模式同时进行的大模型请求数")
+    parser.add_argument('--no-answer-cache', action='store_true', help="不使用回答缓存，总是调用大模型")
+    parser.add_argument('--collections', help="只检索这些集合，逗号分隔（默认全部）")
+    parser.add_argument('--trace', metavar='FILE', help="把各阶段耗时（span）追加写入 JSONL 文件")
+    parser.add_argument('--profile', metavar='FILE', help="用 cProfile 运行并把结果写入 FILE（.prof）")
+    args = parser.parse_args()
+    if args.trace:
+        enable_trace(args.trace)
+    check_index_compatibility(shards.manifest_paths)
+    collections = None
+    if args.collections:
+        try:
+            collections = [s.name for s in shards.select([n.strip() for n in args.collections.split(',')])]
+        except ValueError as e:
+            parser.error(str(e))
+    with profiled(args.profile):
+        if args.batch:
+            with trace('batch'):
+                run_batch(args.batch, args.out, args.top_k, answer=args.answer, use_zhipu=args.zhipu,
+                          concurrency=args.concurrency, use_cache=not args.no_answer_cache, collections=collections)
+            print(format_stats())
+        else:
+            repl(use_zhipu=args.zhipu, use_cache=not args.no_answer_cache, collections=collections)
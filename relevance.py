@@ -0,0 +1,81 @@
+"""Relevance thresholds that follow the index's score metric.
+
+The index is an inner-product index over normalized vectors, so its scores
+are cosine similarities (higher = more similar). The metric is recorded in
+md_faiss_params.json. Thresholds are read from the same file when
+calibrate_thresholds.py has fitted them to the corpus, otherwise the
+defaults below are used. Legacy L2 indexes (lower = more similar) keep the
+original distance cut-offs.
+"""
+import json
+import os
+
+from brain_config import INDEX_PARAMS_PATH
+
+HIGHER_IS_BETTER = {'cosine': True, 'ip': True, 'l2': False}
+
+# excellent: 高质量匹配；good: 高相关 🟢；fair: 中等相关 🟡；更差为低相关 🔴
+DEFAULT_THRESHOLDS = {
+    # bge-large-zh cosine scores sit in a narrow, high band; calibrate for your own corpus
+    'cosine': {'excellent': 0.80, 'good': 0.70, 'fair': 0.60},
+    'ip': {'excellent': 0.80, 'good': 0.70, 'fair': 0.60},
+    'l2': {'excellent': 5.0, 'good': 8.0, 'fair': 12.0},
+}
+LEVELS = ('excellent', 'good', 'fair')
+INDICATORS = {'excellent': "🟢", 'good': "🟢", 'fair': "🟡", 'poor': "🔴"}
+# 最佳片段只达到该等级时，送入提示词的片段数上限
+CONTEXT_LIMITS = {'fair': 6, 'poor': 3}
+
+
+class Relevance:
+    def __init__(self, metric='cosine', thresholds=None):
+        if metric not in HIGHER_IS_BETTER:
+            raise ValueError(f"Unknown score metric {metric!r}")
+        self.metric = metric
+        self.higher_is_better = HIGHER_IS_BETTER[metric]
+        self.thresholds = dict(DEFAULT_THRESHOLDS[metric], **(thresholds or {}))
+
+    def better(self, a, b):
+        """True if score a is at least as relevant as score b."""
+        return a >= b if self.higher_is_better else a <= b
+
+    def best(self, scores):
+        scores = [s for s in scores if s is not None]
+        if not scores:
+            return None
+        return max(scores) if self.higher_is_better else min(scores)
+
+    def worst(self, scores):
+        scores = [s for s in scores if s is not None]
+        if not scores:
+            return None
+        return min(scores) if self.higher_is_better else max(scores)
+
+    def level(self, score):
+        for name in LEVELS:
+            if self.better(score, self.thresholds[name]):
+                return name
+        return 'poor'
+
+    def indicator(self, score):
+        return INDICATORS[self.level(score)]
+
+    def context_limit(self, best_score, n):
+        """How many passages to send to the LLM, given the best score among them."""
+        if best_score is None:
+            return n
+        return min(n, CONTEXT_LIMITS.get(self.level(best_score), n))
+
+    def describe(self):
+        if self.metric == 'l2':
+            return "L2距离，越小越相似"
+        return "余弦相似度，越大越相似" if self.metric == 'cosine' else "内积，越大越相似"
+
+
+def load_relevance(params_path=INDEX_PARAMS_PATH):
+    """Relevance for the current index: metric and (calibrated) thresholds from its params file."""
+    params = {}
+    if os.path.exists(params_path):  # read directly so the REPLs do not import faiss at startup
+        with open(params_path, 'r', encoding='utf-8') as f:
+            params = json.load(f)
+    return Relevance(params.get('metric', 'cosine'), params.get('thresholds'))
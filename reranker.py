@@ -0,0 +1,59 @@
+"""Optional cross-encoder rerank stage between retrieval and the LLM prompt.
+
+A wider candidate set is retrieved cheaply, then (query, passage) pairs are
+scored by a local cross-encoder (e.g. bge-reranker-base) in small CPU
+batches, best-ranked candidates first. Only the best RERANK_TOP_N passages
+go into the prompt. Scoring stops as soon as the remaining candidates,
+timed at the slowest batch so far, would not fit the millisecond budget,
+and the retrieval order is then kept as is, so a slow machine never waits
+longer than the budget for a better order.
+"""
+import time
+
+from brain_config import RERANK_MODEL_DIR
+
+# 送入重排的候选片段数，以及重排后保留的片段数
+RERANK_CANDIDATES = 30
+RERANK_TOP_N = 6
+# 重排时间预算（毫秒），超时则保持检索原顺序
+RERANK_BUDGET_MS = 400
+RERANK_BATCH_SIZE = 8
+# Passages are truncated to this many tokens by the cross-encoder
+RERANK_MAX_LENGTH = 512
+
+
+def load_reranker(model_dir=RERANK_MODEL_DIR):
+    """Load a CrossEncoder on CPU and run one tiny prediction so the first rerank is not slow."""
+    from sentence_transformers import CrossEncoder
+    model = CrossEncoder(model_dir, max_length=RERANK_MAX_LENGTH, device='cpu')
+    model.predict([("预热", "warmup")], show_progress_bar=False)
+    return model
+
+
+def rerank(model, query, docs, top_n=RERANK_TOP_N, budget_ms=RERANK_BUDGET_MS, batch_size=RERANK_BATCH_SIZE):
+    """Reorder docs by cross-encoder score and keep the best top_n.
+
+    Returns (docs, info); info has 'status' ('ok' or 'timeout'), 'ms' and
+    'scored'. When the budget runs out before every candidate is scored, the
+    candidates are returned unchanged and the caller keeps its own cut-off.
+    """
+    start = time.time()
+    deadline = start + budget_ms / 1000
+    scores = []
+    per_pair = 0.0  # slowest seconds per pair seen so far
+    for i in range(0, len(docs), batch_size):
+        now = time.time()
+        # Partial scores are of no use, so give up as soon as the rest cannot finish in time
+        if now + per_pair * (len(docs) - i) > deadline:
+            break
+        pairs = [(query, d['content']) for d in docs[i:i + batch_size]]
+        scores.extend(float(s) for s in model.predict(pairs, batch_size=batch_size, show_progress_bar=False))
+        per_pair = max(per_pair, (time.time() - now) / len(pairs))
+    elapsed_ms = (time.time() - start) * 1000
+    info = {'ms': elapsed_ms, 'scored': len(scores)}
+    if len(scores) < len(docs):
+        info['status'] = 'timeout'
+        return docs, info
+    info['status'] = 'ok'
+    ranked = sorted((dict(d, rerank=s) for d, s in zip(docs, scores)), key=lambda d: -d['rerank'])
+    return ranked[:top_n], info
@@ -0,0 +1,181 @@
+"""Corpus scanner shared by the indexer, the watcher and the verification scripts.
+
+Walks the scan roots with os.scandir, listing directories in parallel
+threads (SCAN_WORKERS; on network drives most of the time is spent
+waiting for the server), and returns the files with an indexable
+extension (compared case-insensitively, so .PDF counts as .pdf).
+
+Paths matching SCAN_EXCLUDE are skipped and, if SCAN_INCLUDE is set, only
+files matching one of its globs are kept. Globs are matched against the
+file or folder name and against the path relative to the scan root
+('/'-separated); a trailing '/' makes a pattern match folders only, which
+are then not entered at all:
+
+    SCAN_EXCLUDE = ['.obsidian/', '.trash/', 'Templates/', '*.excalidraw.md']
+
+With a snapshot file (one per collection, see shards.py) the listing of
+every directory is remembered together with the directory's mtime. Adding,
+removing or renaming an entry changes that mtime, so on the next scan
+directories whose mtime is unchanged are not listed again; only their own
+mtime is read. Directories modified within SNAPSHOT_RACY_SECONDS of the
+previous scan are always listed, in case an entry was added within the
+same mtime tick.
+"""
+import fnmatch
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from brain_config import SCAN_EXCLUDE, SCAN_INCLUDE
+
+SCAN_EXTENSIONS = ('.md', '.pdf', '.pptx')
+# 并行列目录的线程数（网络盘上主要是等待延迟，可调大）
+SCAN_WORKERS = 8
+# 目录 mtime 距上次扫描不到这么多秒时不信任快照，重新列出（mtime 精度有限，如 FAT 为 2 秒）
+SNAPSHOT_RACY_SECONDS = 2.0
+SNAPSHOT_VERSION = 1
+
+
+def _matches(name, rel, patterns):
+    return any(fnmatch.fnmatch(name, p) or fnmatch.fnmatch(rel, p) for p in patterns)
+
+
+def excluded_dir(name, rel, exclude=SCAN_EXCLUDE):
+    return _matches(name, rel, [p.rstrip('/') for p in exclude if p.endswith('/')])
+
+
+def excluded_file(name, rel, exclude=SCAN_EXCLUDE):
+    return _matches(name, rel, [p for p in exclude if not p.endswith('/')])
+
+
+def load_snapshot(path, exclude=SCAN_EXCLUDE):
+    """The directory listings of the previous scan, or None (missing, older format or other excludes)."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Error reading scan snapshot {path}: {e}")
+        return None
+    if snapshot.get('version') != SNAPSHOT_VERSION or snapshot.get('exclude') != list(exclude):
+        return None
+    return snapshot
+
+
+def save_snapshot(snapshot, path):
+    """Write the snapshot atomically (tmp file + rename)."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # The indexer and the watcher may save the same snapshot concurrently: unique tmp name per process
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _list_dir(path, rel, cached, trusted_before_ns, exclude, want_stat):
+    """(listing, {file name: (mtime_ns, size)}) of one directory, or None if it cannot be read.
+
+    The listing is {'mtime_ns', 'dirs', 'files'} with excluded entries left out.
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    stats = {}
+    if cached is not None and cached['mtime_ns'] == mtime_ns and mtime_ns < trusted_before_ns:
+        listing = cached
+        if want_stat:
+            for name in listing['files']:
+                try:
+                    st = os.stat(os.path.join(path, name))
+                except OSError:
+                    continue  # deleted since; the directory mtime shows it next time
+                stats[name] = (st.st_mtime_ns, st.st_size)
+        return listing, stats
+    dirs, files = [], []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                entry_rel = f"{rel}/{entry.name}" if rel else entry.name
+                try:
+                    is_dir = entry.is_dir()
+                    # Like os.walk: symlinked folders are not entered
+                    if is_dir and entry.is_symlink():
+                        continue
+                    if is_dir:
+                        if not excluded_dir(entry.name, entry_rel, exclude):
+                            dirs.append(entry.name)
+                    elif not excluded_file(entry.name, entry_rel, exclude):
+                        files.append(entry.name)
+                        if want_stat:
+                            st = entry.stat()  # free on Windows: scandir already returned it
+                            stats[entry.name] = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    continue
+    except OSError:
+        return None
+    return {'mtime_ns': mtime_ns, 'dirs': sorted(dirs), 'files': sorted(files)}, stats
+
+
+def scan(roots, extensions=SCAN_EXTENSIONS, exclude=SCAN_EXCLUDE, include=SCAN_INCLUDE,
+         snapshot_path=None, want_stat=False, workers=SCAN_WORKERS):
+    """{path: (mtime_ns, size) or None} of the matching files under the roots.
+
+    Stats are only read with want_stat=True. With snapshot_path, unchanged
+    directories are not listed again and the snapshot is updated.
+    """
+    extensions = tuple(e.lower() for e in extensions)
+    previous = load_snapshot(snapshot_path, exclude)
+    cached_dirs = previous['dirs'] if previous else {}
+    trusted_before_ns = int((previous['time'] - SNAPSHOT_RACY_SECONDS) * 1e9) if previous else 0
+    started = time.time()
+    listings, found = {}, {}
+    relisted = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(path, rel):
+            future = pool.submit(_list_dir, path, rel, cached_dirs.get(path), trusted_before_ns, exclude, want_stat)
+            pending[future] = (path, rel)
+
+        pending = {}
+        for root in roots:
+            submit(root, '')
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, rel = pending.pop(future)
+                result = future.result()
+                if result is None:
+                    continue
+                listing, stats = result
+                listings[path] = listing
+                relisted += listing is not cached_dirs.get(path)
+                for name in listing['files']:
+                    if not name.lower().endswith(extensions):
+                        continue
+                    if include and not _matches(name, f"{rel}/{name}" if rel else name, include):
+                        continue
+                    if want_stat and name not in stats:
+                        continue
+                    found[os.path.join(path, name)] = stats.get(name)
+                for name in listing['dirs']:
+                    submit(os.path.join(path, name), f"{rel}/{name}" if rel else name)
+    # Also saved when nothing changed but directories were listed, to move the racy window forward
+    if snapshot_path and (previous is None or relisted or listings.keys() != cached_dirs.keys()):
+        try:
+            save_snapshot({'version': SNAPSHOT_VERSION, 'exclude': list(exclude), 'time': started,
+                           'dirs': listings}, snapshot_path)
+        except OSError as e:
+            print(f"Error writing scan snapshot {snapshot_path}: {e}")
+    return found
+
+
+def scan_paths(roots, extensions=SCAN_EXTENSIONS, snapshot_path=None, **options):
+    """Sorted paths of the matching files under the roots."""
+    return sorted(scan(roots, extensions, snapshot_path=snapshot_path, **options))
+
+
+def scan_stats(roots, extensions=SCAN_EXTENSIONS, snapshot_path=None, **options):
+    """{path: (mtime_ns, size)} of the matching files under the roots."""
+    return scan(roots, extensions, snapshot_path=snapshot_path, want_stat=True, **options)
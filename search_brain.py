@@ -1,26 +1,27 @@
-import os
-import json
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-# Load the local paraphrase-multilingual-MiniLM-L12-v2 model for better Chinese support
-model = SentenceTransformer(os.path.join(os.path.dirname(__file__), 'models', 'paraphrase-multilingual-MiniLM-L12-v2'))
+from brain_loader import load_index_model, check_index_compatibility
+from shards import ShardSet
 
-# Load FAISS index and metadata
-index = faiss.read_index(os.path.join(os.path.dirname(__file__), 'md_faiss.index'))
-with open(os.path.join(os.path.dirname(__file__), 'md_faiss_meta.json'), 'r', encoding='utf-8') as f:
-    meta = json.load(f)
+# One FAISS index per collection; metadata rows are fetched per query from the shards' SQLite stores
+shards = ShardSet()
+
+# Load the embedding model that built the index (recorded in md_faiss_manifest.json)
+check_index_compatibility(shards.manifest_paths)
+model = load_index_model(warmup=False, manifest_path=shards.manifest_paths[0])
 
 def search(query, top_k=5):
-    query_vec = model.encode([query])
-    D, I = index.search(np.array(query_vec).astype('float32'), top_k)
+    query_vec = model.encode([query], normalize_embeddings=True)
+    D, I = shards.search(np.array(query_vec).astype('float32'), top_k)
+    rows = shards.get_many(I[0])
     results = []
     for idx, score in zip(I[0], D[0]):
+        if int(idx) not in rows:
+            continue
         results.append({
             'score': float(score),
-            'path': meta[idx]['path'],
-            'content': meta[idx]['content'][:500]  # Show first 500 chars
+            'path': rows[int(idx)]['path'],
+            'content': rows[int(idx)]['content'][:500]  # Show first 500 chars
         })
     return results
 
@@ -0,0 +1,399 @@
+"""Collections: one index shard per scan root (or per configured group of roots).
+
+Every shard lives in SHARDS_DIR/<name>/ with its own FAISS index, params,
+metadata store, BM25 index, file manifest and index manifest, so it can be
+rebuilt on its own (embed_and_index.py --collection NAME) and queried on its
+own. Vector IDs are allocated from a range derived from the shard's name
+(id_base), which keeps them unique across shards: fusion, reranking and the
+answer cache keep working on plain vector IDs.
+
+Index, params, metadata store, BM25 index and manifests are written
+together as a generation (SHARDS_DIR/<name>/gen-000042/); the CURRENT file
+names the published one and is replaced atomically once a generation is
+complete. A search process loads all stores of one generation and swaps to
+the next one as a whole (ShardSet.refresh), so it never pairs an index
+with the metadata of another build. Replacing the pointer instead of the
+SQLite files also works on Windows, where open files cannot be replaced.
+
+ShardSet fans a search out over the selected shards in parallel threads
+(FAISS releases the GIL) and merges the per-shard top-k lists by score.
+An index built before collections existed (md_faiss.index in the repo
+folder) is served as a single shard named 'all' until shards are built.
+"""
+import os
+import shutil
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from brain_config import (SCAN_ROOTS, COLLECTIONS, SHARDS_DIR, BASE_DIR, INDEX_PATH, INDEX_PARAMS_PATH, META_PATH,
+                          LEXICAL_PATH, FILES_MANIFEST_PATH, INDEX_MANIFEST_PATH)
+from tracing import span
+
+# Low bits of a vector ID count chunks inside a shard, the bits above them identify the shard.
+# 13 + 40 bits keep IDs below 2**53, so JSON clients that parse numbers as doubles read them exactly.
+LOCAL_ID_BITS = 40
+SHARD_ID_BITS = 13
+LEGACY_NAME = 'all'
+# File in a shard folder naming its published generation folder
+CURRENT_FILE = 'CURRENT'
+GENERATION_PREFIX = 'gen-'
+# Files of a generation: the single-index file names, in the generation folder
+GENERATION_FILES = (INDEX_PATH, INDEX_PARAMS_PATH, META_PATH, LEXICAL_PATH, FILES_MANIFEST_PATH, INDEX_MANIFEST_PATH)
+
+
+def id_base(name):
+    """First vector ID of a shard; derived from its name so it survives reordering COLLECTIONS."""
+    return (zlib.crc32(name.encode('utf-8')) % (2 ** SHARD_ID_BITS - 1) + 1) << LOCAL_ID_BITS
+
+
+def shard_key(vec_id):
+    return int(vec_id) >> LOCAL_ID_BITS
+
+
+class Shard:
+    def __init__(self, name, roots, directory, base, generation=None):
+        self.name = name
+        self.roots = list(roots)
+        self.directory = directory
+        self.id_base = base
+        # None follows CURRENT; ShardSet pins the generation it loaded ('' = files directly in the folder)
+        self.generation = generation
+        self.current_path = os.path.join(directory, CURRENT_FILE)
+        # Directory listings of the last scan of the roots, see scanner.py
+        self.scan_path = os.path.join(directory, 'scan_snapshot.json')
+
+    def current_generation(self):
+        """Folder name of the published generation; '' for an index written before generations existed."""
+        try:
+            with open(self.current_path, 'r', encoding='utf-8') as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ''
+
+    def at(self, generation):
+        """This shard pinned to one generation."""
+        return Shard(self.name, self.roots, self.directory, self.id_base, generation)
+
+    def _file(self, path):
+        generation = self.current_generation() if self.generation is None else self.generation
+        return os.path.join(self.directory, generation, os.path.basename(path))
+
+    # Same file names as the single-index layout, one set per generation
+    @property
+    def index_path(self):
+        return self._file(INDEX_PATH)
+
+    @property
+    def params_path(self):
+        return self._file(INDEX_PARAMS_PATH)
+
+    @property
+    def meta_path(self):
+        return self._file(META_PATH)
+
+    @property
+    def lexical_path(self):
+        return self._file(LEXICAL_PATH)
+
+    @property
+    def files_path(self):
+        return self._file(FILES_MANIFEST_PATH)
+
+    @property
+    def manifest_path(self):
+        return self._file(INDEX_MANIFEST_PATH)
+
+    @property
+    def built(self):
+        return os.path.exists(self.index_path) and os.path.exists(self.meta_path)
+
+    def generations(self):
+        """Names of the generation folders, oldest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        numbered = [n for n in names if n.startswith(GENERATION_PREFIX) and n[len(GENERATION_PREFIX):].isdigit()]
+        return sorted(numbered, key=lambda n: int(n[len(GENERATION_PREFIX):]))
+
+    def new_generation(self):
+        """Create the folder of the next generation; it is not searched until publish()."""
+        numbers = [int(n[len(GENERATION_PREFIX):]) for n in self.generations()]
+        generation = f"{GENERATION_PREFIX}{max(numbers, default=0) + 1:06d}"
+        os.makedirs(os.path.join(self.directory, generation))
+        return generation
+
+    def publish(self, generation):
+        """Make a complete generation the current one, then delete older ones.
+
+        The previous generation is kept for search processes that have not
+        swapped it out yet; older ones and those of interrupted runs go. Files
+        still open elsewhere (Windows) are left for the next publish.
+        """
+        previous = self.current_generation()
+        tmp_path = f"{self.current_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(generation)
+        os.replace(tmp_path, self.current_path)
+        for old in self.generations():
+            if old not in (generation, previous):
+                shutil.rmtree(os.path.join(self.directory, old), ignore_errors=True)
+        if previous:
+            # Files of an index written before generations existed
+            for path in GENERATION_FILES:
+                try:
+                    os.remove(os.path.join(self.directory, os.path.basename(path)))
+                except OSError:
+                    pass
+
+    def __repr__(self):
+        return f"Shard({self.name!r}, {len(self.roots)} roots)"
+
+
+def configured_shards(collections=COLLECTIONS, roots=SCAN_ROOTS):
+    """Shards from COLLECTIONS ({name: root or [roots]}), or one per scan root named after its folder."""
+    if collections is None:
+        collections = {}
+        for root in roots:
+            name = os.path.basename(os.path.normpath(root)) or 'root'
+            unique, n = name, 2
+            while unique in collections:
+                unique, n = f"{name}-{n}", n + 1
+            collections[unique] = [root]
+    shards, bases = [], {}
+    for name, shard_roots in collections.items():
+        if isinstance(shard_roots, str):
+            shard_roots = [shard_roots]
+        base = id_base(name)
+        if base in bases:
+            raise ValueError(f"Collections {bases[base]!r} and {name!r} map to the same ID range; rename one of them")
+        bases[base] = name
+        shards.append(Shard(name, shard_roots, os.path.join(SHARDS_DIR, name), base))
+    return shards
+
+
+def legacy_shard():
+    """The pre-collections index in the repo folder; its IDs start at 0."""
+    return Shard(LEGACY_NAME, SCAN_ROOTS, BASE_DIR, 0)
+
+
+def select_shards(names=None, shards=None):
+    """Configured shards, optionally only the named ones (unknown names raise ValueError)."""
+    shards = configured_shards() if shards is None else shards
+    if not names:
+        return shards
+    by_name = {s.name: s for s in shards}
+    unknown = [n for n in names if n not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown collection(s): {', '.join(unknown)}; available: {', '.join(by_name)}")
+    return [by_name[n] for n in names]
+
+
+def searchable_shards():
+    """Built shards; falls back to the legacy single index when no shard has been built yet."""
+    shards = configured_shards()
+    built = [s for s in shards if s.built]
+    if built:
+        return built
+    legacy = legacy_shard()
+    if legacy.built:
+        return [legacy]
+    return shards  # nothing built: loading reports the missing index
+
+
+def shards_in(directory):
+    """Shards stored under another folder, e.g. a copy of shards/ or of a single-index repo folder."""
+    if os.path.exists(os.path.join(directory, os.path.basename(INDEX_PATH))):
+        return [Shard(LEGACY_NAME, SCAN_ROOTS, directory, 0)]
+    if os.path.exists(os.path.join(directory, CURRENT_FILE)):
+        name = os.path.basename(os.path.normpath(directory))  # a single collection folder
+        return [Shard(name, [], directory, id_base(name))]
+    found = []
+    for name in sorted(os.listdir(directory)):
+        shard = Shard(name, [], os.path.join(directory, name), id_base(name))
+        if shard.built:
+            found.append(shard)
+    if not found:
+        raise FileNotFoundError(f"No index found in {directory}")
+    return found
+
+
+def _open_lexical(shard):
+    from lexical_index import LexicalIndex
+    try:
+        return LexicalIndex(shard.lexical_path, readonly=True)
+    except FileNotFoundError:
+        print(f"⚠️  集合 {shard.name} 未找到关键词索引，仅使用向量检索（重新运行 embed_and_index.py 即可生成）")
+        return None
+
+
+def _open_index(shard):
+    from brain_loader import load_index
+    if not os.path.exists(shard.index_path):
+        raise FileNotFoundError(f"Index of collection {shard.name!r} not found: {shard.index_path} "
+                                f"(run embed_and_index.py first)")
+    return load_index(shard.index_path, params_path=shard.params_path, manifest_path=shard.manifest_path)
+
+
+def _open_meta(shard):
+    from meta_store import MetaStore
+    return MetaStore(shard.meta_path, readonly=True)
+
+
+class ShardSet:
+    """The searchable shards with lazily loaded index, metadata and BM25 index per shard."""
+
+    def __init__(self, shards=None):
+        # Without an explicit list, refresh() also picks up collections built after startup
+        self._discover = shards is None
+        shards = searchable_shards() if shards is None else shards
+        self.shards = [self._pin(s, len(shards) > 1) for s in shards]
+        self._by_key = {shard_key(s.id_base): s for s in self.shards}
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(self.shards)), thread_name_prefix='shard')
+
+    @staticmethod
+    def _pin(shard, labelled):
+        """The shard pinned to its current generation, with that generation's stores as lazy resources."""
+        from brain_loader import LazyResource
+        s = shard.at(shard.current_generation())
+        suffix = f" [{s.name}]" if labelled else ""
+        s.index_res = LazyResource('FAISS index' + suffix, lambda: _open_index(s))
+        s.meta_res = LazyResource('metadata' + suffix, lambda: _open_meta(s))
+        s.lexical_res = LazyResource('lexical index' + suffix, lambda: _open_lexical(s))
+        return s
+
+    @property
+    def names(self):
+        return [s.name for s in self.shards]
+
+    @property
+    def manifest_paths(self):
+        return [s.manifest_path for s in self.shards]
+
+    @property
+    def params_path(self):
+        """Params of the first shard: all shards share model, metric and calibrated thresholds."""
+        return self.shards[0].params_path
+
+    def index_resources(self):
+        return [s.index_res for s in self.shards]
+
+    def meta_resources(self):
+        return [s.meta_res for s in self.shards]
+
+    def lexical_resources(self):
+        return [s.lexical_res for s in self.shards]
+
+    def refresh(self):
+        """Swap in shards that embed_and_index.py or watch_index.py published a new generation of.
+
+        Index, metadata and BM25 index of the new generation are all loaded
+        alongside the old ones, then the shard is swapped as a whole, so
+        searches running meanwhile keep using the old generation. This also
+        applies to shards whose stores have not all been loaded yet: they are
+        pinned to the new generation too, since publish() deletes older ones
+        and a later lazy load would find its folder gone. Collections built
+        since the last call are added. Returns the names of the reloaded,
+        added and dropped shards.
+        """
+        loaded = {s.name: s for s in self.shards}
+        candidates = searchable_shards() if self._discover else self.shards
+        shards, changed = [], []
+        for shard in candidates:
+            old = loaded.pop(shard.name, None)
+            if old is not None and shard.current_generation() == old.generation:
+                shards.append(old)
+                continue
+            new = self._pin(shard, len(candidates) > 1)
+            try:
+                for res in (new.index_res, new.meta_res, new.lexical_res):
+                    res.get()
+            except Exception as e:
+                print(f"⚠️  集合 {shard.name} 重新加载失败，继续使用旧索引: {type(e).__name__}: {e}")
+                if old is not None:
+                    shards.append(old)
+                continue
+            shards.append(new)
+            changed.append(shard.name)
+        changed += list(loaded)  # no longer searchable, e.g. the legacy index once shards are built
+        if changed:
+            self._by_key = {shard_key(s.id_base): s for s in shards}
+            self.shards = shards
+        return changed
+
+    def select(self, collections=None):
+        return select_shards(collections, self.shards)
+
+    def collection_of(self, vec_id):
+        shard = self._by_key.get(shard_key(vec_id))
+        return shard.name if shard is not None else None
+
+    def _fan_out(self, fn, shards):
+        """fn(shard) for every shard, in parallel threads when there is more than one."""
+        if len(shards) == 1:
+            return [fn(shards[0])]
+        return list(self.executor.map(fn, shards))
+
+    def search(self, query_vecs, k, collections=None):
+        """Top-k (D, I) over the selected shards, merged by score (higher is better)."""
+        query_vecs = np.ascontiguousarray(query_vecs, dtype='float32')
+        selected = self.select(collections)
+        with span('faiss_search', queries=len(query_vecs), k=k, shards=len(selected)):
+            parts = self._fan_out(lambda s: s.index_res.get().search(query_vecs, k), selected)
+        if len(parts) == 1:
+            return parts[0]
+        D = np.concatenate([d for d, _ in parts], axis=1)
+        I = np.concatenate([i for _, i in parts], axis=1)
+        D = np.where(I >= 0, D, -np.inf)  # padding of shards with fewer than k vectors sorts last
+        order = np.argsort(-D, axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+    def lexical_search(self, query, k, collections=None):
+        """BM25 hits [(id, score)] over the selected shards, best first; None when no shard has a lexical index.
+
+        Each shard scores with its own IDF and document lengths, so raw scores
+        are not comparable across shards; the per-shard rankings are merged by
+        reciprocal rank instead. The scores returned are the shard's own.
+        """
+        from lexical_index import rrf_fuse
+        shards = [s for s in self.select(collections) if s.lexical_res.get() is not None]
+        if not shards:
+            return None
+        with span('bm25_search', k=k, shards=len(shards)):
+            parts = self._fan_out(lambda s: s.lexical_res.get().search(query, k), shards)
+        scores = {vec_id: score for part in parts for vec_id, score in part}
+        return [(vec_id, scores[vec_id]) for vec_id, _ in rrf_fuse([[i for i, _ in part] for part in parts])[:k]]
+
+    def has_lexical(self, collections=None):
+        return any(s.lexical_res.get() is not None for s in self.select(collections))
+
+    def _group(self, ids):
+        groups = {}
+        for i in ids:
+            i = int(i)
+            shard = self._by_key.get(shard_key(i)) if i >= 0 else None
+            if shard is not None:
+                groups.setdefault(shard, []).append(i)
+        return groups
+
+    def get_many(self, ids):
+        """{id: entry} from the metadata stores of the shards the IDs belong to."""
+        rows = {}
+        with span('metadata') as attrs:
+            for shard, shard_ids in self._group(ids).items():
+                rows.update(shard.meta_res.get().get_many(shard_ids))
+            attrs['rows'] = len(rows)
+        return rows
+
+    def score_ids(self, query_vec, ids):
+        from index_factory import score_ids
+        scores = {}
+        with span('score_ids', ids=len(ids)):
+            for shard, shard_ids in self._group(ids).items():
+                scores.update(score_ids(shard.index_res.get(), query_vec, shard_ids))
+        return scores
+
+    def ids(self, collections=None):
+        return [i for s in self.select(collections) for i in s.meta_res.get().ids()]
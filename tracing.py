@@ -0,0 +1,171 @@
+"""Lightweight spans for the RAG pipeline: where does the latency go?
+
+    with span('encode', queries=3):
+        ...
+    record('ttft', seconds)   # durations measured elsewhere
+
+Every span goes into an in-process histogram (count, mean, p50/p95/p99,
+max over the last HISTOGRAM_SAMPLES durations per span name) that the
+REPL's `stats` command and the server's /stats endpoint print. With
+enable(path) (--trace FILE) each span is also appended to a JSONL trace:
+
+    {"trace": "3f2a9c1e", "span": "faiss_search", "parent": "ask", "start": 1760000000.123, "ms": 4.2, ...}
+
+Spans opened inside trace(name) share its trace id and name it as parent
+(context variables, so this also holds inside asyncio tasks).
+
+Span names: load <resource>, encode, faiss_search, bm25_search, score_ids,
+metadata, rerank, context_build, llm, ttft, postprocess; the whole request
+is a trace named ask / search.
+
+For profiling, run the REPL or batch mode with --profile FILE.prof (cProfile,
+view with `python -m pstats` or snakeviz); py-spy can attach from outside
+(`py-spy record -o brain.svg --pid <pid>`), the span functions show up as
+ordinary frames there.
+"""
+import collections
+import contextvars
+import functools
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from brain_config import TRACE_PATH
+
+# 每个 span 名称保留最近这么多次耗时，用于计算分位数
+HISTOGRAM_SAMPLES = 2048
+PERCENTILES = (50, 95, 99)
+
+_current = contextvars.ContextVar('brain_span', default=None)  # (trace id, span name) of the enclosing span
+_lock = threading.Lock()
+_histograms = {}
+_trace_file = None
+
+
+class Histogram:
+    def __init__(self, size=HISTOGRAM_SAMPLES):
+        self.samples = collections.deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.samples.append(ms)
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        result = {'count': self.count, 'mean': round(self.total / self.count, 3), 'max': round(self.max, 3)}
+        for p in PERCENTILES:
+            result[f'p{p}'] = round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))], 3)
+        return result
+
+
+def enable(path=TRACE_PATH):
+    """Append spans to a JSONL file from now on (None: histogram only)."""
+    global _trace_file
+    with _lock:
+        if _trace_file is not None:
+            _trace_file.close()
+        _trace_file = open(path, 'a', encoding='utf-8', buffering=1) if path else None
+
+
+def record(name, seconds, start=None, **attrs):
+    """Add a duration measured elsewhere as a span of the current trace."""
+    ms = seconds * 1000
+    parent = _current.get()
+    with _lock:
+        _histograms.setdefault(name, Histogram()).add(ms)
+        if _trace_file is None:
+            return
+        entry = {'trace': parent[0] if parent else None, 'span': name, 'parent': parent[1] if parent else None,
+                 'start': round(start if start is not None else time.time() - seconds, 6), 'ms': round(ms, 3)}
+        entry.update(attrs)
+        _trace_file.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+
+
+@contextmanager
+def span(name, **attrs):
+    """Time the enclosed block as `name`; nested spans name it as their parent."""
+    parent = _current.get()
+    token = _current.set((parent[0] if parent else None, name))
+    start_wall = time.time()
+    start = time.perf_counter()
+    try:
+        yield attrs  # the block may add attributes, e.g. the number of hits
+    finally:
+        _current.reset(token)
+        record(name, time.perf_counter() - start, start_wall, **attrs)
+
+
+def traced(name):
+    """Decorator: every call of the function is a span."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def trace(name, **attrs):
+    """Root span of one request: spans inside it share a trace id."""
+    token = _current.set((uuid.uuid4().hex[:8], None))
+    try:
+        with span(name, **attrs) as span_attrs:
+            yield span_attrs
+    finally:
+        _current.reset(token)
+
+
+def stats():
+    """{span name: {count, mean, max, p50, p95, p99}} in milliseconds."""
+    with _lock:
+        return {name: h.summary() for name, h in sorted(_histograms.items())}
+
+
+def format_stats():
+    rows = stats()
+    if not rows:
+        return "暂无耗时统计（先问一个问题）"
+    width = max(len(name) for name in rows) + 2
+    lines = [f"{'span':<{width}}{'count':>7}{'mean':>10}" + ''.join(f"{'p' + str(p):>10}" for p in PERCENTILES)
+             + f"{'max':>10}   (ms)"]
+    for name, s in rows.items():
+        lines.append(f"{name:<{width}}{s['count']:>7}{s['mean']:>10.1f}"
+                     + ''.join(f"{s['p' + str(p)]:>10.1f}" for p in PERCENTILES) + f"{s['max']:>10.1f}")
+    return '\n'.join(lines)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+@contextmanager
+def profiled(path):
+    """Run the enclosed block under cProfile and write the stats to `path` (None: no profiling)."""
+    if not path:
+        yield
+        return
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"📈 性能分析已写入 {path}，耗时最多的函数:")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+
+
+if TRACE_PATH:
+    enable(TRACE_PATH)
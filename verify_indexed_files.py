@@ -1,24 +1,22 @@
 import os
 
-SCAN_ROOTS = [
-    r"F:/My Books/Working/My Own Writings Managed by Obsidian",
-    r"F:/My Books/Working/_各读书会",
-    # r"D:/Some/Other/Path"
-]
+from scanner import scan_paths
+from shards import configured_shards
 
+# Same roots, excludes and extension rules as embed_and_index.py (see SCAN_ROOTS in brain_config.py)
 md_files = []
 pdf_files = []
 pptx_files = []
-for scan_root in SCAN_ROOTS:
-    for root, dirs, files in os.walk(scan_root):
-        for file in files:
-            ext = os.path.splitext(file)[1].lower()
-            if ext == '.md':
-                md_files.append(os.path.join(root, file))
-            elif ext == '.pdf':
-                pdf_files.append(os.path.join(root, file))
-            elif ext == '.pptx':
-                pptx_files.append(os.path.join(root, file))
+for shard in configured_shards():
+    # Read-only check: no scan snapshot is read or written (it would create shards/<name>/)
+    for path in scan_paths(shard.roots, snapshot_path=None):
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.md':
+            md_files.append(path)
+        elif ext == '.pdf':
+            pdf_files.append(path)
+        elif ext == '.pptx':
+            pptx_files.append(path)
 
 print(f"Markdown files: {len(md_files)}")
 print(f"PDF files: {len(pdf_files)}")
@@ -0,0 +1,137 @@
+"""Watch the scan roots and keep the collection indexes up to date.
+
+Polls the folders of every collection for added, changed and deleted
+.md/.pdf/.pptx files. A burst of edits (Obsidian saves every few seconds
+while typing) is collected until the folder has been quiet for
+WATCH_DEBOUNCE seconds, or at most WATCH_MAX_DELAY seconds, and then
+applied in one incremental run of embed_and_index.index_shard for each
+affected collection: only the changed files are extracted and embedded.
+The embedding model stays loaded between runs.
+
+Every update is written as a new generation of the collection (index,
+metadata and BM25 index together, see shards.py). A running
+brain_server.py (or rag_brain_optimized.py REPL) notices the published
+generation and swaps all of it in without a restart.
+
+Do not run embed_and_index.py for the same collections while the watcher
+is running; both write the same files.
+
+    python watch_index.py [--collection NAME] [--interval 2] [--debounce 3]
+"""
+import argparse
+import os
+import time
+
+from brain_config import EMBED_MODEL_DIR
+from embed_and_index import chunker_settings, model_loader, index_shard
+from embed_cache import EmbeddingCache
+from extract_cache import ExtractCache
+from index_manifest import model_fingerprint
+from scanner import scan_stats
+from shards import select_shards
+
+# 轮询间隔（秒）
+WATCH_INTERVAL = 2.0
+# 最后一次改动后安静这么久才开始更新索引（合并 Obsidian 的连续保存）
+WATCH_DEBOUNCE = 3.0
+# 持续改动时，最迟在第一次改动后这么久也要更新一次
+WATCH_MAX_DELAY = 30.0
+
+
+def snapshot(shard):
+    """{path: (mtime_ns, size)} of the indexable files of a collection; unchanged folders are not listed again."""
+    return scan_stats(shard.roots, snapshot_path=shard.scan_path)
+
+
+def changed_paths(before, after):
+    return sorted(p for p in before.keys() | after.keys() if before.get(p) != after.get(p))
+
+
+class Watcher:
+    """Polls the roots of some collections and re-indexes the ones with debounced changes."""
+
+    def __init__(self, shards, interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE, max_delay=WATCH_MAX_DELAY,
+                 use_cache=True):
+        self.shards = shards
+        self.interval = interval
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.get_model = model_loader()
+        self.fingerprint = model_fingerprint(EMBED_MODEL_DIR)
+        self.chunker = chunker_settings()
+        self.cache = EmbeddingCache() if use_cache else None
+        self.extract_cache = ExtractCache()
+        self.states = {}
+        self.pending = {}  # shard name -> (first change, last change, changed paths)
+
+    def start(self):
+        """Bring every watched collection up to date, then remember the state of its files."""
+        for shard in self.shards:
+            self.states[shard.name] = snapshot(shard)
+            self.update(shard)
+
+    def poll(self):
+        now = time.time()
+        for shard in self.shards:
+            state = snapshot(shard)
+            paths = changed_paths(self.states[shard.name], state)
+            self.states[shard.name] = state
+            if paths:
+                first, _, seen = self.pending.get(shard.name, (now, now, set()))
+                self.pending[shard.name] = (first, now, seen | set(paths))
+        for shard in self.shards:
+            if shard.name not in self.pending:
+                continue
+            first, last, paths = self.pending[shard.name]
+            if now - last >= self.debounce or now - first >= self.max_delay:
+                del self.pending[shard.name]
+                names = ', '.join(os.path.basename(p) for p in sorted(paths)[:3])
+                more = f" 等{len(paths)}个文件" if len(paths) > 3 else ""
+                print(f"🔄 [{shard.name}] 检测到改动: {names}{more}")
+                self.update(shard)
+
+    def update(self, shard):
+        start = time.time()
+        try:
+            index_shard(shard, self.get_model, self.fingerprint, self.chunker, self.cache)
+            # Keep both caches within their size limits during long sessions, not only at exit
+            self.extract_cache.evict()
+            if self.cache is not None:
+                self.cache.evict()
+        except Exception as e:
+            # Keep watching; the files are picked up again with the next change or restart
+            print(f"❌ [{shard.name}] 索引更新失败: {type(e).__name__}: {e}")
+            return
+        print(f"✅ [{shard.name}] 索引已更新，用时 {time.time() - start:.1f}s")
+
+    def run(self):
+        self.start()
+        print(f"👀 正在监视 {', '.join(s.name for s in self.shards)}（每{self.interval:g}s检查一次，Ctrl+C 退出）")
+        try:
+            while True:
+                time.sleep(self.interval)
+                self.poll()
+        finally:
+            if self.cache is not None:
+                self.cache.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="监视笔记目录，改动后自动增量更新索引")
+    parser.add_argument('--collection', action='append', dest='collections', metavar='NAME',
+                        help="only watch this collection (repeatable; default: all)")
+    parser.add_argument('--interval', type=float, default=WATCH_INTERVAL, help="seconds between polls")
+    parser.add_argument('--debounce', type=float, default=WATCH_DEBOUNCE,
+                        help="seconds without further changes before a collection is re-indexed")
+    parser.add_argument('--max-delay', type=float, default=WATCH_MAX_DELAY,
+                        help="re-index at the latest this many seconds after the first change")
+    parser.add_argument('--no-cache', action='store_true', help="do not use the embedding cache")
+    args = parser.parse_args()
+    try:
+        shards = select_shards(args.collections)
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        Watcher(shards, args.interval, args.debounce, args.max_delay, use_cache=not args.no_cache).run()
+    except KeyboardInterrupt:
+        print("👋 已停止监视")